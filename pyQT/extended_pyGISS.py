@@ -1,16 +1,22 @@
-from collections import OrderedDict
+import sys
+import warnings
+from collections import defaultdict
+from itertools import count
 from inspect import stack
-from os.path import abspath, dirname, join, pardir
-from pyproj import Proj
+from os.path import abspath, dirname, exists, join, pardir, splitext
 from PyQt5.QtCore import (
                           QByteArray,
                           QDataStream,
                           QIODevice,
                           QMimeData,
+                          QModelIndex,
                           QPoint,
                           QPointF,
+                          QRectF,
                           QSize,
-                          Qt
+                          QStringListModel,
+                          Qt,
+                          QTimer
                           )
 from PyQt5.QtGui import (
                          QBrush,
@@ -18,19 +24,24 @@ from PyQt5.QtGui import (
                          QColor, 
                          QDrag, 
                          QIcon,
+                         QImage,
                          QPainter, 
+                         QPainterPath,
                          QPen,
                          QPixmap,
-                         QPolygonF
+                         QPolygonF,
+                         QTransform
                          )
 from PyQt5.QtWidgets import (
                              QAction,
                              QApplication, 
                              QComboBox,
+                             QCompleter,
                              QFileDialog,
                              QFrame,
                              QGraphicsEllipseItem,
                              QGraphicsItem,
+                             QGraphicsPathItem,
                              QGraphicsPixmapItem,
                              QGraphicsPolygonItem,
                              QGraphicsRectItem,
@@ -39,25 +50,74 @@ from PyQt5.QtWidgets import (
                              QGridLayout,
                              QGroupBox,
                              QHBoxLayout,
+                             QInputDialog,
                              QLabel,
                              QLineEdit,
                              QMainWindow,
+                             QMessageBox,
                              QPushButton, 
+                             QSlider,
                              QStyleFactory,
+                             QToolBar,
                              QWidget,  
                              )
-import shapefile
-import shapely.geometry
+import numpy as np
 import xlrd
 
+# the pygiss package (shared by both versions) is in the parent folder
+path_parent = abspath(join(dirname(abspath(stack()[0][1])), pardir))
+if path_parent not in sys.path:
+    sys.path.append(path_parent)
+
+from pygiss.backdrop import BackdropCache
+from pygiss.dbf import AttributeStore
+from pygiss.fastproj import project_rings
+from pygiss.feed import PositionFeed
+from pygiss.heatmap import HeatmapLayer
+from pygiss.labels import declutter, label_ratio
+from pygiss.layers import LayerStack, parse_zoom_range, zoom_level
+from pygiss.links import LinkLayer
+from pygiss.measure import (
+                            distance_summary, 
+                            format_distance, 
+                            path_lengths, 
+                            pairwise_distances, 
+                            shape_measures
+                            )
+from pygiss.memory import MemoryBudget, array_bytes
+from pygiss.node_store import NodeStore
+from pygiss.projections import projections
+from pygiss.scheduler import FrameScheduler, complete, slices
+from pygiss.search import SearchIndex, default_fields, feature_entries
+from pygiss.session import read_session, write_session
+from pygiss.shx import ShapeIndex
+from pygiss.tiles import TileSource, border_part, land_part
+from pygiss.tracks import Playback, format_time, read_tracks_task
+from pygiss.viewport import geographic_bbox, projected_bbox
+
+def to_qpolygon(coordinates):
+    # QPolygonF from a flat [x0, y0, x1, y1, ...] array: the coordinates are 
+    # copied in the buffer of the polygon instead of creating one QPointF 
+    # per point
+    coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+    polygon = QPolygonF(len(coordinates)//2)
+    buffer = polygon.data()
+    buffer.setsize(8*len(coordinates))
+    np.frombuffer(buffer, dtype=np.float64)[:] = coordinates
+    return polygon
+
 ## Structure of this file
 # Controller: the main window
 # View: the canvas where the map is displayed
 # Node: the Python Software foundation icon that can be created in the view
-# MainMenu: the left-side menu. Contains 3 QGroupBox
+# TrackItem: the positions of the node tracks at the playback time
+# MainMenu: the left-side menu. Contains 6 QGroupBox
 # - Node creation: create a node with the drag & drop system
+# - LinkMenu: link selected nodes, or import links from an Excel file
 # - GISParametersMenu: change the projection and the size of nodes in the view
 # - Deletion: delete selected nodes, all nodes, or the map
+# - AttributeMenu: color and filter the map by the value of a DBF field
+# - LayerMenu: add, show / hide and remove additional shapefile layers
 
 class Controller(QMainWindow):
     
@@ -87,6 +147,121 @@ class Controller(QMainWindow):
         toolbar.addAction(import_shapefile)
         toolbar.addAction(import_project)
         
+        # feature search: the results are updated at each keystroke and 
+        # displayed in a popup, and the view zooms to the chosen result
+        # (enter: the first result)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('Search')
+        self.search_edit.setMaximumWidth(300)
+        self.search_edit.textEdited.connect(self.search)
+        self.search_edit.returnPressed.connect(lambda: self.view.zoom_to_result(0))
+        self.search_results = QStringListModel(self)
+        self.search_completer = QCompleter(self.search_results, self)
+        self.search_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.search_completer.setWidget(self.search_edit)
+        self.search_completer.activated[QModelIndex].connect(self.zoom_to_result)
+        toolbar.addWidget(self.search_edit)
+        
+        save_session = QAction('Save session', self)
+        save_session.setStatusTip('Save the nodes and the map state')
+        save_session.triggered.connect(self.save_session)
+        
+        restore_session = QAction('Restore session', self)
+        restore_session.setStatusTip('Restore a saved session')
+        restore_session.triggered.connect(self.restore_session)
+        
+        open_node_store = QAction('Open node database', self)
+        open_node_store.setStatusTip('Open or create a SQLite node database')
+        open_node_store.triggered.connect(self.open_node_store)
+        
+        session_menu = self.menuBar().addMenu('Session')
+        session_menu.addAction(save_session)
+        session_menu.addAction(restore_session)
+        session_menu.addAction(open_node_store)
+        
+        start_feed = QAction('Start live feed', self)
+        start_feed.setStatusTip('Listen to node position updates on a UDP port')
+        start_feed.triggered.connect(self.start_feed)
+        
+        follow_feed_file = QAction('Follow position file', self)
+        follow_feed_file.setStatusTip('Read the position updates appended to a file')
+        follow_feed_file.triggered.connect(self.follow_feed_file)
+        
+        stop_feed = QAction('Stop live feed', self)
+        stop_feed.triggered.connect(self.stop_feed)
+        
+        feed_menu = self.menuBar().addMenu('Live feed')
+        feed_menu.addAction(start_feed)
+        feed_menu.addAction(follow_feed_file)
+        feed_menu.addAction(stop_feed)
+        
+        show_memory = QAction('Memory usage', self)
+        show_memory.setStatusTip('Memory used by each layer')
+        show_memory.triggered.connect(self.show_memory)
+        
+        set_memory_budget = QAction('Memory budget', self)
+        set_memory_budget.setStatusTip('Caches are evicted beyond the budget')
+        set_memory_budget.triggered.connect(self.set_memory_budget)
+        
+        session_menu.addAction(show_memory)
+        session_menu.addAction(set_memory_budget)
+        
+        measure_shapes = QAction('Measure shapes', self)
+        measure_shapes.setStatusTip('Geodesic area and perimeter of the shapes')
+        measure_shapes.triggered.connect(self.measure_shapes)
+        
+        measure_selection = QAction('Measure selected nodes', self)
+        measure_selection.setStatusTip('Distances between the selected nodes')
+        measure_selection.triggered.connect(self.measure_selection)
+        
+        clear_measure = QAction('Clear distance', self)
+        clear_measure.setStatusTip('Delete the path measured with shift + click')
+        clear_measure.triggered.connect(self.clear_measure)
+        
+        measure_menu = self.menuBar().addMenu('Measure')
+        measure_menu.addAction(measure_shapes)
+        measure_menu.addAction(measure_selection)
+        measure_menu.addAction(clear_measure)
+        
+        search_fields = QAction('Search fields', self)
+        search_fields.setStatusTip('Text fields of the shapefile used by the search')
+        search_fields.triggered.connect(self.set_search_fields)
+        
+        search_menu = self.menuBar().addMenu('Search')
+        search_menu.addAction(search_fields)
+        
+        # track playback: the slider is the timeline of the tracks, and the
+        # speed is the number of seconds of the tracks per second
+        import_tracks = QAction('Import tracks', self)
+        import_tracks.setStatusTip('Import node tracks (id, time, longitude, latitude)')
+        import_tracks.triggered.connect(self.import_tracks)
+        
+        play_tracks = QAction('Play / pause', self)
+        play_tracks.triggered.connect(lambda: self.view.play_tracks())
+        
+        self.track_slider = QSlider(Qt.Horizontal)
+        self.track_slider.valueChanged.connect(
+                            lambda value: self.view.seek_tracks(self.track_start + value))
+        self.track_start = 0
+        
+        self.track_speed = QComboBox()
+        self.track_speed.setEditable(True)
+        self.track_speed.addItems(('1', '10', '60', '600', '3600'))
+        self.track_speed.setCurrentText('60')
+        self.track_speed.currentTextChanged.connect(
+                                lambda speed: self.view.set_track_speed(speed))
+        
+        self.track_time = QLabel()
+        self.track_time.setMinimumWidth(150)
+        
+        playback_toolbar = QToolBar('Track playback')
+        playback_toolbar.addAction(import_tracks)
+        playback_toolbar.addAction(play_tracks)
+        playback_toolbar.addWidget(self.track_slider)
+        playback_toolbar.addWidget(self.track_speed)
+        playback_toolbar.addWidget(self.track_time)
+        self.addToolBar(Qt.BottomToolBarArea, playback_toolbar)
+        
         # paths to the icons (standard node and selected node)
         path_node = join(path_icon, 'node.png')
         path_selected_node = join(path_icon, 'selected_node.png')
@@ -121,26 +296,230 @@ class Controller(QMainWindow):
                                             )[0]
         book = xlrd.open_workbook(filepath)
         sheet = book.sheet_by_index(0)
-        for row_index in range(1, sheet.nrows):
-            x, y = self.view.to_canvas_coordinates(*sheet.row_values(row_index))
-            Node(self, QPointF(x, y))
+        # the first row contains the column names
+        longitudes, latitudes = sheet.col_values(0, 1), sheet.col_values(1, 1)
+        # with a node database, the nodes are only displayed if visible
+        if self.view.node_store:
+            self.view.node_store.insert(longitudes, latitudes)
+            self.view.page_nodes()
+            self.view.update_heatmap_points()
+        else:
+            self.view.import_nodes(longitudes, latitudes)
+            
+    def start_feed(self):
+        port, ok = QInputDialog.getInt(self, 'Live feed', 'UDP port', 5555, 1, 65535)
+        if ok:
+            self.open_feed(port=port)
+            
+    def follow_feed_file(self):
+        # the lines appended to the file are read as position updates
+        filepath = QFileDialog.getOpenFileName(self, 'Follow position file')[0]
+        if filepath:
+            self.open_feed(filepath=filepath)
+            
+    def open_feed(self, port=None, filepath=None):
+        # an exception in a slot would abort the application
+        try:
+            self.view.start_feed(port, filepath)
+        except OSError as error:
+            QMessageBox.critical(self, 'Live feed', 'The feed cannot be opened: {}'.format(error))
+            
+    def stop_feed(self):
+        self.view.stop_feed()
+        
+    def show_memory(self):
+        QMessageBox.information(self, 'Memory usage', self.view.memory.summary())
+        
+    def set_memory_budget(self):
+        budget, ok = QInputDialog.getInt(
+                                         self, 
+                                         'Memory budget', 
+                                         'Memory budget in MB (0 for none)', 
+                                         int(self.view.memory.limit/2**20), 
+                                         0
+                                         )
+        if ok:
+            self.view.memory.limit = budget*2**20
+        
+    def search(self, query):
+        labels = self.view.search(query)
+        self.search_results.setStringList(labels)
+        if labels:
+            self.search_completer.complete()
+        else:
+            self.search_completer.popup().hide()
+            
+    def zoom_to_result(self, index):
+        self.view.zoom_to_result(index.row())
+        
+    def set_search_fields(self):
+        fields, ok = QInputDialog.getText(
+                                          self, 
+                                          'Search fields', 
+                                          'Indexed fields (e.g NAME, ISO_A3)', 
+                                          QLineEdit.Normal, 
+                                          ', '.join(self.view.search_fields)
+                                          )
+        if ok:
+            self.view.index_features([field.strip() for field in fields.split(',')])
+        
+    def import_tracks(self):
+        filepath = QFileDialog.getOpenFileName(
+                                            self, 
+                                            'Import tracks', 
+                                            self.path_projects,
+                                            'Tracks (*.csv)'
+                                            )[0]
+        if not filepath:
+            return
+        self.view.import_tracks(filepath)
+        
+    def show_tracks(self, tracks):
+        self.track_start = tracks.start
+        self.track_slider.blockSignals(True)
+        self.track_slider.setRange(0, int(np.ceil(tracks.end - tracks.start)))
+        self.track_slider.blockSignals(False)
+        self.view.set_track_speed(self.track_speed.currentText())
+        self.view.draw_tracks()
+        
+    def show_track_time(self, time, dates):
+        # the slider follows the playback without seeking
+        self.track_slider.blockSignals(True)
+        self.track_slider.setValue(int(time - self.track_start))
+        self.track_slider.blockSignals(False)
+        self.track_time.setText(format_time(time, dates))
+        
+    def measure_shapes(self):
+        message = self.view.measure_shapes()
+        if message:
+            self.main_menu.attribute_groupbox.update_fields()
+            QMessageBox.information(self, 'Measure shapes', message)
+            
+    def measure_selection(self):
+        message = self.view.measure_selection()
+        if message:
+            QMessageBox.information(self, 'Measure selected nodes', message)
+        
+    def clear_measure(self):
+        self.view.clear_measure()
+        
+    def open_node_store(self):
+        filepath = QFileDialog.getSaveFileName(
+                                            self, 
+                                            'Open or create a node database', 
+                                            self.path_projects,
+                                            'Node database (*.sqlite)',
+                                            options = QFileDialog.DontConfirmOverwrite
+                                            )[0]
+        if not filepath:
+            return
+        self.view.open_node_store(filepath)
+        
+    def save_session(self):
+        filepath = QFileDialog.getSaveFileName(
+                                            self, 
+                                            'Save session', 
+                                            self.path_projects,
+                                            'Session (*.npz)'
+                                            )[0]
+        if not filepath:
+            return
+        nodes = list(self.view.nodes)
+        center = self.view.mapToScene(self.view.viewport().rect().center())
+        write_session(
+                      filepath,
+                      [node.longitude for node in nodes],
+                      [node.latitude for node in nodes],
+                      [node.isSelected() for node in nodes],
+                      self.view.proj,
+                      self.view.ratio,
+                      self.view.offset,
+                      self.view.shapefile,
+                      'pyqt',
+                      # zoom level and center of the view
+                      (self.view.transform().m11(), center.x(), center.y())
+                      )
+                      
+    def restore_session(self):
+        filepath = QFileDialog.getOpenFileName(
+                                            self, 
+                                            'Restore session', 
+                                            self.path_projects,
+                                            'Session (*.npz)'
+                                            )[0]
+        if not filepath:
+            return
+        try:
+            session = read_session(filepath)
+        except (OSError, ValueError) as error:
+            QMessageBox.critical(
+                                 self, 
+                                 'Restore session', 
+                                 'The session cannot be read: {}'.format(error)
+                                 )
+            return
+        self.view.delete_all_nodes()
+        # a session saved by the tkinter version may use a projection that 
+        # this version does not have: the current projection is kept
+        if session['projection'] in self.view.projections:
+            self.view.proj = session['projection']
+        else:
+            warnings.warn('unknown projection: ' + session['projection'])
+        self.view.ratio, self.view.offset = session['ratio'], session['offset']
+        # the next redraw from the menu keeps the restored parameters
+        gis_menu = self.main_menu.map_projection_groupbox
+        gis_menu.projection_list.setCurrentText(self.view.proj)
+        gis_menu.ratio_edit.setText('{:g}'.format(1/self.view.ratio))
+        if session['shapefile']:
+            try:
+                if not exists(session['shapefile']):
+                    raise OSError('{} not found'.format(session['shapefile']))
+                self.view.shapefile = session['shapefile']
+                self.view.load_shapefile()
+            except (OSError, ValueError, IndexError) as error:
+                # the nodes are restored without the map
+                QMessageBox.critical(
+                                     self, 
+                                     'Restore session', 
+                                     'The map cannot be loaded: {}'.format(error)
+                                     )
+                self.view.shapefile = ''
+                self.view.load_shapefile()
+            self.main_menu.attribute_groupbox.update_fields()
+        # the tkinter version saves its scroll position instead of the zoom
+        # level and center of the view
+        restore_view = session['frontend'] == 'pyqt'
+        if restore_view:
+            scale, x, y = session['view']
+            self.view.setTransform(QTransform.fromScale(scale, scale))
+        self.view.redraw_map()
+        if restore_view:
+            self.view.centerOn(x, y)
+        nodes = self.view.create_nodes(session['longitudes'], session['latitudes'])
+        for node, selected in zip(nodes, session['selected']):
+            node.setSelected(bool(selected))
         
     def import_shapefile(self):
         self.view.shapefile = QFileDialog.getOpenFileName(
                                             self, 
                                             'Import a shapefile', 
-                                            self.path_shapefiles
+                                            self.path_shapefiles,
+                                            'Shapefile (*.shp);;Vector tiles (*.tiles)'
                                             )[0]
+        self.view.load_shapefile()
+        self.main_menu.attribute_groupbox.update_fields()
         self.view.redraw_map()
 
 class View(QGraphicsView):
     
-    projections = OrderedDict([
-    ('Spherical', Proj('+proj=ortho +lat_0=48 +lon_0=17')),
-    ('Mercator', Proj(init='epsg:3395')),
-    ('WGS84', Proj(init='epsg:3857')),
-    ('ETRS89 - LAEA Europe', Proj("+init=EPSG:3035"))
-    ])
+    projections = projections('Spherical', 'Mercator', 'WGS84', 'ETRS89 - LAEA Europe')
+    
+    # approximate memory of a node (python object, attributes, scene item)
+    node_size = 600
+    
+    # simplification of the map (in degrees) when the memory budget is 
+    # exceeded
+    simplification_levels = (0.05, 0.2, 0.5)
     
     def __init__(self, controller):
         super().__init__()
@@ -159,12 +538,132 @@ class View(QGraphicsView):
         self.land_brush = QBrush(QColor(52, 165, 111))
         self.land_pen = QPen(QColor(0, 0, 0))
         
-        # draw the map 
-        self.polygons = self.scene.createItemGroup(self.draw_polygons())
-        self.draw_water()
+        # index and DBF attributes of the shapefile, polygon items of each 
+        # shape, and current fill color and visibility of each shape
+        self.index = self.attributes = None
+        self.shape_items = {}
+        self.shape_fill, self.shape_hidden = {}, set()
+        self.brushes = {}
+        
+        # vector tiles (instead of a shapefile): the tiles of the zoom level
+        # that cover the visible area are drawn, and the tiles that leave it
+        # (or of another zoom level) are deleted. The lands of the tiles 
+        # are not outlined: the borders of each shape are a path item.
+        self.tiles, self.tile_zoom = None, None
+        self.tile_items, self.border_items = {}, {}
+        
+        # memory accounting per layer: when the process exceeds the memory
+        # budget, caches are evicted and the map is simplified
+        self.simplification = 0
+        self.land_items = self.land_points = 0
+        self.memory = MemoryBudget()
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(2000)
+        self.memory_timer.timeout.connect(self.check_memory)
+        
+        # additional shapefiles drawn above the map, one item group per 
+        # layer: a layer is loaded the first time it is visible, and its 
+        # group is hidden outside of its zoom range
+        self.layers = LayerStack()
+        self.layer_groups = {}
+        
+        # points of the measured path (shift + click), in geographical 
+        # coordinates, and the items of the path and of its length
+        self.measure_points = []
+        self.measure_item = self.measure_label = None
+        self.measure_pen = QPen(QColor(255, 0, 0), 2, Qt.DashLine)
+        self.measure_pen.setCosmetic(True)
+        
+        # search indexes of the shapes (text fields of the shapefile) and 
+        # of the node labels, current results, and the projected bounding
+        # box of the shapes (per projection) used to zoom to a result
+        self.feature_search = self.node_search = None
+        self.search_fields, self.search_query, self.search_results = [], '', []
+        self.feature_bboxes = {}
+        
+        # heavy operations (redraw, import, deletion) are generators, run 
+        # by slices between two frames: the timer fires once the pending 
+        # user input has been processed
+        self.scheduler = FrameScheduler()
+        self.scheduler_timer = QTimer(self)
+        self.scheduler_timer.setInterval(0)
+        self.scheduler_timer.timeout.connect(self.run_tasks)
+        self.task_ids = count()
+        # True while a redraw of the map is pending
+        self.redrawing = False
+        
+        # raster image of the land and water layers (one per zoom level), 
+        # displayed instead of the polygons while the user zooms and pans
+        self.backdrop = BackdropCache()
+        self.backdrop_item = None
+        self.backdrop_timer = QTimer(self)
+        self.backdrop_timer.setSingleShot(True)
+        self.backdrop_timer.setInterval(300)
+        self.backdrop_timer.timeout.connect(self.hide_backdrop)
+        
+        self.load_shapefile()
         
         # set of graphical nodes
         self.nodes = set()
+        
+        # optional node database: only the nodes of the visible area 
+        # (plus a margin) are displayed
+        self.node_store = None
+        self.store_nodes = {}
+        
+        # node density heatmap, displayed instead of the nodes: it is 
+        # recomputed when the user stops zooming / panning
+        self.heatmap = self.heatmap_item = None
+        self.heatmap_timer = QTimer(self)
+        self.heatmap_timer.setSingleShot(True)
+        self.heatmap_timer.setInterval(150)
+        self.heatmap_timer.timeout.connect(self.draw_heatmap)
+        
+        # great-circle links between nodes: a link is identified by the
+        # pair of nodes it connects, and drawn as a path item (arcs are 
+        # split at the antimeridian and at the horizon). The links of the 
+        # nodes that moved are updated once per event loop iteration.
+        self.links = LinkLayer()
+        self.link_items = {}
+        self.node_links = defaultdict(set)
+        self.link_pen = QPen(QColor(47, 79, 79), 2)
+        self.link_pen.setCosmetic(True)
+        self.moved_nodes = set()
+        self.link_timer = QTimer(self)
+        self.link_timer.setSingleShot(True)
+        self.link_timer.setInterval(0)
+        self.link_timer.timeout.connect(self.move_links)
+        
+        # live position feed: the updates are applied once per frame
+        self.feed = None
+        self.feed_nodes = {}
+        self.feed_timer = QTimer(self)
+        self.feed_timer.setInterval(33)
+        self.feed_timer.timeout.connect(self.apply_feed)
+        
+        # node tracks played back over time: the positions of all nodes at
+        # the playback time are drawn by a single item, once per frame
+        self.tracks = self.playback = self.track_item = None
+        self.track_timer = QTimer(self)
+        self.track_timer.setInterval(33)
+        self.track_timer.timeout.connect(self.play_frame)
+        
+        # labels are only created for the visible nodes, once the 
+        # interaction is over
+        self.label_timer = QTimer(self)
+        self.label_timer.setSingleShot(True)
+        self.label_timer.setInterval(200)
+        self.label_timer.timeout.connect(self.update_labels)
+        
+        # draw the map: shapes are read from the shapefile only when they 
+        # become visible
+        self.polygons = self.scene.createItemGroup([])
+        self.draw_water()
+        self.schedule_shapes()
+        self.horizontalScrollBar().valueChanged.connect(self.viewport_changed)
+        self.verticalScrollBar().valueChanged.connect(self.viewport_changed)
+        self.account_memory()
+        self.memory_timer.start()
 
     ## Zoom system
 
@@ -176,6 +675,11 @@ class View(QGraphicsView):
         
     def wheelEvent(self, event):
         self.zoom_in() if event.angleDelta().y() > 0 else self.zoom_out()
+        # the map is displayed as an image until the zoom is over
+        self.show_backdrop()
+        self.backdrop_timer.start()
+        # zooming out may reveal shapes and nodes that are not drawn yet
+        self.viewport_changed()
         
     ## Mouse bindings
         
@@ -192,6 +696,10 @@ class View(QGraphicsView):
         super().mouseMoveEvent(event)
         
     def mousePressEvent(self, event):
+        # shift + click adds a point to the measured path
+        if event.button() == Qt.LeftButton and event.modifiers() & Qt.ShiftModifier:
+            self.add_measure_point(event.pos())
+            return
         # activate rubberband for selection
         # by default, the rubberband is active for both clicks, we have to
         # deactivate it explicitly for the right-click
@@ -199,8 +707,18 @@ class View(QGraphicsView):
             self.setDragMode(QGraphicsView.RubberBandDrag)
         if event.button() == Qt.RightButton:
             self.cursor_pos = event.pos()
+            self.show_backdrop()
         super().mousePressEvent(event)
         
+    def mouseReleaseEvent(self, event):
+        # the selected nodes may have been moved: we save their new position
+        if event.button() == Qt.LeftButton:
+            self.save_node_positions(self.scene.selectedItems())
+            self.label_timer.start()
+        if event.button() == Qt.RightButton:
+            self.backdrop_timer.start()
+        super().mouseReleaseEvent(event)
+        
     ## Drag & Drop system
     
     def dragEnterEvent(self, event):
@@ -214,6 +732,14 @@ class View(QGraphicsView):
         geo_pos = self.to_geographical_coordinates(pos.x(), pos.y())
         if event.mimeData().hasFormat('application/x-dnditemdata'):
             new_node = Node(self.controller, pos)
+            if self.node_store:
+                store_id ,= self.node_store.insert(
+                                                   [new_node.longitude], 
+                                                   [new_node.latitude]
+                                                   )
+                new_node.store_id = int(store_id)
+                self.store_nodes[new_node.store_id] = new_node
+            self.label_timer.start()
             
     ## Map functions
     
@@ -225,36 +751,639 @@ class View(QGraphicsView):
         px, py = self.projections[self.proj](longitude, latitude)
         return px*self.ratio + self.offset[0], -py*self.ratio + self.offset[1]
         
+    def create_nodes(self, longitudes, latitudes):
+        # bulk creation: all nodes are projected at once
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        xs, ys = self.to_canvas_coordinates(longitudes, latitudes)
+        self.label_timer.start()
+        return [
+                Node(self.controller, QPointF(x, y), (lon, lat))
+                for x, y, lon, lat in zip(
+                                          xs.tolist(), 
+                                          ys.tolist(), 
+                                          longitudes.tolist(), 
+                                          latitudes.tolist()
+                                          )
+                ]
+                
+    def import_nodes(self, longitudes, latitudes):
+        # the nodes are created over several frames
+        self.schedule(
+                      ('import', next(self.task_ids)), 
+                      self.import_nodes_task(longitudes, latitudes), 
+                      priority = 2
+                      )
+        
+    def import_nodes_task(self, longitudes, latitudes, size=200):
+        for start in range(0, len(longitudes), size):
+            nodes = self.create_nodes(
+                                      longitudes[start:start + size], 
+                                      latitudes[start:start + size]
+                                      )
+            if self.heatmap:
+                for node in nodes:
+                    node.setVisible(False)
+            yield
+        self.update_heatmap_points()
+                
+    def delete_selected_nodes(self):
+        selected_nodes = self.scene.selectedItems()
+        if self.node_store:
+            self.node_store.delete([node.store_id for node in selected_nodes 
+                                                  if node.store_id is not None])
+        self.delete_nodes(selected_nodes)
+        
+    def delete_nodes(self, nodes):
+        # the nodes are deleted over several frames
+        self.schedule(
+                      ('delete', next(self.task_ids)), 
+                      self.delete_nodes_task(nodes), 
+                      priority = 2
+                      )
+        
+    def delete_nodes_task(self, nodes, size=500):
+        for nodes in slices(nodes, size):
+            for node in nodes:
+                # the node may have been deleted since the task started
+                if node in self.nodes:
+                    node.self_destruction()
+            yield
+        
+    def delete_all_nodes(self):
+        self.scheduler.cancel_all('nodes', 'import', 'delete')
+        complete(self.delete_nodes_task(list(self.nodes)))
+        
+    ## Frame scheduler
+    
+    def schedule(self, key, task, priority=1):
+        self.scheduler.start(key, task, priority)
+        self.scheduler_timer.start()
+        
+    def run_tasks(self):
+        # one slice of the pending tasks per frame
+        if not self.scheduler.run():
+            self.scheduler_timer.stop()
+            
+    ## Links
+    
+    def link_selected_nodes(self):
+        # all selected nodes are linked to each other
+        nodes = self.scene.selectedItems()
+        self.create_links([
+                           (source, destination) 
+                           for i, source in enumerate(nodes) 
+                           for destination in nodes[i + 1:]
+                           ])
+                           
+    def create_links(self, pairs):
+        pairs = [
+                 pair for pair in pairs 
+                 if pair not in self.links and pair[::-1] not in self.links
+                 ]
+        if not pairs:
+            return
+        self.links.add(
+                       pairs,
+                       [source.longitude for source, _ in pairs],
+                       [source.latitude for source, _ in pairs],
+                       [destination.longitude for _, destination in pairs],
+                       [destination.latitude for _, destination in pairs]
+                       )
+        for pair in pairs:
+            for node in pair:
+                self.node_links[node].add(pair)
+        if self.node_store:
+            stored = [
+                      (source, destination) for source, destination in pairs 
+                      if source.store_id is not None and destination.store_id is not None
+                      ]
+            self.node_store.add_links(
+                                      [source.store_id for source, _ in stored],
+                                      [destination.store_id for _, destination in stored]
+                                      )
+        self.draw_links(pairs)
+        
+    def import_links(self, rows):
+        # each row contains the longitude and latitude of the source and 
+        # the destination of a link: a node is created for each endpoint
+        endpoints = list(dict.fromkeys(
+                                       point for row in rows 
+                                       for point in (row[:2], row[2:])
+                                       ))
+        if not endpoints:
+            return
+        # with a node database, the nodes and links are only displayed if 
+        # visible
+        if self.node_store:
+            ids = self.node_store.insert(*zip(*endpoints)).tolist()
+            ids = dict(zip(endpoints, ids))
+            self.node_store.add_links(
+                                      [ids[row[:2]] for row in rows], 
+                                      [ids[row[2:]] for row in rows]
+                                      )
+            self.page_nodes()
+            self.update_heatmap_points()
+            return
+        nodes = dict(zip(endpoints, self.create_nodes(*zip(*endpoints))))
+        self.create_links([(nodes[row[:2]], nodes[row[2:]]) for row in rows])
+        
+    def draw_links(self, keys=None):
+        paths = self.links.paths(
+                                 self.proj, 
+                                 self.projections[self.proj], 
+                                 self.ratio, 
+                                 self.offset, 
+                                 keys
+                                 )
+        for key, segments in paths.items():
+            path = QPainterPath()
+            for segment in segments:
+                path.addPolygon(to_qpolygon(segment))
+            # existing items are updated rather than recreated
+            if key not in self.link_items:
+                self.link_items[key] = QGraphicsPathItem()
+                self.link_items[key].setPen(self.link_pen)
+                self.link_items[key].setZValue(2)
+                self.scene.addItem(self.link_items[key])
+            self.link_items[key].setPath(path)
+            
+    def node_moved(self, node):
+        if node in self.node_links:
+            self.moved_nodes.add(node)
+            self.link_timer.start()
+            
+    def move_links(self):
+        # only the links of the nodes that moved are updated
+        keys = set().union(*(self.node_links.get(node, ()) for node in self.moved_nodes))
+        self.moved_nodes.clear()
+        if not keys:
+            return
+        keys = list(keys)
+        self.links.move(
+                        keys,
+                        [source.longitude for source, _ in keys],
+                        [source.latitude for source, _ in keys],
+                        [destination.longitude for _, destination in keys],
+                        [destination.latitude for _, destination in keys]
+                        )
+        self.draw_links(keys)
+        
+    def delete_links(self, keys):
+        keys = list(keys)
+        self.links.remove(keys)
+        for key in keys:
+            item = self.link_items.pop(key, None)
+            if item:
+                self.scene.removeItem(item)
+            for node in key:
+                if node in self.node_links:
+                    self.node_links[node].discard(key)
+            
+    ## Node database
+    
+    # maximum number of nodes of the node database displayed at once
+    max_nodes = 5000
+            
+    def open_node_store(self, filepath):
+        if self.node_store:
+            self.node_store.close()
+        self.delete_all_nodes()
+        self.node_store = NodeStore(filepath)
+        self.page_nodes()
+            
+    def page_nodes(self):
+        # the nodes of the visible area are created, and those that left it 
+        # are deleted (the database is the reference, not the scene): the
+        # links of the deleted nodes remain in the database, and the links 
+        # of the created nodes are read from it
+        if not self.node_store or self.heatmap:
+            return
+        bbox = self.visible_bbox(margin=0.5)
+        if bbox:
+            ids, longitudes, latitudes = self.node_store.query(*bbox, self.max_nodes)
+        else:
+            ids, longitudes, latitudes = np.empty(0, dtype=int), np.empty(0), np.empty(0)
+        for store_id in set(self.store_nodes) - set(ids.tolist()):
+            self.store_nodes[store_id].self_destruction()
+        new = ~np.isin(ids, list(self.store_nodes))
+        nodes = self.create_nodes(longitudes[new], latitudes[new])
+        for node, store_id in zip(nodes, ids[new].tolist()):
+            node.store_id = store_id
+            self.store_nodes[store_id] = node
+        new_ids = set(ids[new].tolist())
+        self.create_links([
+                           (self.store_nodes[source], self.store_nodes[destination])
+                           for source, destination in self.node_store.links(ids)
+                           if source in new_ids or destination in new_ids
+                           ])
+            
+    ## Live feed
+    
+    def start_feed(self, port=None, filepath=None):
+        self.stop_feed()
+        self.feed = PositionFeed(port=port, filepath=filepath)
+        self.feed_timer.start()
+        
+    def stop_feed(self):
+        self.feed_timer.stop()
+        if self.feed:
+            self.feed.close()
+            self.feed = None
+            
+    def apply_feed(self):
+        ids, longitudes, latitudes = self.feed.drain()
+        if not ids:
+            return
+        # nodes that are not known yet (or were deleted) are created in bulk
+        known = np.array([
+                          id in self.feed_nodes and self.feed_nodes[id] in self.nodes 
+                          for id in ids
+                          ], dtype=bool)
+        if not known.all():
+            new_ids = [id for id, k in zip(ids, known) if not k]
+            nodes = self.create_nodes(longitudes[~known], latitudes[~known])
+            self.feed_nodes.update(zip(new_ids, nodes))
+        # the positions of the other nodes are projected at once
+        nodes = [self.feed_nodes[id] for id, k in zip(ids, known) if k]
+        if nodes:
+            xs, ys = self.to_canvas_coordinates(longitudes[known], latitudes[known])
+            for node, x, y, lon, lat in zip(
+                                            nodes, 
+                                            xs.tolist(), 
+                                            ys.tolist(), 
+                                            longitudes[known].tolist(), 
+                                            latitudes[known].tolist()
+                                            ):
+                # no inverse projection: the coordinates are known
+                node.coordinates = lon, lat
+                node.setPos(QPointF(x, y))
+            self.moved_nodes.update(nodes)
+            self.move_links()
+        
+    ## Heatmap
+    
+    def show_hide_heatmap(self):
+        if self.heatmap:
+            self.heatmap = None
+            self.scene.removeItem(self.heatmap_item)
+            self.heatmap_item = None
+            for node in self.nodes:
+                node.setVisible(True)
+            self.page_nodes()
+            self.label_timer.start()
+        else:
+            for node in self.nodes:
+                node.setVisible(False)
+                node.delete_label()
+            self.heatmap = HeatmapLayer()
+            self.heatmap_item = QGraphicsPixmapItem()
+            # the image is computed at the resolution of the screen
+            self.heatmap_item.setFlag(QGraphicsItem.ItemIgnoresTransformations, True)
+            self.heatmap_item.setZValue(5)
+            self.scene.addItem(self.heatmap_item)
+            self.update_heatmap_points()
+            
+    def update_heatmap_points(self):
+        if not self.heatmap:
+            return
+        # all nodes of the database, and the nodes that are not in it
+        nodes = [node for node in self.nodes if node.store_id is None]
+        longitudes = [node.longitude for node in nodes]
+        latitudes = [node.latitude for node in nodes]
+        if self.node_store:
+            store_longitudes, store_latitudes = self.node_store.coordinates()
+            longitudes = np.concatenate((longitudes, store_longitudes))
+            latitudes = np.concatenate((latitudes, store_latitudes))
+        self.heatmap.set_points(longitudes, latitudes)
+        self.draw_heatmap()
+        
+    def draw_heatmap(self):
+        if not self.heatmap:
+            return
+        width, height = self.viewport().width(), self.viewport().height()
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        image = self.heatmap.render(
+                                    self.proj,
+                                    self.projections[self.proj],
+                                    self.ratio,
+                                    self.offset,
+                                    rect.left(), 
+                                    rect.top(), 
+                                    rect.right(), 
+                                    rect.bottom(),
+                                    width, 
+                                    height
+                                    )
+        qt_image = QImage(image.data, width, height, 4*width, QImage.Format_RGBA8888)
+        # the QImage does not own the numpy buffer: we copy it
+        self.heatmap_item.setPixmap(QPixmap.fromImage(qt_image.copy()))
+        self.heatmap_item.setPos(rect.topLeft())
+        
+    ## Track playback
+    
+    def import_tracks(self, filepath):
+        self.track_timer.stop()
+        # the file is read by chunks, one chunk per frame
+        self.schedule('tracks', self.import_tracks_task(filepath), priority=2)
+        
+    def import_tracks_task(self, filepath):
+        try:
+            tracks = yield from read_tracks_task(filepath)
+        except (OSError, ValueError) as error:
+            QMessageBox.critical(
+                                 self.controller, 
+                                 'Import tracks', 
+                                 'The tracks cannot be read: {}'.format(error)
+                                 )
+            return
+        self.tracks = tracks
+        self.playback = Playback(self.tracks.start, self.tracks.end)
+        if not self.track_item:
+            self.track_item = TrackItem()
+            self.scene.addItem(self.track_item)
+        self.controller.show_tracks(self.tracks)
+        
+    def set_track_speed(self, speed):
+        if not self.playback:
+            return
+        try:
+            self.playback.speed = float(speed)
+        except ValueError:
+            warnings.warn('invalid playback speed: ' + speed)
+            
+    def play_tracks(self):
+        if not self.tracks:
+            return
+        if self.playback.playing:
+            self.playback.pause()
+            self.track_timer.stop()
+        else:
+            self.playback.play()
+            self.track_timer.start()
+            
+    def play_frame(self):
+        self.playback.advance()
+        self.draw_tracks()
+        if not self.playback.playing:
+            self.track_timer.stop()
+            
+    def seek_tracks(self, time):
+        if not self.tracks:
+            return
+        self.playback.seek(time)
+        self.draw_tracks()
+        
+    def draw_tracks(self):
+        # one frame: the projected positions of the frame are interpolated 
+        # (projected once per projection) and scaled to the scene, whose
+        # ratio does not change when the user zooms
+        if not self.tracks:
+            return
+        px, py = self.tracks.positions(
+                                       self.proj, 
+                                       self.projections[self.proj], 
+                                       self.playback.time
+                                       )
+        self.track_item.set_points(
+                                   px*self.ratio + self.offset[0], 
+                                   -py*self.ratio + self.offset[1],
+                                   # size of a point in scene coordinates
+                                   10/self.transform().m11()
+                                   )
+        self.controller.show_track_time(self.playback.time, self.tracks.dates)
+        
+    def save_node_positions(self, nodes):
+        nodes = [node for node in nodes if node.store_id is not None]
+        if self.node_store and nodes:
+            self.node_store.move(
+                                 [node.store_id for node in nodes],
+                                 [node.longitude for node in nodes],
+                                 [node.latitude for node in nodes]
+                                 )
+        
     def move_to_geographical_coordinates(self):
+        self.schedule('nodes', self.move_nodes_task(), priority=1)
+        
+    def move_nodes_task(self, size=1000):
+        # the geographical coordinates do not change: the nodes of a slice
+        # are projected at once
+        for nodes in slices(list(self.nodes), size):
+            nodes = [node for node in nodes if node in self.nodes]
+            longitudes = [node.longitude for node in nodes]
+            latitudes = [node.latitude for node in nodes]
+            xs, ys = self.to_canvas_coordinates(
+                                                np.array(longitudes, dtype=np.float64), 
+                                                np.array(latitudes, dtype=np.float64)
+                                                )
+            for node, x, y, lon, lat in zip(
+                                            nodes, 
+                                            np.ravel(xs).tolist(), 
+                                            np.ravel(ys).tolist(), 
+                                            longitudes, 
+                                            latitudes
+                                            ):
+                node.coordinates = lon, lat
+                node.setPos(QPointF(x, y))
+            yield
+        self.label_timer.start()
+        
+    ## Labels
+    
+    def update_labels(self):
+        # labels are only displayed for the visible nodes, above a zoom 
+        # threshold, and when they do not overlap another label
+        nodes = []
+        scale = self.transform().m11()
+        if not self.heatmap and self.ratio*scale >= label_ratio:
+            rect = self.mapToScene(self.viewport().rect()).boundingRect()
+            nodes = [
+                     item for item in self.scene.items(rect) 
+                     if isinstance(item, Node) and item.isVisible()
+                     ]
+            # the labels of the selected nodes have the highest priority
+            nodes.sort(key=lambda node: not node.isSelected())
+            xs = np.array([node.pos().x() for node in nodes])
+            ys = np.array([node.pos().y() for node in nodes])
+            # labels are not zoomed: their size in the scene depends on the zoom
+            displayed = declutter(
+                                  xs - 70, 
+                                  ys + 50, 
+                                  xs - 70 + 130/scale, 
+                                  ys + 50 + 15/scale, 
+                                  cell = 15/scale
+                                  )
+            nodes = [node for node, d in zip(nodes, displayed) if d]
+        labeled = set(nodes)
         for node in self.nodes:
-            node.setPos(QPointF(*self.to_canvas_coordinates(
-                                                            node.longitude, 
-                                                            node.latitude
-                                                            )))
+            if node.label and node not in labeled:
+                node.delete_label()
+        for node in nodes:
+            node.update_label()
+
+    def load_shapefile(self):
+        if self.index:
+            self.index.close()
+        if self.tiles:
+            self.tiles.close()
+        self.index = self.tiles = None
+        if exists(self.shapefile) and self.shapefile.endswith('.tiles'):
+            self.tiles = TileSource(self.shapefile)
+        elif exists(self.shapefile):
+            self.index = ShapeIndex(self.shapefile)
+        self.load_attributes()
+        
+    def viewport_changed(self, *_):
+        self.schedule_shapes()
+        if self.heatmap:
+            self.heatmap_timer.start()
+        self.label_timer.start()
+        self.draw_tracks()
+        
+    def visible_bbox(self, margin=0):
+        # the margin is a fraction of the width and height of the view
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        dx, dy = margin*rect.width(), margin*rect.height()
+        return geographic_bbox(
+                               self.projections[self.proj], 
+                               self.ratio, 
+                               self.offset, 
+                               rect.left() - dx, 
+                               rect.top() - dy, 
+                               rect.right() + dx, 
+                               rect.bottom() + dy
+                               )
+        
+    def schedule_shapes(self):
+        # the shapes, layers and nodes of the visible area are drawn by 
+        # slices: a pending redraw is started again instead, as it covers 
+        # the new visible area
+        task = self.redraw_map_task() if self.redrawing else self.update_map_task()
+        self.schedule('map', task, priority=0)
+        
+    def update_map_task(self):
+        yield from self.load_visible_shapes_task()
+        self.draw_layers()
+        self.page_nodes()
+        
+    def load_visible_shapes_task(self, size=20):
+        if self.tiles:
+            yield from self.load_visible_tiles_task()
+            return
+        if not self.index:
+            return
+        bbox = self.visible_bbox()
+        if not bbox:
+            return
+        for indices in slices(self.index.query(*bbox), size):
+            # the shapes may have been drawn since the task started
+            new_shapes = [i for i in indices if i not in self.shape_items]
+            for polygon_item in self.draw_polygons(new_shapes):
+                self.polygons.addToGroup(polygon_item)
+            yield
 
-    def draw_polygons(self):
-        sf = shapefile.Reader(self.shapefile)       
-        polygons = sf.shapes() 
-        for polygon in polygons:
-            # convert shapefile geometries into shapely geometries
-            # to extract the polygons of a multipolygon
-            polygon = shapely.geometry.shape(polygon)
-            # if it is a polygon, we use a list to make it iterable
-            if polygon.geom_type == 'Polygon':
-                polygon = [polygon]
-            for land in polygon:
-                qt_polygon = QPolygonF() 
-                for lon, lat in land.exterior.coords:
-                    print(lon, lat)
-                    px, py = self.to_canvas_coordinates(lon, lat)
-                    if px > 1e+10:
-                        continue
-                    qt_polygon.append(QPointF(px, py))
-                polygon_item = QGraphicsPolygonItem(qt_polygon)
-                polygon_item.setBrush(self.land_brush)
-                polygon_item.setPen(self.land_pen)
-                polygon_item.setZValue(1)
-                yield polygon_item
+    def load_visible_tiles_task(self, size=4):
+        bbox = self.visible_bbox()
+        if not bbox:
+            return
+        zoom = self.tiles.zoom_for(self.ratio*self.transform().m11())
+        if zoom != self.tile_zoom:
+            self.delete_tiles()
+            self.tile_zoom = zoom
+        # the tiles beyond half a screen of the visible area are deleted
+        kept = self.visible_bbox(margin=0.5)
+        kept = set(self.tiles.covering(zoom, *kept)) if kept else set()
+        for key in set(self.tile_items) - kept:
+            self.delete_tile(key)
+        for keys in slices(self.tiles.covering(zoom, *bbox), size):
+            for key in keys:
+                # the tile may have been drawn since the task started
+                if key not in self.tile_items:
+                    self.draw_tile(key)
+            yield
+            
+    def draw_tile(self, key):
+        parts = self.tiles.get(key)
+        projected = project_rings(self.projections[self.proj], [p for _, _, p in parts])
+        items, borders, points = [], {}, 0
+        for (index, kind, _), (px, py) in zip(parts, projected):
+            finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+            if finite.sum() < (3 if kind == land_part else 2):
+                continue
+            coords = np.column_stack((
+                                      px[finite]*self.ratio + self.offset[0], 
+                                      -py[finite]*self.ratio + self.offset[1]
+                                      )).ravel()
+            points += len(coords)//2
+            if kind == border_part:
+                path = borders.setdefault(index, QPainterPath())
+                path.addPolygon(to_qpolygon(coords))
+                continue
+            polygon_item = QGraphicsPolygonItem(to_qpolygon(coords))
+            polygon_item.setBrush(self.brush(self.shape_fill.get(index)))
+            polygon_item.setPen(QPen(Qt.NoPen))
+            polygon_item.setZValue(1)
+            self.shape_items.setdefault(index, []).append(polygon_item)
+            items.append((index, polygon_item))
+        for index, path in borders.items():
+            path_item = QGraphicsPathItem(path)
+            path_item.setPen(self.land_pen)
+            # the borders are drawn above the lands of the neighbor tiles
+            path_item.setZValue(2)
+            self.border_items.setdefault(index, []).append(path_item)
+            items.append((index, path_item))
+        for index, item in items:
+            item.setVisible(index not in self.shape_hidden)
+            self.polygons.addToGroup(item)
+        self.tile_items[key] = items, points
+        self.land_items += len(items)
+        self.land_points += points
+        
+    def delete_tile(self, key):
+        items, points = self.tile_items.pop(key)
+        self.land_items -= len(items)
+        self.land_points -= points
+        for index, item in items:
+            self.scene.removeItem(item)
+            # the item is either a land or a border of the shape
+            for items in (self.shape_items, self.border_items):
+                if item in items.get(index, ()):
+                    items[index].remove(item)
+                    
+    def delete_tiles(self):
+        for key in list(self.tile_items):
+            self.delete_tile(key)
+        self.tile_zoom = None
+        
+    def draw_polygons(self, indices):
+        # the multipolygons are decomposed into their exterior rings
+        # (the key is created even if no ring is visible), and the rings 
+        # of all shapes are projected at once
+        for index in indices:
+            self.shape_items.setdefault(index, [])
+        rings = [
+                 (i, ring) for i in indices 
+                 for ring in self.index.rings(i, self.simplification)
+                 ]
+        projected = project_rings(self.projections[self.proj], [r for _, r in rings])
+        for (index, _), (px, py) in zip(rings, projected):
+            # points beyond the horizon cannot be projected
+            finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+            if finite.sum() < 3:
+                continue
+            coords = np.column_stack((
+                                      px[finite]*self.ratio + self.offset[0], 
+                                      -py[finite]*self.ratio + self.offset[1]
+                                      ))
+            polygon_item = QGraphicsPolygonItem(to_qpolygon(coords.ravel()))
+            polygon_item.setBrush(self.brush(self.shape_fill.get(index)))
+            polygon_item.setPen(self.land_pen)
+            polygon_item.setZValue(1)
+            polygon_item.setVisible(index not in self.shape_hidden)
+            self.shape_items[index].append(polygon_item)
+            self.land_items += 1
+            self.land_points += len(coords)
+            yield polygon_item
                 
     def draw_water(self):
         if self.proj in ('Spherical', 'ETRS89 - LAEA Europe'):
@@ -265,6 +1394,8 @@ class View(QGraphicsView):
             earth_water.setZValue(0)
             earth_water.setBrush(self.water_brush)
             self.polygons.addToGroup(earth_water)
+            self.scene.setSceneRect(earth_water.boundingRect())
+            self.water_item = earth_water
         else:
             # we compute the projected bounds of the Mercator (3395) projection
             # upper-left corner x and y coordinates:
@@ -277,27 +1408,607 @@ class View(QGraphicsView):
             earth_water.setZValue(0)
             earth_water.setBrush(self.water_brush)
             self.polygons.addToGroup(earth_water)
+            self.scene.setSceneRect(earth_water.boundingRect())
+            self.water_item = earth_water
+            
+    ## Layers
+    
+    def add_layer(self, filepath, min_zoom, max_zoom):
+        self.layers.add(filepath, min_zoom, max_zoom)
+        self.draw_layers()
+        
+    def show_hide_layer(self, name):
+        layer = self.layers.find(name)
+        if layer:
+            layer.displayed = not layer.displayed
+            self.draw_layers()
+            
+    def remove_layer(self, name):
+        layer = self.layers.find(name)
+        if layer:
+            group = self.layer_groups.pop(layer, None)
+            if group:
+                self.scene.removeItem(group)
+            self.layers.remove(layer)
+        
+    def draw_layers(self):
+        # the layers out of their zoom range are hidden, not deleted: their
+        # group is displayed again when the user zooms back
+        zoom = zoom_level(self.ratio*self.transform().m11())
+        bbox = self.visible_bbox()
+        for rank, layer in enumerate(self.layers, 1):
+            group = self.layer_groups.get(layer)
+            if not layer.is_visible(zoom):
+                if group:
+                    group.hide()
+                continue
+            if not group:
+                group = self.layer_groups[layer] = self.scene.createItemGroup([])
+            # the layers are drawn above the map (z = 0) in z-order, and 
+            # below the links (z = 2)
+            group.setZValue(1 + rank/(len(self.layers.layers) + 1))
+            group.show()
+            # the visibility of the other layers is still updated
+            if not bbox:
+                continue
+            # the shapefile is opened the first time the layer is visible:
+            # if it was deleted or corrupted since, the layer is hidden
+            try:
+                index = layer.load()
+            except (OSError, ValueError, IndexError) as error:
+                warnings.warn('layer {} hidden: {}'.format(layer.name, error))
+                layer.displayed = False
+                group.hide()
+                continue
+            new_shapes = [i for i in index.query(*bbox) if i not in layer.drawn]
+            layer.drawn.update(new_shapes)
+            rings = [
+                     (i, ring) for i in new_shapes 
+                     for ring in index.rings(i, self.simplification)
+                     ]
+            projected = project_rings(self.projections[self.proj], [r for _, r in rings])
+            # one path item per shape: polygons are drawn as outlines, so 
+            # that the layers below (and the map) remain visible
+            paths = {}
+            for (i, _), (px, py) in zip(rings, projected):
+                finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+                if finite.sum() < 2:
+                    continue
+                coords = np.column_stack((
+                                          px[finite]*self.ratio + self.offset[0], 
+                                          -py[finite]*self.ratio + self.offset[1]
+                                          )).ravel()
+                path = paths.setdefault(i, QPainterPath())
+                path.addPolygon(to_qpolygon(coords))
+                if index.types[i] in (5, 15, 25):
+                    path.closeSubpath()
+                layer.points += len(coords)//2
+            pen = QPen(QColor(layer.color), 1)
+            pen.setCosmetic(True)
+            for path in paths.values():
+                path_item = QGraphicsPathItem(path)
+                path_item.setPen(pen)
+                group.addToGroup(path_item)
+                layer.items += 1
+                
+    def delete_layers(self):
+        for group in self.layer_groups.values():
+            self.scene.removeItem(group)
+        self.layer_groups.clear()
+        for layer in self.layers:
+            layer.clear()
+            
+    ## Measurement
+    
+    def measure_shapes(self):
+        # the geodesic area and perimeter of the shapes are added to the
+        # attributes, so that the map can be colored and filtered by area
+        if not self.index:
+            return None
+        areas, perimeters = shape_measures(self.index)
+        if self.attributes:
+            self.attributes.add_column('AREA_KM2', areas/1e6)
+            self.attributes.add_column('PERIM_KM', perimeters/1e3)
+        return '{} shapes\ntotal area: {:,.0f} km²\ntotal perimeter: {}'.format(
+                                                len(areas), 
+                                                areas.sum()/1e6, 
+                                                format_distance(perimeters.sum())
+                                                )
+                                                
+    def measure_selection(self):
+        nodes = [item for item in self.scene.selectedItems() if isinstance(item, Node)]
+        if len(nodes) < 2:
+            return 'Select two nodes or more'
+        # the pairs are measured by blocks, one block per frame
+        self.schedule('measure', self.measure_selection_task(nodes), priority=2)
+        
+    def measure_selection_task(self, nodes):
+        distances = pairwise_distances(
+                                       [node.longitude for node in nodes], 
+                                       [node.latitude for node in nodes]
+                                       )
+        pairs, shortest, longest, mean = yield from distance_summary(distances)
+        message = '{} nodes, {} pairs\nshortest: {}\nlongest: {}\nmean: {}'.format(
+                                                len(nodes), 
+                                                pairs, 
+                                                format_distance(shortest), 
+                                                format_distance(longest), 
+                                                format_distance(mean)
+                                                )
+        QMessageBox.information(self.controller, 'Measure selected nodes', message)
+        
+    def add_measure_point(self, position):
+        # the point is snapped to the node below the cursor, if any
+        item = self.itemAt(position)
+        if isinstance(item, Node):
+            longitude, latitude = item.longitude, item.latitude
+        else:
+            position = self.mapToScene(position)
+            longitude, latitude = self.to_geographical_coordinates(
+                                                                   position.x(), 
+                                                                   position.y()
+                                                                   )
+        # points beyond the horizon cannot be unprojected
+        if not np.isfinite(longitude) or abs(longitude) > 180:
+            return
+        self.measure_points.append((longitude, latitude))
+        self.draw_measure()
+        
+    def draw_measure(self):
+        for item in (self.measure_item, self.measure_label):
+            if item:
+                self.scene.removeItem(item)
+        self.measure_item = self.measure_label = None
+        if not self.measure_points:
+            return
+        longitudes, latitudes = np.array(self.measure_points).T
+        xs, ys = self.to_canvas_coordinates(longitudes, latitudes)
+        path = QPainterPath()
+        path.addPolygon(to_qpolygon(np.column_stack((xs, ys)).ravel()))
+        self.measure_item = self.scene.addPath(path, self.measure_pen)
+        self.measure_item.setZValue(20)
+        length = path_lengths(longitudes, latitudes).sum()
+        self.measure_label = self.scene.addSimpleText(format_distance(length))
+        self.measure_label.setFlag(QGraphicsItem.ItemIgnoresTransformations, True)
+        self.measure_label.setBrush(QBrush(QColor(255, 0, 0)))
+        self.measure_label.setZValue(20)
+        self.measure_label.setPos(float(xs[-1]), float(ys[-1]))
+        
+    def clear_measure(self):
+        self.measure_points = []
+        self.draw_measure()
+            
+    ## Feature search
+    
+    def index_features(self, fields=None):
+        # the index is built once per shapefile and set of fields
+        self.feature_bboxes.clear()
+        self.feature_search, self.search_fields = None, []
+        if not self.attributes:
+            return
+        # unknown fields are ignored (no valid field: default fields)
+        self.search_fields = [
+                              field for field in fields or () 
+                              if field in self.attributes.fields
+                              ] or default_fields(self.attributes)
+        if self.search_fields:
+            entries = feature_entries(self.attributes, self.search_fields)
+            self.feature_search = SearchIndex(entries)
+            
+    def index_nodes(self):
+        # the labels of the nodes (their coordinates) change when the nodes
+        # move: they are indexed when a new search starts
+        labels = (
+                  ('({}, {})'.format(node.longitude, node.latitude), node)
+                  for node in self.nodes
+                  )
+        self.node_search = SearchIndex((label, label, node) for label, node in labels)
+        
+    def search(self, query):
+        # labels of the results
+        if query.strip() and not self.search_query.strip():
+            self.index_nodes()
+        self.search_query = query
+        results = self.feature_search.search(query) if self.feature_search else []
+        if self.node_search and len(results) < 10:
+            results += self.node_search.search(query, 10 - len(results))
+        self.search_results = results
+        return [
+                'node ' + label if isinstance(key, Node) else label
+                for label, key in results
+                ]
+                
+    def feature_bbox(self, index):
+        # projected bounding box of a shape, cached per projection
+        if (self.proj, index) not in self.feature_bboxes:
+            bboxes = self.tiles.bboxes if self.tiles else self.index.bboxes
+            self.feature_bboxes[(self.proj, index)] = projected_bbox(
+                                                                     self.projections[self.proj], 
+                                                                     *bboxes[index]
+                                                                     )
+        return self.feature_bboxes[(self.proj, index)]
+        
+    def zoom_to_result(self, position):
+        if position >= len(self.search_results):
+            return
+        _, key = self.search_results[position]
+        if not isinstance(key, Node):
+            bbox = self.feature_bbox(key) if self.index or self.tiles else None
+        # the node may have been deleted since the search
+        elif key in self.nodes:
+            x, y = self.projections[self.proj](key.longitude, key.latitude)
+            bbox = (x, y, x, y) if np.isfinite([x, y]).all() else None
+        else:
+            bbox = None
+        if bbox:
+            self.zoom_to(*bbox)
+            
+    def zoom_to(self, min_x, min_y, max_x, max_y, margin=0.1, extent=20000):
+        # the view is fitted to the projected bounding box (which is at 
+        # least 'extent' meters wide and high)
+        width = max(max_x - min_x, extent)*self.ratio/(1 - 2*margin)
+        height = max(max_y - min_y, extent)*self.ratio/(1 - 2*margin)
+        x = (min_x + max_x)/2*self.ratio + self.offset[0]
+        y = -(min_y + max_y)/2*self.ratio + self.offset[1]
+        self.fitInView(QRectF(x - width/2, y - height/2, width, height), Qt.KeepAspectRatio)
+        self.viewport_changed()
+        self.draw_measure()
+            
+    ## Raster backdrop
+    
+    def show_backdrop(self):
+        # no backdrop if the map is hidden or was deleted
+        if not self.display or not self.polygons.scene():
+            return
+        # the bounds of the images are in scene coordinates, which do not 
+        # change when the user zooms: the image of the nearest zoom level
+        # is scaled by the view
+        cached = self.backdrop.nearest(self.proj, self.transform().m11())
+        if not cached:
+            # the polygons are scaled until an image is rendered
+            return
+        pixmap, (x0, y0, _, _), scale = cached
+        if not self.backdrop_item:
+            self.backdrop_item = self.scene.addPixmap(pixmap)
+            self.backdrop_item.setZValue(-1)
+            self.polygons.hide()
+        self.backdrop_item.setPixmap(pixmap)
+        self.backdrop_item.setPos(x0, y0)
+        self.backdrop_item.setScale(1/scale)
+        
+    def schedule_backdrop(self):
+        # a sharp image of the zoom level is rendered by slices, once the 
+        # other tasks are done
+        if self.display and self.polygons.scene():
+            self.schedule('backdrop', self.render_backdrop_task(), priority=3)
+        
+    def render_backdrop_task(self, size=100):
+        # the image covers the visible area, plus half a screen on each 
+        # side, so that the user can pan without a new rendering. It is
+        # rendered from the polygons of the scene (the projected rings),
+        # at the zoom level of the start of the task.
+        proj, scale = self.proj, self.transform().m11()
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        rect.adjust(-rect.width()/2, -rect.height()/2, rect.width()/2, rect.height()/2)
+        pixmap = QPixmap(int(rect.width()*scale), int(rect.height()*scale))
+        pixmap.fill(Qt.white)
+        painter = QPainter(pixmap)
+        try:
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.scale(scale, scale)
+            painter.translate(-rect.left(), -rect.top())
+            painter.setPen(self.water_item.pen())
+            painter.setBrush(self.water_item.brush())
+            painter.drawPath(self.water_item.shape())
+            lands = [
+                     item for index, items in list(self.shape_items.items()) 
+                     if index not in self.shape_hidden for item in items
+                     ]
+            for items in slices(lands, size):
+                for item in items:
+                    if rect.intersects(item.boundingRect()):
+                        painter.setPen(item.pen())
+                        painter.setBrush(item.brush())
+                        painter.drawPolygon(item.polygon())
+                yield
+            painter.setPen(self.land_pen)
+            painter.setBrush(Qt.NoBrush)
+            for index, items in list(self.border_items.items()):
+                if index in self.shape_hidden:
+                    continue
+                for item in items:
+                    if rect.intersects(item.boundingRect()):
+                        painter.drawPath(item.path())
+        finally:
+            painter.end()
+        if proj == self.proj:
+            size = pixmap.width()*pixmap.height()*pixmap.depth()//8
+            bounds = rect.left(), rect.top(), rect.right(), rect.bottom()
+            self.backdrop.put((proj, scale), pixmap, bounds, size=size)
+        
+    def hide_backdrop(self):
+        if self.backdrop_item:
+            self.scene.removeItem(self.backdrop_item)
+            self.backdrop_item = None
+            if self.display:
+                self.polygons.show()
+        self.schedule_backdrop()
+            
+    def delete_shapes(self):
+        self.delete_tiles()
+        for items in self.shape_items.values():
+            for item in items:
+                self.scene.removeItem(item)
+        self.shape_items.clear()
+        self.land_items = self.land_points = 0
+            
+    ## Memory accounting
+    
+    def account_memory(self):
+        def shapefile():
+            if not self.index:
+                return 0, 0
+            arrays = self.index.offsets, self.index.bboxes, self.index.types
+            return array_bytes(arrays), len(self.index)
+        def attributes():
+            columns = self.attributes.columns if self.attributes else {}
+            return array_bytes(columns), len(columns)
+        def map_items():
+            # QPolygonF stores the coordinates as doubles
+            return 16*self.land_points, self.land_items
+        def backdrop():
+            return self.backdrop.nbytes(), len(self.backdrop.images)
+        def tile_cache():
+            if not self.tiles:
+                return 0, 0
+            return self.tiles.nbytes(), len(self.tiles.cache)
+        def nodes():
+            return self.node_size*len(self.nodes), len(self.nodes)
+        def links():
+            arrays = self.links.lons, self.links.lats, self.links.projected
+            return array_bytes(arrays), len(self.links.keys)
+        def heatmap():
+            if not self.heatmap:
+                return 0, 0
+            arrays = self.heatmap.longitudes, self.heatmap.latitudes, self.heatmap.projected
+            return array_bytes(arrays), len(self.heatmap.longitudes)
+        def tracks():
+            if not self.tracks:
+                return 0, 0
+            return self.tracks.nbytes(), len(self.tracks)
+        def node_database():
+            if not self.node_store:
+                return 0, 0
+            return self.node_store.size(), self.node_store.count()
+        def layers():
+            loaded = [layer for layer in self.layers if layer.index]
+            size = sum(layer.nbytes() + 16*layer.points for layer in loaded)
+            return size, len(loaded)
+        self.memory.register('shapefile index', shapefile)
+        self.memory.register('attributes', attributes)
+        self.memory.register('map items', map_items)
+        self.memory.register('layers', layers)
+        self.memory.register('backdrop images', backdrop)
+        self.memory.register('tile cache', tile_cache)
+        self.memory.register('nodes', nodes)
+        self.memory.register('links', links)
+        self.memory.register('heatmap', heatmap)
+        self.memory.register('tracks', tracks)
+        self.memory.register('node database', node_database)
+        # eviction steps, from the cheapest to the most visible
+        self.memory.add_step('backdrop images', self.evict_backdrop)
+        self.memory.add_step('tile cache', self.evict_tiles)
+        self.memory.add_step('cached projections', self.evict_projections)
+        self.memory.add_step('attribute columns', self.evict_attributes)
+        self.memory.add_step('hidden layers', self.unload_layers)
+        self.memory.add_step('simplified map', self.simplify_map, self.restore_map)
+        self.memory.add_step('fewer nodes', self.reduce_nodes, self.restore_nodes)
+        
+    def check_memory(self):
+        step = self.memory.enforce()
+        if step:
+            warnings.warn('memory budget exceeded, evicted: ' + step)
+        else:
+            self.memory.restore()
+            
+    def evict_backdrop(self):
+        if not self.backdrop.images:
+            return False
+        self.backdrop.clear()
+        return True
+        
+    def evict_tiles(self):
+        # the drawn tiles are not affected, the others are read again
+        if not self.tiles or not self.tiles.cache:
+            return False
+        self.tiles.clear()
+        return True
+        
+    def evict_projections(self):
+        # cached projections of the projections that are not displayed
+        caches = [self.links.projected]
+        if self.heatmap:
+            caches.append(self.heatmap.projected)
+        if self.tracks:
+            caches.append(self.tracks.projected)
+        evicted = [
+                   (cache, name) for cache in caches 
+                   for name in cache if name != self.proj
+                   ]
+        for cache, name in evicted:
+            del cache[name]
+        return bool(evicted)
+        
+    def evict_attributes(self):
+        if not self.attributes or not self.attributes.columns:
+            return False
+        self.attributes.columns.clear()
+        return True
+        
+    def unload_layers(self):
+        # the layers that are not visible are deleted and closed: they are
+        # loaded again when they become visible
+        zoom = zoom_level(self.ratio*self.transform().m11())
+        hidden = [
+                  layer for layer in self.layers 
+                  if layer.index and not layer.is_visible(zoom)
+                  ]
+        for layer in hidden:
+            group = self.layer_groups.pop(layer, None)
+            if group:
+                self.scene.removeItem(group)
+            layer.unload()
+        return bool(hidden)
+        
+    def simplify_map(self):
+        # the map is drawn again with a simplified geometry
+        levels = [l for l in self.simplification_levels if l > self.simplification]
+        if not levels or not self.index:
+            return False
+        self.set_simplification(levels[0])
+        return True
+        
+    def restore_map(self):
+        # the previous (less simplified) geometry is drawn again
+        levels = [l for l in self.simplification_levels if l < self.simplification]
+        self.set_simplification(levels[-1] if levels else 0)
+        
+    def set_simplification(self, simplification):
+        self.simplification = simplification
+        self.backdrop.clear()
+        self.delete_shapes()
+        self.delete_layers()
+        self.schedule_shapes()
+        
+    def reduce_nodes(self):
+        # fewer nodes of the node database are displayed
+        if not self.node_store or self.max_nodes <= 500:
+            return False
+        self.node_store.shrink()
+        self.max_nodes //= 2
+        self.page_nodes()
+        return True
+        
+    def restore_nodes(self):
+        self.max_nodes *= 2
+        self.page_nodes()
+            
+    ## Attribute-driven styling
+    
+    def load_attributes(self):
+        self.shape_fill.clear()
+        self.shape_hidden.clear()
+        self.backdrop.clear()
+        # the attributes of the tiles are those of their shapefile
+        source = self.tiles.source if self.tiles else self.shapefile
+        dbf = splitext(source)[0] + '.dbf'
+        self.attributes = AttributeStore(dbf) if exists(dbf) else None
+        self.index_features()
+        
+    def brush(self, color):
+        if color is None:
+            return self.land_brush
+        if color not in self.brushes:
+            self.brushes[color] = QBrush(QColor(color))
+        return self.brushes[color]
+        
+    def style_map(self, field):
+        if not self.attributes or field not in self.attributes.fields:
+            return
+        # only the shapes whose color changed are updated
+        for index, color in enumerate(self.attributes.colors(field)):
+            if self.shape_fill.get(index) != color:
+                self.shape_fill[index] = color
+                for item in self.shape_items.get(index, ()):
+                    item.setBrush(self.brush(color))
+        self.backdrop.clear()
+        self.schedule_backdrop()
+                    
+    def filter_map(self, field, expression):
+        if not self.attributes or field not in self.attributes.fields:
+            return
+        try:
+            mask = self.attributes.select(field, expression)
+        except ValueError:
+            return
+        self.backdrop.clear()
+        for index, selected in enumerate(mask):
+            if selected != (index not in self.shape_hidden):
+                if selected:
+                    self.shape_hidden.discard(index)
+                else:
+                    self.shape_hidden.add(index)
+                for item in self.shape_items.get(index, []) + self.border_items.get(index, []):
+                    item.setVisible(bool(selected))
+        self.schedule_backdrop()
+                    
+    def reset_style(self):
+        for index in set(self.shape_fill) | self.shape_hidden:
+            for item in self.shape_items.get(index, ()):
+                item.setBrush(self.land_brush)
+                item.setVisible(True)
+            for item in self.border_items.get(index, ()):
+                item.setVisible(True)
+        self.shape_fill.clear()
+        self.shape_hidden.clear()
+        self.backdrop.clear()
+        self.schedule_backdrop()
             
     def show_hide_map(self):
         self.display = not self.display
         self.polygons.show() if self.display else self.polygons.hide()
         
     def delete_map(self):
+        self.scheduler.cancel('map')
+        self.redrawing = False
+        self.hide_backdrop()
+        self.scheduler.cancel('backdrop')
         self.scene.removeItem(self.polygons)
             
     def redraw_map(self):
+        self.backdrop.clear()
         self.delete_map()
-        self.polygons = self.scene.createItemGroup(self.draw_polygons())
+        self.shape_items.clear()
+        # the items of the tiles were removed with the map
+        self.tile_items.clear()
+        self.border_items.clear()
+        self.tile_zoom = None
+        self.land_items = self.land_points = 0
+        self.polygons = self.scene.createItemGroup([])
         self.draw_water()
+        self.delete_layers()
+        # a new redraw supersedes the previous one
+        self.redrawing = True
+        self.schedule('map', self.redraw_map_task(), priority=0)
+        
+    def redraw_map_task(self):
+        yield from self.load_visible_shapes_task()
+        self.draw_layers()
+        yield
         # replace the nodes at their geographical location
-        self.move_to_geographical_coordinates()
+        yield from self.move_nodes_task()
+        self.draw_links()
+        self.draw_heatmap()
+        self.draw_measure()
+        self.draw_tracks()
+        self.schedule_backdrop()
+        self.redrawing = False
         
 class Node(QGraphicsPixmapItem):
     
-    def __init__(self, controller, position):
+    def __init__(self, controller, position, coordinates=None):
         self.controller = controller
         self.view = controller.view
         self.view.nodes.add(self)
+        # geographical coordinates, when they are already known (bulk 
+        # creation): they are used instead of the inverse projection of 
+        # the initial position
+        self.coordinates = coordinates
+        # ID of the node in the node database, if there is one
+        self.store_id = None
+        # the label is only created when the node is visible (see 
+        # View.update_labels)
+        self.label = None
         # we retrieve the pixmap based on the subtype to initialize a QGPI
         self.pixmap = self.controller.gnode_pixmap
         self.selection_pixmap = self.controller.selected_gnode_pixmap                                                
@@ -323,23 +2034,67 @@ class Node(QGraphicsPixmapItem):
             else:
                 self.setPixmap(self.pixmap)
         if change == self.ItemPositionHasChanged:
-            x, y = self.pos().x(), self.pos().y()
-            lon, lat = self.view.to_geographical_coordinates(x, y)
-            lon, lat = round(lon, 4), round(lat, 4)
-            self.longitude, self.latitude = lon, lat
-            # when the node is created, the ItemPositionHasChanged is triggered:
-            # we create the label
-            if not hasattr(self, 'label'):
-                self.label = self.view.scene.addSimpleText('test')
-                self.label.setZValue(15)
-            self.label.setPos(self.pos() + QPoint(-70, 50))
-            self.label.setText('({}, {})'.format(lon, lat))
+            if self.coordinates:
+                lon, lat = self.coordinates
+                self.coordinates = None
+                self.longitude, self.latitude = round(lon, 4), round(lat, 4)
+            else:
+                x, y = self.pos().x(), self.pos().y()
+                lon, lat = self.view.to_geographical_coordinates(x, y)
+                self.longitude, self.latitude = round(lon, 4), round(lat, 4)
+                # the node was moved: its links must be updated
+                self.view.node_moved(self)
+            if self.label:
+                self.update_label()
         return QGraphicsPixmapItem.itemChange(self, change, value)
         
+    def update_label(self):
+        if not self.label:
+            self.label = self.view.scene.addSimpleText('')
+            self.label.setFlag(QGraphicsItem.ItemIgnoresTransformations, True)
+            self.label.setZValue(15)
+        self.label.setPos(self.pos() + QPoint(-70, 50))
+        self.label.setText('({}, {})'.format(self.longitude, self.latitude))
+        
+    def delete_label(self):
+        if self.label:
+            self.view.scene.removeItem(self.label)
+            self.label = None
+        
     def self_destruction(self):
-        self.view.scene.removeItem(self.label)
+        self.view.delete_links(self.view.node_links.pop(self, ()))
+        self.view.nodes.discard(self)
+        self.view.store_nodes.pop(self.store_id, None)
+        self.delete_label()
         self.view.scene.removeItem(self)
         
+class TrackItem(QGraphicsItem):
+    
+    # the points are drawn with a cosmetic pen: their size in pixels does 
+    # not depend on the zoom. Updating the item only copies the coordinates
+    # of the points in its polygon.
+    
+    def __init__(self):
+        super().__init__()
+        self.points, self.rect = QPolygonF(), QRectF()
+        self.pen = QPen(QColor(255, 69, 0), 8, Qt.SolidLine, Qt.RoundCap)
+        self.pen.setCosmetic(True)
+        self.setZValue(12)
+        
+    def set_points(self, xs, ys, margin):
+        # NaN: the node has no position at the playback time
+        visible = np.isfinite(xs) & np.isfinite(ys)
+        self.prepareGeometryChange()
+        self.points = to_qpolygon(np.column_stack((xs[visible], ys[visible])).ravel())
+        self.rect = self.points.boundingRect().adjusted(-margin, -margin, margin, margin)
+        
+    def boundingRect(self):
+        return self.rect
+        
+    def paint(self, painter, *_):
+        painter.setPen(self.pen)
+        painter.drawPoints(self.points)
+        
 class MainMenu(QWidget):
     
     def __init__(self, controller):
@@ -349,13 +2104,19 @@ class MainMenu(QWidget):
         self.setAcceptDrops(True)
                 
         node_creation_groupbox = NodeCreation(self.controller)
-        map_projection_groupbox = GISParametersMenu(self.controller)
+        link_groupbox = LinkMenu(self.controller)
+        self.map_projection_groupbox = GISParametersMenu(self.controller)
         node_deletion_groupbox = Deletion(self.controller)
+        self.attribute_groupbox = AttributeMenu(self.controller)
+        layer_groupbox = LayerMenu(self.controller)
         
         layout = QGridLayout(self)
         layout.addWidget(node_creation_groupbox)
-        layout.addWidget(map_projection_groupbox)
+        layout.addWidget(link_groupbox)
+        layout.addWidget(self.map_projection_groupbox)
         layout.addWidget(node_deletion_groupbox)
+        layout.addWidget(self.attribute_groupbox)
+        layout.addWidget(layer_groupbox)
         
 class NodeCreation(QGroupBox):
     
@@ -410,6 +2171,35 @@ class NodeCreation(QGroupBox):
             child.show()
             child.setPixmap(pixmap)
         
+class LinkMenu(QGroupBox):  
+
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+        self.view = controller.view
+        
+        link_nodes_button = QPushButton('Link selected nodes')
+        link_nodes_button.clicked.connect(self.view.link_selected_nodes)
+        import_links_button = QPushButton('Import links')
+        import_links_button.clicked.connect(self.import_links)
+        
+        layout = QGridLayout(self)
+        layout.addWidget(link_nodes_button, 0, 0)
+        layout.addWidget(import_links_button, 1, 0)
+        
+    def import_links(self):
+        filepath = QFileDialog.getOpenFileName(
+                                            self, 
+                                            'Import links', 
+                                            self.controller.path_projects
+                                            )[0]
+        if not filepath:
+            return
+        sheet = xlrd.open_workbook(filepath).sheet_by_index(0)
+        # the first row contains the column names
+        self.view.import_links([tuple(sheet.row_values(i)[:4]) 
+                                        for i in range(1, sheet.nrows)])
+        
 class GISParametersMenu(QGroupBox):  
 
     def __init__(self, controller):
@@ -430,6 +2220,8 @@ class GISParametersMenu(QGroupBox):
         draw_map_button.clicked.connect(self.redraw_map)
         show_hide_map_button = QPushButton('Show / Hide map')
         show_hide_map_button.clicked.connect(self.show_hide_map)
+        show_hide_heatmap_button = QPushButton('Show / Hide heatmap')
+        show_hide_heatmap_button.clicked.connect(self.view.show_hide_heatmap)
         
         layout = QGridLayout(self)
         layout.addWidget(choose_projection, 0, 0)
@@ -438,6 +2230,7 @@ class GISParametersMenu(QGroupBox):
         layout.addWidget(self.ratio_edit, 1, 1)
         layout.addWidget(draw_map_button, 2, 0, 1, 2)
         layout.addWidget(show_hide_map_button, 3, 0, 1, 2)
+        layout.addWidget(show_hide_heatmap_button, 4, 0, 1, 2)
         
     def redraw_map(self, _):
         self.view.ratio = 1/float(self.ratio_edit.text())
@@ -466,18 +2259,134 @@ class Deletion(QGroupBox):
         layout.addWidget(delete_map_button, 2, 0)
         
     def delete_selection(self):
-        for node in self.view.scene.selectedItems():
-            node.self_destruction()
+        self.view.delete_selected_nodes()
         
     def delete_all_nodes(self):
-        for node in self.view.nodes:
-            node.self_destruction()
+        # as if all the nodes were selected: the rows of the displayed nodes
+        # are deleted from the node database, those of the nodes that are
+        # paged out are kept
+        if self.view.node_store:
+            self.view.node_store.delete([node.store_id for node in self.view.nodes 
+                                                       if node.store_id is not None])
+        self.view.delete_all_nodes()
             
     def delete_map(self):
         self.view.delete_map()
         
+class AttributeMenu(QGroupBox):  
+
+    def __init__(self, controller):
+        super().__init__()
+        self.view = controller.view
+        
+        # choose the DBF field used for styling and filtering
+        choose_field = QLabel('Field')
+        self.field_list = QComboBox(self)
+        self.update_fields()
+        
+        color_button = QPushButton('Color by field')
+        color_button.clicked.connect(self.style_map)
+        
+        # filter expression: a value, or a comparison for numerical fields
+        self.filter_edit = QLineEdit()
+        filter_button = QPushButton('Filter')
+        filter_button.clicked.connect(self.filter_map)
+        reset_button = QPushButton('Reset style')
+        reset_button.clicked.connect(self.reset_style)
+        
+        layout = QGridLayout(self)
+        layout.addWidget(choose_field, 0, 0)
+        layout.addWidget(self.field_list, 0, 1)
+        layout.addWidget(color_button, 1, 0, 1, 2)
+        layout.addWidget(self.filter_edit, 2, 0, 1, 2)
+        layout.addWidget(filter_button, 3, 0, 1, 2)
+        layout.addWidget(reset_button, 4, 0, 1, 2)
+        
+    def update_fields(self):
+        self.field_list.clear()
+        if self.view.attributes:
+            self.field_list.addItems(self.view.attributes.fields)
+        
+    def style_map(self):
+        self.view.style_map(self.field_list.currentText())
+        
+    def filter_map(self):
+        self.view.filter_map(
+                             self.field_list.currentText(), 
+                             self.filter_edit.text()
+                             )
+                             
+    def reset_style(self):
+        self.view.reset_style()
+        
+class LayerMenu(QGroupBox):  
+
+    def __init__(self, controller):
+        super().__init__()
+        self.controller = controller
+        self.view = controller.view
+        
+        choose_layer = QLabel('Layer')
+        self.layer_list = QComboBox(self)
+        
+        # zoom range of the next layer (web map zoom levels, e.g '0-6')
+        zoom_range = QLabel('Zoom range')
+        self.zoom_edit = QLineEdit('0-')
+        
+        add_layer_button = QPushButton('Add layer')
+        add_layer_button.clicked.connect(self.add_layer)
+        show_hide_layer_button = QPushButton('Show / Hide layer')
+        show_hide_layer_button.clicked.connect(self.show_hide_layer)
+        remove_layer_button = QPushButton('Remove layer')
+        remove_layer_button.clicked.connect(self.remove_layer)
+        
+        layout = QGridLayout(self)
+        layout.addWidget(choose_layer, 0, 0)
+        layout.addWidget(self.layer_list, 0, 1)
+        layout.addWidget(zoom_range, 1, 0)
+        layout.addWidget(self.zoom_edit, 1, 1)
+        layout.addWidget(add_layer_button, 2, 0, 1, 2)
+        layout.addWidget(show_hide_layer_button, 3, 0, 1, 2)
+        layout.addWidget(remove_layer_button, 4, 0, 1, 2)
+        
+    def add_layer(self):
+        filepath = QFileDialog.getOpenFileName(
+                                            self, 
+                                            'Add layer', 
+                                            self.controller.path_shapefiles,
+                                            'Shapefile (*.shp)'
+                                            )[0]
+        if not filepath:
+            return
+        try:
+            min_zoom, max_zoom = parse_zoom_range(self.zoom_edit.text())
+        except ValueError:
+            warnings.warn('invalid zoom range (e.g 0-6)')
+            return
+        try:
+            self.view.add_layer(filepath, min_zoom, max_zoom)
+        except (OSError, ValueError, IndexError) as error:
+            QMessageBox.critical(
+                                 self.controller, 
+                                 'Add layer', 
+                                 'The shapefile cannot be opened: {}'.format(error)
+                                 )
+            return
+        self.update_layers()
+        
+    def show_hide_layer(self):
+        self.view.show_hide_layer(self.layer_list.currentText())
+        
+    def remove_layer(self):
+        self.view.remove_layer(self.layer_list.currentText())
+        self.update_layers()
+        
+    def update_layers(self):
+        self.layer_list.clear()
+        self.layer_list.addItems([layer.name for layer in self.view.layers])
+        self.layer_list.setCurrentIndex(self.layer_list.count() - 1)
+        
 if str.__eq__(__name__, '__main__'):
-    import sys
     pyGISS = QApplication(sys.argv)
     pyGISS.setStyle(QStyleFactory.create('Fusion'))
     path_app = dirname(abspath(stack()[0][1]))
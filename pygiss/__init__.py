@@ -0,0 +1 @@
+# GUI-independent helpers shared by the tkinter and pyQT versions of pyGISS
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+import numpy as np
+
+class BackdropCache(object):
+
+    # raster images of the land and water layers, used instead of the
+    # polygons while the user zooms and pans. An image is identified by
+    # its projection and the scale it was rendered at (the least recently
+    # used images are discarded), and its bounds are expressed in a 
+    # coordinate system that does not depend on the zoom level: during a
+    # zoom, the image of the nearest scale is scaled.
+
+    def __init__(self, levels=4):
+        self.levels = levels
+        self.images, self.sizes = OrderedDict(), {}
+
+    def nearest(self, projection, scale):
+        # (image, bounds, scale) of the projection with the nearest scale
+        levels = [level for level in self.images if level[0] == projection]
+        if not levels:
+            return None
+        level = min(levels, key=lambda level: abs(np.log(level[1]/scale)))
+        self.images.move_to_end(level)
+        image, bounds = self.images[level]
+        return image, bounds, level[1]
+
+    def put(self, level, image, bounds, size=0):
+        # the size of the image (in bytes) is used for memory accounting
+        self.images[level] = image, tuple(bounds)
+        self.sizes[level] = size
+        self.images.move_to_end(level)
+        while len(self.images) > self.levels:
+            level, _ = self.images.popitem(last=False)
+            del self.sizes[level]
+
+    def nbytes(self):
+        return sum(self.sizes.values())
+
+    def clear(self):
+        self.images.clear()
+        self.sizes.clear()
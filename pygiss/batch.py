@@ -0,0 +1,167 @@
+import csv
+import time
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from os.path import abspath, dirname, join
+import numpy as np
+from PIL import Image, ImageDraw
+from pyproj import Proj
+from pygiss.fastproj import project_rings
+from pygiss.projections import definitions
+from pygiss.shx import ShapeIndex
+
+# batch rendering of maps without GUI: each row of the manifest (CSV file)
+# describes an image:
+# shapefile,projection,center_lon,center_lat,ratio,nodes,output[,width,height]
+# 'projection' is the name of a projection of the tkinter or pyQt version,
+# or a PROJ string, 'ratio' the number of pixels per projected meter (the
+# zoom level of the GUIs), and 'nodes' an optional .xls or .csv file with
+# the longitude and latitude of the nodes in the first two columns.
+# The shapefiles are parsed once in the main process and shared with the
+# worker processes, which cache the projected rings per projection.
+
+water_color, land_color, node_color = (64, 164, 223), (52, 165, 111), (200, 30, 30)
+
+# pre-parsed geometry (shapefile -> exterior rings) shared by the workers;
+# the projections, the projected rings and the nodes are cached per worker
+geometries, projected, cache = {}, {}, {}
+
+def parse_shapefile(filepath):
+    index = ShapeIndex(filepath)
+    rings = [ring for i in range(len(index.bboxes)) for ring in index.rings(i)]
+    index.close()
+    return rings
+
+def share_geometries(shared):
+    geometries.update(shared)
+
+def get_projection(name):
+    if name not in cache:
+        cache[name] = Proj(definitions.get(name, name))
+    return cache[name]
+
+def get_nodes(filepath):
+    if filepath not in cache:
+        cache[filepath] = read_nodes(filepath)
+    return cache[filepath]
+
+def read_nodes(filepath):
+    if filepath.endswith('.csv'):
+        with open(filepath) as file:
+            rows = list(csv.reader(file))[1:]
+        longitudes = [float(row[0]) for row in rows]
+        latitudes = [float(row[1]) for row in rows]
+    else:
+        import xlrd
+        sheet = xlrd.open_workbook(filepath).sheet_by_index(0)
+        # the first row contains the column names
+        longitudes, latitudes = sheet.col_values(0, 1), sheet.col_values(1, 1)
+    return np.array(longitudes, dtype=np.float64), np.array(latitudes, dtype=np.float64)
+
+def draw_water(draw, projection, to_pixels):
+    # the water is the disk of the azimuthal projections, and the
+    # projected bounds of the map otherwise
+    parameters = projection.crs.to_dict()
+    if parameters.get('proj') in ('ortho', 'laea'):
+        # the disk is centered on the center of the projection
+        cx, cy = projection(parameters.get('lon_0', 0), parameters.get('lat_0', 0))
+        radius = projection.crs.ellipsoid.semi_major_metre
+        if parameters['proj'] == 'laea':
+            radius *= 2
+        x0, y0 = to_pixels(np.array([cx - radius]), np.array([cy + radius]))
+        x1, y1 = to_pixels(np.array([cx + radius]), np.array([cy - radius]))
+        draw.ellipse((x0[0], y0[0], x1[0], y1[0]), fill=water_color, outline='black')
+    else:
+        xs, ys = projection([-180, 180], [84, -84])
+        x, y = to_pixels(np.array(xs), np.array(ys))
+        draw.rectangle((x[0], y[0], x[1], y[1]), fill=water_color, outline='black')
+
+def render(job):
+    start = time.time()
+    projection = get_projection(job['projection'])
+    width, height = int(job.get('width') or 1300), int(job.get('height') or 800)
+    ratio = float(job['ratio'])
+    cx, cy = projection(float(job['center_lon']), float(job['center_lat']))
+    to_pixels = lambda xs, ys: ((xs - cx)*ratio + width/2, (cy - ys)*ratio + height/2)
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    draw_water(draw, projection, to_pixels)
+    key = job['shapefile'], job['projection']
+    if key not in projected:
+        projected[key] = project_rings(projection, geometries[job['shapefile']])
+    for xs, ys in projected[key]:
+        finite = np.isfinite(xs) & np.isfinite(ys) & (np.abs(xs) < 1e+10)
+        if finite.sum() < 3:
+            continue
+        x, y = to_pixels(xs[finite], ys[finite])
+        # rings outside of the image are not drawn
+        if x.max() < 0 or y.max() < 0 or x.min() > width or y.min() > height:
+            continue
+        draw.polygon(np.column_stack((x, y)).ravel().tolist(),
+                                        fill=land_color, outline='black')
+    nodes = 0
+    if job.get('nodes'):
+        longitudes, latitudes = get_nodes(job['nodes'])
+        with np.errstate(invalid='ignore'):
+            xs, ys = projection(longitudes, latitudes)
+        x, y = to_pixels(np.asarray(xs), np.asarray(ys))
+        visible = (np.isfinite(x) & np.isfinite(y) & (x > -5)
+                        & (y > -5) & (x < width + 5) & (y < height + 5))
+        for x, y in zip(x[visible].tolist(), y[visible].tolist()):
+            draw.ellipse((x - 4, y - 4, x + 4, y + 4), fill=node_color, outline='black')
+        nodes = int(visible.sum())
+    image.save(job['output'])
+    return job['output'], '{} nodes'.format(nodes), time.time() - start
+
+def render_job(job):
+    # a failing job is reported without stopping the others: returns 
+    # (output, report, duration, success)
+    try:
+        return render(job) + (True,)
+    except Exception as error:
+        return job.get('output'), 'failed: {!r}'.format(error), 0, False
+
+def read_manifest(filepath):
+    # paths are relative to the folder of the manifest
+    folder = dirname(abspath(filepath))
+    with open(filepath) as file:
+        jobs = list(csv.DictReader(file))
+    for job in jobs:
+        for field in ('shapefile', 'nodes', 'output'):
+            if job.get(field):
+                job[field] = join(folder, job[field])
+    return jobs
+
+def run(jobs, processes=None):
+    start = time.time()
+    shared, errors = {}, {}
+    for filepath in set(job['shapefile'] for job in jobs):
+        # a missing or unreadable shapefile fails the jobs that use it
+        try:
+            shared[filepath] = parse_shapefile(filepath)
+        except Exception as error:
+            errors[filepath] = error
+    for job in jobs:
+        if job['shapefile'] in errors:
+            error = errors[job['shapefile']]
+            print('{:.3f}s {} ({})'.format(0, job.get('output'), 'failed: {!r}'.format(error)))
+    # jobs with the same shapefile and projection are kept together, so
+    # that a worker projects the rings once for all of them
+    valid = sorted(
+                   (job for job in jobs if job['shapefile'] in shared),
+                   key=lambda job: (job['shapefile'], job['projection'])
+                   )
+    rendered, failed = 0, len(jobs) - len(valid)
+    with Pool(processes, initializer=share_geometries, initargs=(shared,)) as pool:
+        for output, report, duration, success in pool.imap_unordered(render_job, valid, chunksize=4):
+            print('{:.3f}s {} ({})'.format(duration, output, report))
+            rendered += success
+            failed += not success
+    print('{} images in {:.1f}s, {} failed'.format(rendered, time.time() - start, failed))
+
+if str.__eq__(__name__, '__main__'):
+    parser = ArgumentParser(description='render the maps of a manifest')
+    parser.add_argument('manifest', help='CSV file, one image per row')
+    parser.add_argument('--processes', type=int, default=None)
+    arguments = parser.parse_args()
+    run(read_manifest(arguments.manifest), arguments.processes)
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from os.path import exists, splitext
+from struct import unpack
+import numpy as np
+
+# sequential color ramp (light to dark green) for numerical fields
+# and qualitative palette for categorical fields
+sequential_palette = ('#edf8e9', '#bae4b3', '#74c476', '#31a354', '#006d2c')
+qualitative_palette = (
+                       '#8dd3c7', 
+                       '#ffffb3', 
+                       '#bebada', 
+                       '#fb8072', 
+                       '#80b1d3', 
+                       '#fdb462', 
+                       '#b3de69', 
+                       '#fccde5', 
+                       '#d9d9d9', 
+                       '#bc80bd'
+                       )
+# color of shapes whose value is missing
+missing_color = '#ffffff'
+
+class AttributeStore():
+    
+    # the .dbf file is never parsed as a whole: only the header is read
+    # when the store is created, and a column is extracted from a memory
+    # map of the records the first time it is requested, then cached as
+    # a typed numpy array
+    
+    def __init__(self, filepath):
+        self.filepath = splitext(filepath)[0] + '.dbf'
+        self.encoding = 'latin-1'
+        cpg = splitext(filepath)[0] + '.cpg'
+        if exists(cpg):
+            with open(cpg) as f:
+                self.encoding = f.read().strip() or self.encoding
+        self.fields, self.columns = OrderedDict(), {}
+        # numerical columns computed from the geometry (e.g the area)
+        self.computed = {}
+        with open(self.filepath, 'rb') as dbf:
+            self.size, self.header_length, self.record_length = unpack(
+                                                        '<4xIHH20x', 
+                                                        dbf.read(32)
+                                                        )
+            # the first byte of a record is the deletion flag
+            offset = 1
+            while True:
+                descriptor = dbf.read(32)
+                if not descriptor or descriptor[0] == 0x0D:
+                    break
+                name = descriptor[:11].split(b'\x00')[0].decode('ascii')
+                type = chr(descriptor[11])
+                length, decimal = descriptor[16], descriptor[17]
+                self.fields[name] = (type, offset, length, decimal)
+                offset += length
+                
+    def __len__(self):
+        return self.size
+        
+    def raw(self, field):
+        _, offset, length, _ = self.fields[field]
+        records = np.memmap(
+                            self.filepath, 
+                            dtype = np.uint8, 
+                            mode = 'r', 
+                            offset = self.header_length, 
+                            shape = (self.size, self.record_length)
+                            )
+        column = np.ascontiguousarray(records[:, offset:offset + length])
+        return np.char.strip(column.view('S{}'.format(length)).reshape(-1))
+        
+    def add_column(self, field, values):
+        self.fields[field] = ('N', None, None, None)
+        self.computed[field] = np.asarray(values, dtype=np.float64)
+        
+    def column(self, field):
+        if field in self.computed:
+            return self.computed[field]
+        if field not in self.columns:
+            type, *_ = self.fields[field]
+            values = self.raw(field)
+            if type in 'NFO':
+                values = self.to_float(values)
+            elif type == 'L':
+                values = np.isin(values, (b'T', b't', b'Y', b'y'))
+            else:
+                values = np.char.decode(values, self.encoding, 'replace')
+            self.columns[field] = values
+        return self.columns[field]
+        
+    def to_float(self, values):
+        values = values.copy()
+        values[values == b''] = b'nan'
+        try:
+            return values.astype(np.float64)
+        # fields that overflowed their width are filled with '*'
+        except ValueError:
+            result = np.full(len(values), np.nan)
+            for index, value in enumerate(values):
+                try:
+                    result[index] = float(value)
+                except ValueError:
+                    pass
+            return result
+            
+    def is_numerical(self, field):
+        return self.fields[field][0] in 'NFO'
+        
+    def classify(self, field, classes=len(sequential_palette)):
+        # returns the class of each record (-1 for missing values):
+        # quantiles for numerical fields, distinct values otherwise
+        values = self.column(field)
+        if self.is_numerical(field):
+            missing = np.isnan(values)
+            if missing.all():
+                return np.full(len(values), -1)
+            quantiles = np.linspace(0, 1, classes + 1)[1:-1]
+            bins = np.unique(np.quantile(values[~missing], quantiles))
+            return np.where(missing, -1, np.digitize(values, bins))
+        _, inverse = np.unique(values, return_inverse=True)
+        return np.where(values == '', -1, inverse.reshape(-1))
+        
+    def colors(self, field):
+        palette = (
+                   sequential_palette 
+                   if self.is_numerical(field) 
+                   else qualitative_palette
+                   )
+        classes = self.classify(field)
+        colors = np.array(palette + (missing_color,))
+        return colors[np.where(classes < 0, len(palette), classes % len(palette))]
+        
+    def select(self, field, expression):
+        # an expression is either a value ('Europe') or, for numerical 
+        # fields, a comparison ('> 1e8', '<= 5', '!= 0')
+        values, expression = self.column(field), expression.strip()
+        if self.is_numerical(field):
+            for operator in ('<=', '>=', '!=', '==', '<', '>'):
+                if expression.startswith(operator):
+                    threshold = float(expression[len(operator):])
+                    return {
+                            '<=': np.less_equal,
+                            '>=': np.greater_equal,
+                            '!=': np.not_equal,
+                            '==': np.equal,
+                            '<': np.less,
+                            '>': np.greater
+                            }[operator](values, threshold)
+            return values == float(expression)
+        return values == expression
@@ -0,0 +1,12 @@
+import numpy as np
+
+def project_rings(projection, rings):
+    # all rings (arrays of (longitude, latitude) points) are projected with
+    # a single call: returns the list of (xs, ys) arrays of each ring
+    if not rings:
+        return []
+    points = np.concatenate(rings)
+    with np.errstate(invalid='ignore'):
+        xs, ys = projection(points[:, 0], points[:, 1])
+    bounds = np.cumsum([len(ring) for ring in rings])[:-1]
+    return list(zip(np.split(np.asarray(xs), bounds), np.split(np.asarray(ys), bounds)))
@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+from argparse import ArgumentParser
+import numpy as np
+
+# a position update is a line 'node id,longitude,latitude': several
+# updates can be sent in the same UDP datagram, or appended to a file
+
+class PositionFeed():
+    
+    # updates are read by a background thread and coalesced in a buffer
+    # (only the last position of each node is kept): the GUI drains the 
+    # buffer once per frame, whatever the rate of the updates
+    
+    def __init__(self, port=None, filepath=None, host='127.0.0.1'):
+        self.buffer, self.lock = {}, threading.Lock()
+        self.running = True
+        if filepath:
+            self.source = open(filepath)
+            target = self.tail
+        else:
+            self.source = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # the port may be in use: the error is raised to the GUI
+            try:
+                self.source.bind((host, port))
+            except OSError:
+                self.source.close()
+                raise
+            self.source.settimeout(0.2)
+            target = self.listen
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+        
+    def parse(self, lines):
+        updates = {}
+        for line in lines:
+            try:
+                id, longitude, latitude = line.split(',')
+                updates[id.strip()] = float(longitude), float(latitude)
+            except ValueError:
+                continue
+        with self.lock:
+            self.buffer.update(updates)
+            
+    def listen(self):
+        while self.running:
+            try:
+                data = self.source.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.parse(data.decode('utf-8', 'replace').splitlines())
+            
+    def tail(self):
+        # only the lines appended after the feed was started are read
+        self.source.seek(0, 2)
+        # the writer may be in the middle of a line: the text after the
+        # last newline is kept, and completed by the next read
+        partial = ''
+        while self.running:
+            data = self.source.read()
+            if not data:
+                time.sleep(0.05)
+                continue
+            lines = (partial + data).split('\n')
+            partial = lines.pop()
+            self.parse(lines)
+                
+    def drain(self):
+        # ids, longitudes and latitudes of the nodes that moved since the
+        # last call
+        with self.lock:
+            buffer, self.buffer = self.buffer, {}
+        if not buffer:
+            return [], np.empty(0), np.empty(0)
+        ids = list(buffer)
+        coordinates = np.array(list(buffer.values()), dtype=np.float64)
+        return ids, coordinates[:, 0], coordinates[:, 1]
+        
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.source.close()
+        
+def publish(port, vehicles, rate, host='127.0.0.1'):
+    # stand-in publisher for tests: random walk of a fleet of vehicles, 
+    # sent as UDP datagrams of at most 500 updates
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    longitudes = np.random.uniform(-10, 30, vehicles)
+    latitudes = np.random.uniform(35, 60, vehicles)
+    period = 500/rate
+    while True:
+        indices = np.random.randint(0, vehicles, 500)
+        longitudes[indices] += np.random.normal(0, 0.01, 500)
+        latitudes[indices] += np.random.normal(0, 0.01, 500)
+        lines = '\n'.join(
+                          'vehicle{},{:.6f},{:.6f}'.format(i, longitudes[i], latitudes[i]) 
+                          for i in indices.tolist()
+                          )
+        sender.sendto(lines.encode('utf-8'), (host, port))
+        time.sleep(period)
+        
+if str.__eq__(__name__, '__main__'):
+    parser = ArgumentParser(description='publish random position updates')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--vehicles', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=5000, help='updates per second')
+    arguments = parser.parse_args()
+    publish(arguments.port, arguments.vehicles, arguments.rate)
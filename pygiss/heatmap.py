@@ -0,0 +1,77 @@
+import numpy as np
+
+# colormap of the heatmap: transparent blue for low densities, 
+# opaque red for high densities
+colormap = np.zeros((256, 4), dtype=np.uint8)
+ramp = np.linspace(0, 1, 256)
+colormap[:, 0] = np.clip(510*ramp, 0, 255)
+colormap[:, 1] = np.clip(255 - np.abs(510*ramp - 255), 0, 255)
+colormap[:, 2] = np.clip(255 - 510*ramp, 0, 255)
+colormap[:, 3] = np.clip(80 + 400*ramp, 0, 220)
+colormap[0] = 0
+
+def gaussian_blur(grid, sigma):
+    # separable convolution: one weighted sum of shifted views per 
+    # kernel coefficient and per axis
+    radius = max(1, int(3*sigma))
+    kernel = np.exp(-np.arange(-radius, radius + 1)**2/(2*sigma**2))
+    kernel /= kernel.sum()
+    for axis in (0, 1):
+        padding = [(0, 0), (0, 0)]
+        padding[axis] = (radius, radius)
+        padded, result = np.pad(grid, padding), np.zeros_like(grid)
+        size = grid.shape[axis]
+        for shift, weight in enumerate(kernel):
+            result += weight*padded.take(range(shift, shift + size), axis=axis)
+        grid = result
+    return grid
+    
+def density_image(xs, ys, x0, y0, x1, y1, width, height, cell=4, sigma=1.5):
+    # RGBA image (height, width, 4) of the density of the points (xs, ys) 
+    # in the rectangle (x0, y0, x1, y1), displayed on width x height pixels
+    columns, rows = max(1, -(-width//cell)), max(1, -(-height//cell))
+    ix = np.floor((xs - x0)*(columns/(x1 - x0))).astype(np.int64)
+    iy = np.floor((ys - y0)*(rows/(y1 - y0))).astype(np.int64)
+    inside = (ix >= 0) & (ix < columns) & (iy >= 0) & (iy < rows)
+    counts = np.bincount(
+                         iy[inside]*columns + ix[inside], 
+                         minlength = rows*columns
+                         ).reshape(rows, columns).astype(np.float64)
+    density = gaussian_blur(counts, sigma) if sigma else counts
+    if density.max() > 0:
+        density = np.log1p(density)/np.log1p(density.max())
+    image = colormap[(density*255).astype(np.uint8)]
+    image = image.repeat(cell, axis=0).repeat(cell, axis=1)
+    return np.ascontiguousarray(image[:height, :width])
+    
+class HeatmapLayer():
+    
+    # the projected coordinates of the points are cached per projection:
+    # zooming and panning only require an affine transformation and a
+    # 2D histogram
+    
+    def __init__(self):
+        self.set_points([], [])
+        
+    def set_points(self, longitudes, latitudes):
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.projected = {}
+        
+    def project(self, name, projection):
+        if name not in self.projected:
+            with np.errstate(invalid='ignore'):
+                px, py = projection(self.longitudes, self.latitudes)
+            px, py = np.asarray(px), np.asarray(py)
+            finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+            self.projected[name] = px[finite], py[finite]
+        return self.projected[name]
+        
+    def render(self, name, projection, ratio, offset, x0, y0, x1, y1, width, height):
+        px, py = self.project(name, projection)
+        return density_image(
+                             px*ratio + offset[0], 
+                             -py*ratio + offset[1], 
+                             x0, y0, x1, y1, 
+                             width, height
+                             )
@@ -0,0 +1,27 @@
+import numpy as np
+
+# labels are only displayed above this zoom level (canvas units per meter)
+label_ratio = 1/20000
+
+def declutter(x0, y0, x1, y1, cell=15):
+    # greedy placement of label boxes (x0, y0, x1, y1), sorted by priority:
+    # a label is displayed if none of the grid cells covered by its box is
+    # already occupied by a label with a higher priority
+    x0, y0 = np.asarray(x0, dtype=np.float64), np.asarray(y0, dtype=np.float64)
+    x1, y1 = np.asarray(x1, dtype=np.float64), np.asarray(y1, dtype=np.float64)
+    displayed = np.zeros(len(x0), dtype=bool)
+    if not len(x0):
+        return displayed
+    # cells covered by each box, relative to the top-left corner of the grid
+    left, top = x0.min(), y0.min()
+    c0 = ((x0 - left)//cell).astype(np.int64)
+    r0 = ((y0 - top)//cell).astype(np.int64)
+    c1 = ((x1 - left)//cell).astype(np.int64)
+    r1 = ((y1 - top)//cell).astype(np.int64)
+    occupied = np.zeros((r1.max() + 1, c1.max() + 1), dtype=bool)
+    for index, (a, b, c, d) in enumerate(zip(r0.tolist(), r1.tolist(), 
+                                             c0.tolist(), c1.tolist())):
+        if not occupied[a:b + 1, c:d + 1].any():
+            occupied[a:b + 1, c:d + 1] = True
+            displayed[index] = True
+    return displayed
@@ -0,0 +1,94 @@
+from itertools import count
+from math import inf, log2
+from os.path import basename, splitext
+from pygiss.memory import array_bytes
+from pygiss.shx import ShapeIndex
+
+def zoom_level(ratio):
+    # web map zoom level of a scale (pixels per projected meter): at zoom
+    # level 0, a pixel is 156543 meters wide, and each level halves it
+    return log2(156543.03392*ratio)
+
+# outline colors of the layers, in the order they are added
+layer_colors = ('#000000', '#b22222', '#1f4e9c', '#e07b00', '#6a3d9a', '#008b8b')
+
+def parse_zoom_range(text):
+    # 'min-max' (e.g '0-6'), 'min-' or '-max'
+    minimum, _, maximum = text.strip().partition('-')
+    return float(minimum or 0), float(maximum) if maximum.strip() else inf
+
+class Layer():
+
+    # a shapefile of the layer stack: it is only opened when it first
+    # becomes visible, and it is only visible between two zoom levels
+
+    ids = count()
+
+    def __init__(self, filepath, min_zoom=0, max_zoom=inf, z=0, color='#000000'):
+        self.id = next(self.ids)
+        self.filepath = filepath
+        self.name = splitext(basename(filepath))[0]
+        self.min_zoom, self.max_zoom = min_zoom, max_zoom
+        self.z, self.color = z, color
+        # the user can hide a layer regardless of the zoom level
+        self.displayed = True
+        self.index = None
+        # shapes of the layer that have been drawn, and the number of
+        # items and points created by the frontend (memory accounting)
+        self.drawn = set()
+        self.items = self.points = 0
+
+    def is_visible(self, zoom):
+        return self.displayed and self.min_zoom <= zoom <= self.max_zoom
+
+    def load(self):
+        if not self.index:
+            self.index = ShapeIndex(self.filepath)
+        return self.index
+
+    def unload(self):
+        if self.index:
+            self.index.close()
+        self.index = None
+        self.clear()
+
+    def clear(self):
+        # the items of the layer were deleted: its shapes must be drawn again
+        self.drawn.clear()
+        self.items = self.points = 0
+
+    def nbytes(self):
+        if not self.index:
+            return 0
+        return array_bytes(self.index.offsets, self.index.bboxes, self.index.types)
+
+class LayerStack():
+
+    # layers ordered by z (the last one is drawn on top)
+
+    def __init__(self):
+        self.layers = []
+
+    def __iter__(self):
+        return iter(self.layers)
+
+    def add(self, filepath, min_zoom=0, max_zoom=inf, z=None, color=None):
+        # the shapefile is opened once so that an invalid file raises an
+        # error before the layer is added: it is then only loaded when the
+        # layer becomes visible
+        ShapeIndex(filepath).close()
+        if z is None:
+            z = max((layer.z for layer in self.layers), default=-1) + 1
+        if color is None:
+            color = layer_colors[len(self.layers) % len(layer_colors)]
+        layer = Layer(filepath, min_zoom, max_zoom, z, color)
+        self.layers.append(layer)
+        self.layers.sort(key=lambda layer: layer.z)
+        return layer
+
+    def remove(self, layer):
+        layer.unload()
+        self.layers.remove(layer)
+
+    def find(self, name):
+        return next((layer for layer in self.layers if layer.name == name), None)
@@ -0,0 +1,108 @@
+import numpy as np
+from pyproj import Geod
+
+geod = Geod(ellps='WGS84')
+
+def densify(lons1, lats1, lons2, lats2, points=32):
+    # great-circle arcs between (lons1, lats1) and (lons2, lats2), as 
+    # (n, points) arrays of longitudes and latitudes. Geod.npts works on 
+    # one arc at a time: instead, we compute the azimuth and length of all 
+    # arcs at once, then all intermediate points with a single Geod.fwd
+    lons1, lats1 = np.asarray(lons1, dtype=np.float64), np.asarray(lats1, dtype=np.float64)
+    lons2, lats2 = np.asarray(lons2, dtype=np.float64), np.asarray(lats2, dtype=np.float64)
+    azimuths, _, distances = geod.inv(lons1, lats1, lons2, lats2)
+    fractions = np.linspace(0, 1, points)
+    shape = (len(lons1), points)
+    lons, lats, _ = geod.fwd(
+                             np.broadcast_to(lons1[:, None], shape).ravel(),
+                             np.broadcast_to(lats1[:, None], shape).ravel(),
+                             np.broadcast_to(azimuths[:, None], shape).ravel(),
+                             (distances[:, None]*fractions).ravel()
+                             )
+    return lons.reshape(shape), lats.reshape(shape)
+    
+def split_paths(lons, xs, ys):
+    # each arc is split where it crosses the antimeridian (jump in longitude)
+    # or goes beyond the horizon (points that cannot be projected): returns,
+    # for each arc, the list of its flat [x0, y0, x1, y1, ...] arrays
+    with np.errstate(invalid='ignore'):
+        finite = np.isfinite(xs) & np.isfinite(ys) & (np.abs(xs) < 1e+10)
+    # a segment starts at a visible point that is the first point of the 
+    # arc, or follows an invisible point or a jump in longitude
+    starts = finite.copy()
+    starts[:, 1:] &= ~finite[:, :-1] | (np.abs(np.diff(lons, axis=1)) > 180)
+    rows = np.broadcast_to(np.arange(len(lons))[:, None], lons.shape)[finite]
+    coordinates = np.column_stack((xs[finite], ys[finite]))
+    boundaries = np.flatnonzero(starts[finite])
+    ends = np.append(boundaries[1:], len(coordinates))
+    paths = [[] for _ in range(len(lons))]
+    for row, start, end in zip(rows[boundaries].tolist(), boundaries.tolist(), ends.tolist()):
+        if end - start > 1:
+            paths[row].append(coordinates[start:end].ravel())
+    return paths
+    
+class LinkLayer():
+    
+    # densified arcs of the links, and their projected coordinates cached 
+    # per projection: when a node moves, only its links are updated
+    
+    def __init__(self, points=32):
+        self.points = points
+        self.keys, self.rows = [], {}
+        self.lons = np.empty((0, points))
+        self.lats = np.empty((0, points))
+        self.projected = {}
+        
+    def __contains__(self, key):
+        return key in self.rows
+        
+    def add(self, keys, lons1, lats1, lons2, lats2):
+        lons, lats = densify(lons1, lats1, lons2, lats2, self.points)
+        for key in keys:
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+        self.lons = np.concatenate((self.lons, lons))
+        self.lats = np.concatenate((self.lats, lats))
+        self.projected.clear()
+        
+    def move(self, keys, lons1, lats1, lons2, lats2):
+        rows = np.array([self.rows[key] for key in keys], dtype=np.int64)
+        lons, lats = densify(lons1, lats1, lons2, lats2, self.points)
+        self.lons[rows], self.lats[rows] = lons, lats
+        # only the moved arcs are projected again
+        for name, (projection, xs, ys) in self.projected.items():
+            xs[rows], ys[rows] = self.project_arcs(projection, lons, lats)
+            
+    def remove(self, keys):
+        removed = set(keys) & set(self.rows)
+        if not removed:
+            return
+        kept = np.array([key not in removed for key in self.keys], dtype=bool)
+        self.keys = [key for key in self.keys if key not in removed]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.lons, self.lats = self.lons[kept], self.lats[kept]
+        for name, (projection, xs, ys) in list(self.projected.items()):
+            self.projected[name] = projection, xs[kept], ys[kept]
+        
+    def project_arcs(self, projection, lons, lats):
+        with np.errstate(invalid='ignore'):
+            xs, ys = projection(lons.ravel(), lats.ravel())
+        return np.reshape(xs, lons.shape), np.reshape(ys, lons.shape)
+        
+    def paths(self, name, projection, ratio, offset, keys=None):
+        # canvas coordinates of the segments of each link
+        if name not in self.projected:
+            self.projected[name] = (projection,) + self.project_arcs(
+                                                                     projection, 
+                                                                     self.lons, 
+                                                                     self.lats
+                                                                     )
+        _, xs, ys = self.projected[name]
+        keys = self.keys if keys is None else keys
+        rows = np.array([self.rows[key] for key in keys], dtype=np.int64)
+        paths = split_paths(
+                            self.lons[rows], 
+                            xs[rows]*ratio + offset[0], 
+                            -ys[rows]*ratio + offset[1]
+                            )
+        return dict(zip(keys, paths))
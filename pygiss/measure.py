@@ -0,0 +1,126 @@
+import numpy as np
+from pyproj import Geod
+from pygiss.shx import point_types
+
+# geodesic measurements on the WGS84 ellipsoid. The distances are computed
+# with a single pyproj call for all segments. The areas are computed with
+# numpy on the authalic sphere (the sphere with the same area as the
+# ellipsoid, latitudes being converted to authalic latitudes), which is
+# exact for the area of the ellipsoid and differs from the geodesic area
+# only by the shape of the edges (relative difference below 1e-6 for the
+# countries).
+
+geod = Geod(ellps='WGS84')
+
+# geodesic area (m²) and perimeter (m) of the shapes, per shapefile
+measures = {}
+
+def authalic(latitudes, geod=geod):
+    # authalic latitudes (radians) and radius of the authalic sphere
+    e = np.sqrt(geod.es)
+    def q(sin):
+        return (1 - e**2)*(sin/(1 - (e*sin)**2)
+                    - np.log((1 - e*sin)/(1 + e*sin))/(2*e))
+    qp = q(1.)
+    ratio = np.clip(q(np.sin(np.radians(latitudes)))/qp, -1, 1)
+    return np.arcsin(ratio), geod.a*np.sqrt(qp/2)
+
+def shape_rings(index):
+    # all rings of all shapes (holes included), and the shape of each ring
+    rings, owners = [], []
+    for i in range(len(index)):
+        shape = index.shape(i)
+        if shape.shapeType in point_types or not shape.points:
+            continue
+        points = np.array(shape.points, dtype=np.float64)[:, :2]
+        bounds = list(shape.parts) + [len(points)]
+        for start, end in zip(bounds, bounds[1:]):
+            rings.append(points[start:end])
+            owners.append(i)
+    return rings, owners
+
+def shape_measures(index):
+    if index.filepath not in measures:
+        measures[index.filepath] = measure_shapes(index)
+    return measures[index.filepath]
+
+def measure_shapes(index):
+    # areas are 0 for polylines, whose perimeter is their length
+    areas, perimeters = np.zeros(len(index)), np.zeros(len(index))
+    rings, owners = shape_rings(index)
+    if not rings:
+        return areas, perimeters
+    points = np.concatenate(rings)
+    lengths = np.array([len(ring) for ring in rings])
+    ends = np.cumsum(lengths)
+    owner = np.repeat(owners, lengths)
+    polygon = np.isin(index.types[owner], (5, 15, 25))
+    # each point is linked to the next point of its ring: the last point
+    # is linked to the first one for polygons, and to itself otherwise
+    following = np.arange(1, len(points) + 1)
+    following[ends - 1] = np.where(polygon[ends - 1], ends - lengths, ends - 1)
+    lons, lats = points[:, 0], points[:, 1]
+    _, _, distances = geod.inv(lons, lats, lons[following], lats[following])
+    perimeters = np.bincount(owner, distances, len(index))
+    # spherical excess of the triangle (pole, point, next point) of each
+    # edge: the sum over a ring is its signed area (holes and exterior
+    # rings have opposite orientations)
+    beta, radius = authalic(lats)
+    t1, t2 = np.tan(beta/2), np.tan(beta[following]/2)
+    dlon = np.radians((lons[following] - lons + 180) % 360 - 180)
+    excess = 2*np.arctan2(np.tan(dlon/2)*(t1 + t2), 1 + t1*t2)
+    areas = np.abs(np.bincount(owner, np.where(polygon, excess, 0), len(index)))
+    return areas*radius**2, perimeters
+
+def path_lengths(longitudes, latitudes):
+    # geodesic length of each segment of a path
+    longitudes, latitudes = np.asarray(longitudes), np.asarray(latitudes)
+    if len(longitudes) < 2:
+        return np.zeros(0)
+    _, _, distances = geod.inv(longitudes[:-1], latitudes[:-1],
+                                            longitudes[1:], latitudes[1:])
+    return np.asarray(distances)
+
+def pairwise_distances(longitudes, latitudes, chunk=20000):
+    # geodesic distance of all pairs of points (i < j), in the order of
+    # numpy.triu_indices, yielded by blocks of rows of about chunk pairs:
+    # the pairs of a block are generated with the block, so that the
+    # memory does not grow with the square of the number of points
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    # number of pairs of each row, and index of the end of each row
+    counts = np.arange(len(longitudes) - 1, 0, -1)
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        offset = ends[start] - counts[start]
+        end = max(int(np.searchsorted(ends, offset + chunk, side='right')), start + 1)
+        first = np.repeat(np.arange(start, end), counts[start:end])
+        # the pairs of row i are (i, i + 1) ... (i, n - 1)
+        row_starts = np.repeat(ends[start:end] - counts[start:end] - offset, counts[start:end])
+        second = first + 1 + np.arange(len(first)) - row_starts
+        _, _, distances = geod.inv(
+                                   longitudes[first],
+                                   latitudes[first],
+                                   longitudes[second],
+                                   latitudes[second]
+                                   )
+        yield np.asarray(distances)
+        start = end
+
+def distance_summary(blocks):
+    # number of pairs, shortest, longest and mean distance of the blocks
+    # of pairwise_distances (a generator: one step per block)
+    pairs, total, shortest, longest = 0, 0., float('inf'), 0.
+    for distances in blocks:
+        pairs += len(distances)
+        total += distances.sum()
+        shortest = min(shortest, distances.min())
+        longest = max(longest, distances.max())
+        yield
+    return pairs, shortest, longest, total/pairs
+
+def format_distance(meters):
+    if meters < 1000:
+        return '{:.0f} m'.format(meters)
+    return '{:,.1f} km'.format(meters/1000)
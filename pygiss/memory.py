@@ -0,0 +1,117 @@
+import os
+import warnings
+from collections import OrderedDict
+import numpy as np
+
+def array_bytes(*objects):
+    # total size of the numpy arrays in (nested) lists, tuples and dicts
+    total = 0
+    for obj in objects:
+        if isinstance(obj, np.ndarray):
+            total += obj.nbytes
+        elif isinstance(obj, dict):
+            total += array_bytes(*obj.values())
+        elif isinstance(obj, (list, tuple)):
+            total += array_bytes(*obj)
+    return total
+
+def process_memory():
+    # resident set size of the process, in bytes (None if it is unknown,
+    # e.g on windows)
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def environment_budget():
+    # budget of the PYGISS_MEMORY_BUDGET environment variable, in bytes: 
+    # without a valid number of MB (e.g '512MB'), there is no budget
+    value = os.environ.get('PYGISS_MEMORY_BUDGET') or '0'
+    try:
+        budget = float(value)
+        if not 0 <= budget < float('inf'):
+            raise ValueError
+    except ValueError:
+        warnings.warn('invalid PYGISS_MEMORY_BUDGET (a number of MB): ' + value)
+        return 0
+    return budget*2**20
+
+class MemoryBudget():
+
+    # per-layer memory accounting: each layer is registered with a function
+    # that returns its (bytes, items). When the layers use more than the
+    # budget, the eviction steps (caches first, then degraded rendering)
+    # are applied one at a time, in the order of registration.
+    # The usage is the memory accounted by the layers, and not the resident
+    # memory of the process, which python rarely gives back to the system.
+    # A degrading step can be undone: the last one is undone when the usage,
+    # plus the memory that it freed, is below low_water times the budget.
+    # The budget (in MB) defaults to the PYGISS_MEMORY_BUDGET environment
+    # variable; without budget, nothing is evicted.
+
+    low_water = 0.8
+
+    def __init__(self, limit=None):
+        if limit is None:
+            limit = environment_budget()
+        self.limit = limit
+        self.layers, self.steps = OrderedDict(), OrderedDict()
+        # [name, usage before the step, memory freed] of the applied steps
+        # that can be undone, the last one last
+        self.applied = []
+
+    def register(self, name, measure):
+        self.layers[name] = measure
+
+    def add_step(self, name, step, undo=None):
+        # a step returns True if it freed something
+        self.steps[name] = step, undo
+
+    def report(self):
+        return [(name, *measure()) for name, measure in self.layers.items()]
+
+    def used(self):
+        return sum(size for _, size, _ in self.report())
+
+    def enforce(self):
+        # applies the first step that frees something: returns its name
+        if not self.limit:
+            return None
+        used = self.used()
+        if self.applied and self.applied[-1][2] is None:
+            # the memory freed by the last step is measured at the next
+            # check, once the map was drawn again
+            self.applied[-1][2] = max(self.applied[-1][1] - used, 0)
+        if used <= self.limit:
+            return None
+        for name, (step, undo) in self.steps.items():
+            if step():
+                if undo:
+                    self.applied.append([name, used, None])
+                return name
+        return None
+
+    def restore(self):
+        # undoes the last degrading step if there is room for it again: 
+        # returns its name
+        if not self.limit or not self.applied or self.applied[-1][2] is None:
+            return None
+        name, _, freed = self.applied[-1]
+        if self.used() + freed > self.low_water*self.limit:
+            return None
+        self.applied.pop()
+        _, undo = self.steps[name]
+        undo()
+        return name
+
+    def summary(self):
+        lines = ['{:<20} {:>10.1f} MB {:>10} items'.format(name, size/2**20, items)
+                                            for name, size, items in self.report()]
+        lines.append('{:<20} {:>10.1f} MB'.format('total', self.used()/2**20))
+        memory = process_memory()
+        if memory is not None:
+            lines.append('{:<20} {:>10.1f} MB'.format('process', memory/2**20))
+        budget = '{:.0f} MB'.format(self.limit/2**20) if self.limit else 'none'
+        lines.append('{:<20} {:>13}'.format('budget', budget))
+        return '\n'.join(lines)
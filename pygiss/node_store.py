@@ -0,0 +1,138 @@
+import sqlite3
+import numpy as np
+
+class NodeStore():
+    
+    # nodes stored in a SQLite database, with an R*Tree index on their
+    # geographical coordinates: the GUI only creates graphical items for
+    # the nodes of the visible area. The links between the nodes are 
+    # stored as well, so that they are drawn again when the nodes are.
+    
+    def __init__(self, filepath=':memory:'):
+        self.filepath = filepath
+        self.connection = sqlite3.connect(filepath)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS nodes (
+                id INTEGER PRIMARY KEY,
+                longitude REAL NOT NULL,
+                latitude REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS nodes_index USING rtree(
+                id, min_lon, max_lon, min_lat, max_lat
+            );
+            CREATE TABLE IF NOT EXISTS links (
+                source INTEGER,
+                destination INTEGER,
+                PRIMARY KEY (source, destination)
+            );
+            CREATE INDEX IF NOT EXISTS links_destination ON links (destination);
+            CREATE TEMP TABLE shown (id INTEGER PRIMARY KEY);
+        ''')
+        
+    def count(self):
+        # (no __len__: an empty database must not be falsy)
+        return self.connection.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
+        
+    def size(self):
+        # size of the database, in bytes (in memory for ':memory:')
+        pages, = self.connection.execute('PRAGMA page_count').fetchone()
+        page_size, = self.connection.execute('PRAGMA page_size').fetchone()
+        return pages*page_size
+        
+    def shrink(self):
+        # frees the page cache of the connection
+        self.connection.execute('PRAGMA shrink_memory')
+        
+    def insert(self, longitudes, latitudes):
+        longitudes = np.asarray(longitudes, dtype=np.float64).tolist()
+        latitudes = np.asarray(latitudes, dtype=np.float64).tolist()
+        start, = self.connection.execute(
+                                  'SELECT COALESCE(MAX(id), 0) + 1 FROM nodes'
+                                  ).fetchone()
+        ids = list(range(start, start + len(longitudes)))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO nodes VALUES (?, ?, ?)', 
+                zip(ids, longitudes, latitudes)
+                )
+            self.connection.executemany(
+                'INSERT INTO nodes_index VALUES (?, ?, ?, ?, ?)', 
+                zip(ids, longitudes, longitudes, latitudes, latitudes)
+                )
+        return np.array(ids, dtype=np.int64)
+        
+    def move(self, ids, longitudes, latitudes):
+        ids = np.asarray(ids, dtype=np.int64).tolist()
+        longitudes = np.asarray(longitudes, dtype=np.float64).tolist()
+        latitudes = np.asarray(latitudes, dtype=np.float64).tolist()
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE nodes SET longitude = ?, latitude = ? WHERE id = ?', 
+                zip(longitudes, latitudes, ids)
+                )
+            self.connection.executemany(
+                '''UPDATE nodes_index SET min_lon = ?, max_lon = ?, 
+                   min_lat = ?, max_lat = ? WHERE id = ?''', 
+                zip(longitudes, longitudes, latitudes, latitudes, ids)
+                )
+                
+    def delete(self, ids):
+        ids = [(id,) for id in np.asarray(ids, dtype=np.int64).tolist()]
+        with self.connection:
+            self.connection.executemany('DELETE FROM nodes WHERE id = ?', ids)
+            self.connection.executemany('DELETE FROM nodes_index WHERE id = ?', ids)
+            self.connection.executemany('DELETE FROM links WHERE source = ?', ids)
+            self.connection.executemany('DELETE FROM links WHERE destination = ?', ids)
+            
+    def add_links(self, sources, destinations):
+        # a link is stored once, from the lowest to the highest id
+        pairs = {
+                 (min(source, destination), max(source, destination))
+                 for source, destination in zip(
+                                                np.asarray(sources, dtype=np.int64).tolist(), 
+                                                np.asarray(destinations, dtype=np.int64).tolist()
+                                                )
+                 }
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO links VALUES (?, ?)', pairs)
+            
+    def links(self, ids):
+        # (source, destination) of the links between the given nodes
+        with self.connection:
+            self.connection.execute('DELETE FROM shown')
+            self.connection.executemany('INSERT OR IGNORE INTO shown VALUES (?)', 
+                        ((id,) for id in np.asarray(ids, dtype=np.int64).tolist()))
+        return self.connection.execute('''
+            SELECT links.source, links.destination FROM links 
+            JOIN shown AS sources ON sources.id = links.source
+            JOIN shown AS destinations ON destinations.id = links.destination
+            ''').fetchall()
+            
+    def query(self, min_lon, min_lat, max_lon, max_lat, limit=-1):
+        # ids, longitudes and latitudes of the nodes of the area
+        rows = self.connection.execute('''
+            SELECT nodes.id, nodes.longitude, nodes.latitude
+            FROM nodes_index JOIN nodes ON nodes.id = nodes_index.id
+            WHERE nodes_index.min_lon <= ? AND nodes_index.max_lon >= ?
+            AND nodes_index.min_lat <= ? AND nodes_index.max_lat >= ?
+            LIMIT ?''', (max_lon, min_lon, max_lat, min_lat, limit)
+            ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        ids, longitudes, latitudes = zip(*rows)
+        return (
+                np.array(ids, dtype=np.int64), 
+                np.array(longitudes), 
+                np.array(latitudes)
+                )
+                
+    def coordinates(self):
+        # longitudes and latitudes of all nodes
+        rows = self.connection.execute(
+                                  'SELECT longitude, latitude FROM nodes'
+                                  ).fetchall()
+        coordinates = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return coordinates[:, 0], coordinates[:, 1]
+                
+    def close(self):
+        self.connection.close()
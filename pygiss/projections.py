@@ -0,0 +1,17 @@
+from collections import OrderedDict
+from pyproj import Proj
+
+# the projections of the tkinter and pyQt versions and of the batch 
+# renderer, as PROJ definitions
+
+definitions = OrderedDict([
+('Spherical', '+proj=ortho +lat_0=48 +lon_0=17'),
+('Azimuthal orthographic', '+proj=ortho +lon_0=28 +lat_0=47'),
+('Mercator', '+init=epsg:3395'),
+('WGS84', '+init=epsg:3857'),
+('ETRS89 - LAEA Europe', '+init=EPSG:3035')
+])
+
+def projections(*names):
+    # pyproj projections of the given names (all of them by default)
+    return OrderedDict((name, Proj(definitions[name])) for name in names or definitions)
@@ -0,0 +1,70 @@
+import time
+import traceback
+import warnings
+
+class FrameScheduler():
+
+    # cooperative scheduling of the heavy canvas work: a task is a generator
+    # that yields between two slices of work. At each frame, the tasks are
+    # resumed for at most 'budget' seconds, then the GUI event loop handles
+    # the user input (wheel, mouse) until the next frame.
+    # A task is identified by a key: starting a task with the key of a
+    # pending task cancels it (a new redraw supersedes the previous one).
+    # The tasks with the lowest priority value are resumed first.
+
+    def __init__(self, budget=0.012):
+        self.budget = budget
+        self.tasks = {}
+        self.order = 0
+
+    def start(self, key, task, priority=1):
+        self.cancel(key)
+        # tasks of the same priority are resumed in the order they started
+        self.order += 1
+        self.tasks[key] = (priority, self.order), task
+
+    def cancel(self, key):
+        if key in self.tasks:
+            _, task = self.tasks.pop(key)
+            task.close()
+
+    def cancel_all(self, *kinds):
+        # the kind of a task is its key, or the first element of its key
+        # if it is a tuple (e.g ('import', 3)): without kinds, all tasks
+        # are cancelled
+        for key in list(self.tasks):
+            kind = key[0] if isinstance(key, tuple) else key
+            if not kinds or kind in kinds:
+                self.cancel(key)
+
+    def finish(self, key, task):
+        # the task may have been superseded while it was running
+        if key in self.tasks and self.tasks[key][1] is task:
+            del self.tasks[key]
+
+    def run(self):
+        # one frame: returns True if some tasks are still pending
+        deadline = time.perf_counter() + self.budget
+        while self.tasks and time.perf_counter() < deadline:
+            key = min(self.tasks, key=lambda key: self.tasks[key][0])
+            _, task = self.tasks[key]
+            try:
+                next(task)
+            except StopIteration:
+                self.finish(key, task)
+            except Exception:
+                # a failing task is dropped, and the other tasks go on: an
+                # exception must not reach the GUI event loop (it would
+                # abort the pyQt timer slot, or stop the tkinter frames)
+                self.finish(key, task)
+                warnings.warn('task {} failed:\n{}'.format(key, traceback.format_exc()))
+        return bool(self.tasks)
+
+def complete(task):
+    # runs a task to completion, without yielding to the event loop
+    for _ in task:
+        pass
+
+def slices(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
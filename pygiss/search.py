@@ -0,0 +1,117 @@
+import re
+import unicodedata
+from collections import defaultdict
+import numpy as np
+
+# text fields of the shapefiles that are indexed by default, if they exist
+search_fields = ('NAME', 'NAME_LONG', 'ADMIN', 'FORMAL_EN', 'ISO_A2', 'ISO_A3')
+
+# start of the words of a text ('st. kitts' has two words)
+word_start = re.compile(r'(?<![\w.])\w')
+
+def normalize(text):
+    # searches are case and accent insensitive
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+def default_fields(attributes):
+    fields = [field for field in search_fields if field in attributes.fields]
+    if not fields:
+        # the first text field of the shapefile
+        text_fields = [f for f, (type, *_) in attributes.fields.items() if type == 'C']
+        fields = text_fields[:1]
+    return fields
+
+def feature_entries(attributes, fields):
+    # one entry per record and field: the label of a record is the value
+    # of the first field, followed by the matched value if it differs
+    columns = [attributes.column(field) for field in fields]
+    entries = []
+    for index, name in enumerate(columns[0].tolist()):
+        for column in columns:
+            text = column[index]
+            if text:
+                label = name if text == name else '{} ({})'.format(name, text)
+                entries.append((text, label, index))
+    return entries
+
+class SearchIndex():
+
+    # incremental search: the words of the texts are sorted, so that the
+    # texts with a word starting with the query are found by bisection,
+    # and the texts are indexed by trigram, so that the texts containing
+    # the query are among the texts containing all its trigrams. Both
+    # searches only read the matching entries.
+
+    def __init__(self, entries):
+        # entries are (text, label, key): several entries may have the same
+        # key (e.g the name and the ISO code of a country)
+        self.texts, self.labels, self.keys = [], [], []
+        words, owners, trigrams = [], [], defaultdict(list)
+        for entry, (text, label, key) in enumerate(entries):
+            text = normalize(text)
+            self.texts.append(text)
+            self.labels.append(label)
+            self.keys.append(key)
+            for match in word_start.finditer(text):
+                words.append(text[match.start():])
+                owners.append(entry)
+            for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                trigrams[trigram].append(entry)
+        self.prefixes = self.sorted_words(self.texts, range(len(self.texts)))
+        self.words = self.sorted_words(words, owners)
+        self.trigrams = {
+                         trigram: np.array(entries, dtype=np.int64)
+                         for trigram, entries in trigrams.items()
+                         }
+
+    def __len__(self):
+        return len(self.texts)
+
+    def sorted_words(self, words, owners):
+        order = np.argsort(words, kind='stable') if words else np.zeros(0, int)
+        words = np.array(words)[order] if words else np.array([], dtype=str)
+        return words, np.array(owners, dtype=np.int64)[order]
+
+    def starting_with(self, words, query, chunk=64):
+        # entries of the words starting with the query, in alphabetical 
+        # order: they are read by chunks, since only the first ones are 
+        # usually needed
+        words, owners = words
+        start = np.searchsorted(words, query, 'left')
+        end = np.searchsorted(words, query + '\U0010ffff', 'left')
+        for position in range(start, end, chunk):
+            yield from owners[position:min(position + chunk, end)].tolist()
+
+    def search(self, query, limit=10):
+        # (label, key) of the matching entries, one per key: texts starting
+        # with the query first, then texts with a word starting with the
+        # query, then texts containing the query
+        query = normalize(query)
+        if not query or not len(self):
+            return []
+        results, seen = [], set()
+        def add(entries):
+            for entry in entries:
+                key = self.keys[entry]
+                if key not in seen:
+                    seen.add(key)
+                    results.append((self.labels[entry], key))
+                    if len(results) == limit:
+                        return True
+            return False
+        if (
+            add(self.starting_with(self.prefixes, query)) 
+            or add(self.starting_with(self.words, query)) 
+            or len(query) < 3
+            ):
+            return results
+        trigrams = [query[i:i + 3] for i in range(len(query) - 2)]
+        if any(trigram not in self.trigrams for trigram in trigrams):
+            return results
+        postings = sorted((self.trigrams[t] for t in set(trigrams)), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        add(e for e in candidates.tolist() if query in self.texts[e])
+        return results
@@ -0,0 +1,65 @@
+import zipfile
+import numpy as np
+
+# a session is stored as a .npz archive of plain arrays (no pickle), so 
+# that the node coordinates are restored with a single read per array
+session_version = 1
+
+def write_session(
+                 filepath, 
+                 longitudes, 
+                 latitudes, 
+                 selected, 
+                 projection, 
+                 ratio, 
+                 offset, 
+                 shapefile, 
+                 frontend, 
+                 view
+                 ):
+    # with a file object, numpy does not append '.npz' to the file name
+    with open(filepath, 'wb') as session:
+        np.savez(
+                 session,
+                 version = np.array(session_version),
+                 longitudes = np.asarray(longitudes, dtype=np.float64),
+                 latitudes = np.asarray(latitudes, dtype=np.float64),
+                 selected = np.asarray(selected, dtype=bool),
+                 projection = np.array(projection),
+                 ratio = np.array(ratio, dtype=np.float64),
+                 offset = np.array(offset, dtype=np.float64),
+                 shapefile = np.array(shapefile or ''),
+                 # the state of the view (scroll position, zoom) is specific
+                 # to the frontend that saved the session
+                 frontend = np.array(frontend),
+                 view = np.asarray(view, dtype=np.float64)
+                 )
+                 
+def read_session(filepath):
+    # the content errors of an invalid file are raised as a ValueError
+    try:
+        session = np.load(filepath, allow_pickle=False)
+    except (ValueError, zipfile.BadZipFile):
+        raise ValueError('not a session file')
+    if not isinstance(session, np.lib.npyio.NpzFile):
+        raise ValueError('not a session file')
+    with session:
+        if 'version' not in session.files:
+            raise ValueError('not a session file')
+        if int(session['version']) > session_version:
+            raise ValueError('unsupported session version')
+        try:
+            return {
+                    'longitudes': session['longitudes'],
+                    'latitudes': session['latitudes'],
+                    'selected': session['selected'],
+                    'projection': str(session['projection']),
+                    'ratio': float(session['ratio']),
+                    'offset': tuple(session['offset'].tolist()),
+                    'shapefile': str(session['shapefile']) or None,
+                    # older sessions do not store their frontend
+                    'frontend': str(session['frontend']) if 'frontend' in session.files else '',
+                    'view': session['view']
+                    }
+        except KeyError as error:
+            raise ValueError('missing array in the session: {}'.format(error))
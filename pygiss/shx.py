@@ -0,0 +1,90 @@
+from os.path import splitext
+import numpy as np
+import shapefile
+
+# shape types whose records start with a bounding box, and point types
+# whose records only contain the coordinates of the point
+point_types = (1, 11, 21)
+null_type = 0
+
+class ShapeIndex():
+    
+    # random access to the records of a shapefile: the .shx file gives 
+    # the offset of each record in the .shp file, which lets us read the 
+    # bounding box stored in the header of a record without parsing its 
+    # geometry. Geometries are parsed only for the shapes that intersect
+    # the area of interest.
+    
+    def __init__(self, filepath):
+        base = splitext(filepath)[0]
+        self.filepath = base + '.shp'
+        # the .shx header is 100 bytes long, followed by one (offset, length)
+        # pair of big-endian integers (in 16-bit words) per record
+        shx = np.fromfile(base + '.shx', dtype='>i4', offset=100).reshape(-1, 2)
+        self.offsets = shx[:, 0].astype(np.int64)*2
+        self.reader = None
+        self.read_bboxes()
+        
+    def __len__(self):
+        return len(self.offsets)
+        
+    def read_bboxes(self):
+        shp = np.memmap(self.filepath, dtype=np.uint8, mode='r')
+        # a record has an 8-byte header, followed by the shape type (4 bytes)
+        # and the bounding box (4 doubles): only these 36 bytes are read
+        headers = shp[self.offsets[:, None] + 8 + np.arange(36)]
+        self.types = headers[:, :4].copy().view('<i4').reshape(-1)
+        self.bboxes = headers[:, 4:].copy().view('<f8')
+        points = np.isin(self.types, point_types)
+        self.bboxes[points, 2:] = self.bboxes[points, :2]
+        self.bboxes[self.types == null_type] = np.nan
+        
+    def query(self, min_lon, min_lat, max_lon, max_lat):
+        # indices of the shapes whose bounding box intersects the area
+        # (comparisons with the NaN bounding boxes of null shapes are False)
+        b = self.bboxes
+        return np.flatnonzero(
+                              (b[:, 0] <= max_lon) & (b[:, 2] >= min_lon) 
+                            & (b[:, 1] <= max_lat) & (b[:, 3] >= min_lat)
+                              )
+        
+    def shape(self, index):
+        # pyshp seeks to the record with the .shx offsets
+        if not self.reader:
+            self.reader = shapefile.Reader(self.filepath)
+        return self.reader.shape(int(index))
+        
+    def rings(self, index, tolerance=0):
+        # exterior rings (polygons) or parts (polylines) of a shape, 
+        # as arrays of (longitude, latitude), optionally simplified
+        shape = self.shape(index)
+        if shape.shapeType in point_types or not shape.points:
+            return []
+        points = np.array(shape.points, dtype=np.float64)[:, :2]
+        bounds = list(shape.parts) + [len(points)]
+        rings = [points[start:end] for start, end in zip(bounds, bounds[1:])]
+        if shape.shapeType in (5, 15, 25):
+            # exterior rings are clockwise, holes counterclockwise
+            rings = [ring for ring in rings if signed_area(ring) <= 0]
+        if tolerance:
+            rings = [simplify(ring, tolerance) for ring in rings]
+        return rings
+        
+    def close(self):
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+        
+def simplify(ring, tolerance):
+    # the vertices are snapped to a grid whose cells are 'tolerance' degrees
+    # wide, and the consecutive vertices of a cell are merged (the first 
+    # and last vertices of the ring are kept)
+    cells = np.floor(ring/tolerance)
+    kept = np.ones(len(ring), dtype=bool)
+    kept[1:] = (cells[1:] != cells[:-1]).any(axis=1)
+    kept[-1] = True
+    return ring[kept]
+        
+def signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return (np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))/2
@@ -0,0 +1,228 @@
+import sqlite3
+import time
+import zlib
+from argparse import ArgumentParser
+from collections import OrderedDict
+from math import ceil, floor, log2
+from os.path import abspath
+import numpy as np
+
+# vector tile pyramid: a geographic quadtree where, at zoom level z, the
+# world is cut into 2^z x 2^z tiles (360/2^z degrees wide, 180/2^z degrees
+# high). A tile contains the shapes that intersect it, simplified to the
+# size of a pixel of a 256 pixels wide tile and clipped to the tile (plus
+# a margin of a few pixels): the lands as filled polygons, and their
+# outlines as lines, so that the edges of the tiles are not outlined.
+# The tiles are stored in a SQLite file (with the bounding box of each
+# shape, used to zoom to a shape), each as a zlib-compressed blob:
+# the number of parts (uint32), then the shape index (int32), the kind
+# (uint8) and the number of points (uint32) of each part, then the points,
+# quantized to 16 bits in the bounds of the tile.
+# Build the tiles of a shapefile with:
+# python -m pygiss.tiles countries.shp countries.tiles --max-zoom 6
+
+tile_size = 256
+margin = 4/tile_size
+land_part, border_part = 0, 1
+
+def tile_bounds(zoom, column, row):
+    # bounds of the tile, margin included
+    width, height = 360/2**zoom, 180/2**zoom
+    x0, y0 = -180 + (column - margin)*width, -90 + (row - margin)*height
+    return x0, y0, x0 + (1 + 2*margin)*width, y0 + (1 + 2*margin)*height
+
+def covering(zoom, min_lon, min_lat, max_lon, max_lat):
+    # (column, row) of the tiles that intersect the area
+    count = 2**zoom
+    columns = range(
+                    max(floor((min_lon + 180)*count/360), 0),
+                    min(floor((max_lon + 180)*count/360), count - 1) + 1
+                    )
+    rows = range(
+                 max(floor((min_lat + 90)*count/180), 0),
+                 min(floor((max_lat + 90)*count/180), count - 1) + 1
+                 )
+    return [(column, row) for column in columns for row in rows]
+
+def encode(parts, bounds):
+    x0, y0, x1, y1 = bounds
+    shapes = np.array([shape for shape, _, _ in parts], dtype='<i4')
+    kinds = np.array([kind for _, kind, _ in parts], dtype='u1')
+    counts = np.array([len(points) for _, _, points in parts], dtype='<u4')
+    points = np.concatenate([points for _, _, points in parts])
+    scale = np.array([x1 - x0, y1 - y0])
+    quantized = np.round((points - (x0, y0))/scale*65535).clip(0, 65535)
+    return zlib.compress(b''.join((
+                                   np.uint32(len(parts)).tobytes(),
+                                   shapes.tobytes(),
+                                   kinds.tobytes(),
+                                   counts.tobytes(),
+                                   quantized.astype('<u2').tobytes()
+                                   )))
+
+def decode(blob, bounds):
+    # list of (shape index, kind, array of (longitude, latitude))
+    x0, y0, x1, y1 = bounds
+    data = zlib.decompress(blob)
+    count = int(np.frombuffer(data, '<u4', 1)[0])
+    shapes = np.frombuffer(data, '<i4', count, 4)
+    kinds = np.frombuffer(data, 'u1', count, 4 + 4*count)
+    counts = np.frombuffer(data, '<u4', count, 4 + 5*count)
+    points = np.frombuffer(data, '<u2', offset=4 + 9*count).reshape(-1, 2)
+    points = points/65535*(x1 - x0, y1 - y0) + (x0, y0)
+    parts = np.split(points, np.cumsum(counts)[:-1]) if count else []
+    return list(zip(shapes.tolist(), kinds.tolist(), parts))
+
+def shape_geometries(rings, closed=True):
+    # polygon and outline of each exterior ring of a shape (polylines
+    # have no polygon)
+    from shapely.geometry import LineString, Polygon
+    geometries = []
+    for ring in rings:
+        if len(ring) < (4 if closed else 2):
+            continue
+        if not closed:
+            geometries.append((Polygon(), LineString(ring)))
+            continue
+        polygon = Polygon(ring)
+        # the simplification may create self-intersections
+        if not polygon.is_valid:
+            polygon = polygon.buffer(0)
+        geometries.append((polygon, LineString(ring)))
+    return geometries
+
+def clip_shape(geometries, bounds):
+    # parts of a shape in a tile
+    from shapely.geometry import box
+    tile, parts = box(*bounds), []
+    for polygon, line in geometries:
+        for kind, geometry in (
+                               (land_part, polygon.intersection(tile)),
+                               (border_part, line.intersection(tile))
+                               ):
+            for part in getattr(geometry, 'geoms', [geometry]):
+                if part.is_empty:
+                    continue
+                if part.geom_type == 'Polygon' and kind == land_part:
+                    parts.append((kind, np.array(part.exterior.coords)[:, :2]))
+                elif part.geom_type == 'LineString' and kind == border_part:
+                    parts.append((kind, np.array(part.coords)[:, :2]))
+    return parts
+
+def build(filepath, output, max_zoom=6):
+    from pygiss.shx import ShapeIndex
+    index = ShapeIndex(filepath)
+    connection = sqlite3.connect(output)
+    connection.executescript('''
+        DROP TABLE IF EXISTS tiles;
+        DROP TABLE IF EXISTS metadata;
+        DROP TABLE IF EXISTS bboxes;
+        CREATE TABLE tiles (
+            zoom INTEGER,
+            column INTEGER,
+            row INTEGER,
+            data BLOB,
+            PRIMARY KEY (zoom, column, row)
+        );
+        CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE bboxes (
+            shape INTEGER PRIMARY KEY,
+            min_lon REAL,
+            min_lat REAL,
+            max_lon REAL,
+            max_lat REAL
+        );
+    ''')
+    for zoom in range(max_zoom + 1):
+        start, tiles = time.time(), {}
+        # one pixel of a tile of the level
+        tolerance = 360/2**zoom/tile_size
+        for shape in range(len(index)):
+            geometries = shape_geometries(
+                                          index.rings(shape, tolerance),
+                                          index.types[shape] in (5, 15, 25)
+                                          )
+            if not geometries:
+                continue
+            for column, row in covering(zoom, *index.bboxes[shape]):
+                parts = clip_shape(geometries, tile_bounds(zoom, column, row))
+                tiles.setdefault((column, row), []).extend(
+                                (shape, kind, points) for kind, points in parts)
+        with connection:
+            connection.executemany(
+                'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                ((zoom, column, row, encode(parts, tile_bounds(zoom, column, row)))
+                            for (column, row), parts in tiles.items() if parts)
+                )
+        print('zoom {}: {} tiles in {:.1f}s'.format(zoom, len(tiles), time.time() - start))
+    with connection:
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', (
+                                    ('max_zoom', str(max_zoom)),
+                                    ('source', abspath(filepath))
+                                    ))
+        # the bounding boxes of null shapes are NaN (stored as NULL)
+        connection.executemany('INSERT INTO bboxes VALUES (?, ?, ?, ?, ?)', (
+                                    (shape, *bbox) for shape, bbox 
+                                    in enumerate(index.bboxes.tolist())
+                                    ))
+    connection.close()
+    index.close()
+
+class TileSource():
+
+    # the tiles of a pyramid are read when they cover the visible area,
+    # and the decoded tiles are kept in a LRU cache
+
+    def __init__(self, filepath, cache_size=256):
+        self.filepath = filepath
+        self.connection = sqlite3.connect(filepath)
+        metadata = dict(self.connection.execute('SELECT name, value FROM metadata'))
+        self.max_zoom, self.source = int(metadata['max_zoom']), metadata['source']
+        self.cache, self.cache_size = OrderedDict(), cache_size
+        self.bboxes = np.array(self.connection.execute(
+                    'SELECT min_lon, min_lat, max_lon, max_lat FROM bboxes ORDER BY shape'
+                    ).fetchall(), dtype=np.float64).reshape(-1, 4)
+
+    def zoom_for(self, ratio):
+        # lowest zoom level whose pixels are not larger than the pixels of
+        # the view ('ratio' pixels per projected meter, a degree being
+        # about 111 km)
+        degrees = 1/(ratio*111319.49)
+        zoom = ceil(log2(max(360/(tile_size*degrees), 1)))
+        return min(zoom, self.max_zoom)
+
+    def covering(self, zoom, min_lon, min_lat, max_lon, max_lat):
+        return [(zoom, column, row) for column, row
+                    in covering(zoom, min_lon, min_lat, max_lon, max_lat)]
+
+    def get(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        blob = self.connection.execute(
+                    'SELECT data FROM tiles WHERE zoom = ? AND column = ? AND row = ?',
+                    key
+                    ).fetchone()
+        parts = decode(blob[0], tile_bounds(*key)) if blob else []
+        self.cache[key] = parts
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return parts
+
+    def nbytes(self):
+        return sum(points.nbytes for parts in self.cache.values()
+                                        for _, _, points in parts)
+
+    def clear(self):
+        self.cache.clear()
+
+    def close(self):
+        self.connection.close()
+
+if str.__eq__(__name__, '__main__'):
+    parser = ArgumentParser(description='build the vector tiles of a shapefile')
+    parser.add_argument('shapefile')
+    parser.add_argument('output', help='SQLite file of the tiles')
+    parser.add_argument('--max-zoom', type=int, default=6)
+    arguments = parser.parse_args()
+    build(arguments.shapefile, arguments.output, arguments.max_zoom)
@@ -0,0 +1,226 @@
+import time
+from itertools import islice
+import numpy as np
+
+# timestamped node tracks: a CSV file with a header line and the columns
+# 'id,time,longitude,latitude', the time being either a number of seconds
+# or an ISO 8601 date (e.g 2018-07-30T14:05:00), and the id a string of
+# at most 64 characters
+
+def read_tracks_task(filepath, chunk=100000):
+    # the file is parsed by chunks of lines (one chunk per step): the ids
+    # are read as bytes and factorized per chunk, the other columns are
+    # parsed as floats, or as dates if the times are not numbers. 
+    # A malformed file raises a ValueError. Returns the TrackStore.
+    fields = [
+              ('id', 'S64'), 
+              ('time', np.float64), 
+              ('longitude', np.float64), 
+              ('latitude', np.float64)
+              ]
+    chunks, dates = [], False
+    with open(filepath, 'rb') as file:
+        next(file, None)
+        while True:
+            lines = list(islice(file, chunk))
+            if not lines:
+                break
+            try:
+                rows = parse_rows(lines, fields, dates)
+            except ValueError:
+                if dates or chunks:
+                    raise
+                dates = True
+                rows = parse_rows(lines, fields, dates)
+            names, nodes = np.unique(np.char.strip(rows['id']), return_inverse=True)
+            chunks.append((names, nodes.reshape(-1), rows))
+            yield
+    if not chunks:
+        raise ValueError('no position in ' + filepath)
+    # the ids of all chunks are factorized again from the ids of each chunk
+    names = np.unique(np.concatenate([names for names, _, _ in chunks]))
+    nodes = np.concatenate([
+                            np.searchsorted(names, chunk_names)[chunk_nodes] 
+                            for chunk_names, chunk_nodes, _ in chunks
+                            ])
+    columns = [
+               np.concatenate([rows[field] for _, _, rows in chunks]) 
+               for field in ('time', 'longitude', 'latitude')
+               ]
+    tracks = TrackStore(np.char.decode(names, 'utf-8'), nodes, *columns, dates)
+    yield
+    yield from tracks.resample_task()
+    return tracks
+
+def parse_rows(lines, fields, dates):
+    if not dates:
+        return np.loadtxt(lines, dtype=fields, delimiter=',', usecols=range(4), ndmin=1)
+    fields = [fields[0], ('time', 'S32')] + fields[2:]
+    rows = np.loadtxt(lines, dtype=fields, delimiter=',', usecols=range(4), ndmin=1)
+    times = np.char.strip(rows['time']).astype('datetime64[ms]').astype(np.int64)/1000
+    return {
+            'id': rows['id'], 
+            'time': times, 
+            'longitude': rows['longitude'], 
+            'latitude': rows['latitude']
+            }
+
+def format_time(seconds, dates=False):
+    if dates:
+        return str(np.datetime64(int(seconds), 's')).replace('T', ' ')
+    return '{:.0f} s'.format(seconds)
+
+def point_image(xs, ys, x0, y0, width, height, radius=3, color=(255, 69, 0, 255)):
+    # RGBA image (height, width, 4) of the points (xs, ys), drawn as squares
+    # of 2*radius + 1 pixels on a transparent background: the pixels of the
+    # points are set, then dilated along each axis
+    mask = np.zeros((height + 2*radius, width + 2*radius), dtype=bool)
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    ix = np.round(xs[finite] - x0).astype(np.int64) + radius
+    iy = np.round(ys[finite] - y0).astype(np.int64) + radius
+    inside = (ix >= 0) & (ix < mask.shape[1]) & (iy >= 0) & (iy < mask.shape[0])
+    mask[iy[inside], ix[inside]] = True
+    for axis in (0, 1):
+        dilated = mask.copy()
+        for shift in range(1, radius + 1):
+            dilated |= np.roll(mask, shift, axis) | np.roll(mask, -shift, axis)
+        mask = dilated
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[mask[radius:radius + height, radius:radius + width]] = color
+    return image
+
+class TrackStore():
+
+    # the positions are stored by column, sorted by node and time. They are
+    # resampled at once into frames (the position of every node at regular
+    # time steps, NaN when the node has no position), and the projected
+    # frames are cached per projection: a playback frame is interpolated
+    # between two projected frames, and zooming and panning only require
+    # an affine transformation.
+
+    def __init__(self, names, nodes, times, longitudes, latitudes, dates=False):
+        # nodes is the index of the name of each position
+        self.names, nodes = names, np.asarray(nodes, dtype=np.int64)
+        times = np.asarray(times, dtype=np.float64)
+        order = np.lexsort((times, nodes))
+        self.nodes, self.times = nodes[order], times[order]
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)[order]
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)[order]
+        self.dates = dates
+        self.start, self.end = float(times.min()), float(times.max())
+        # first and last position of each node
+        indices = np.arange(len(self.names))
+        self.first = np.searchsorted(self.nodes, indices, 'left')
+        self.last = np.searchsorted(self.nodes, indices, 'right') - 1
+        self.projected = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def resample_task(self, step=60, max_positions=4000000):
+        # the step is increased if there would be more than max_positions
+        # positions (nodes x frames)
+        frames = max(max_positions//len(self), 2)
+        self.step = max(step, (self.end - self.start)/(frames - 1), 1e-3)
+        count = int(np.ceil((self.end - self.start)/self.step)) + 1
+        self.frame_times = self.start + self.step*np.arange(max(count, 2))
+        frames = yield from self.interpolate_task(self.frame_times)
+        self.frame_longitudes, self.frame_latitudes = frames
+        self.projected = {}
+
+    def interpolate_task(self, times, chunk=250000):
+        # positions (frames x nodes) of all nodes at the given times: the
+        # positions are sorted by (node, time), so that the last position
+        # of a node before a time is found with a single binary search
+        span = self.end - self.start + 1
+        keys = self.nodes*span + (self.times - self.start)
+        queries = (np.arange(len(self))*span + (times[:, None] - self.start)).ravel()
+        nodes = np.tile(np.arange(len(self)), len(times))
+        longitudes = np.full(len(queries), np.nan, dtype=np.float32)
+        latitudes = np.full(len(queries), np.nan, dtype=np.float32)
+        for start in range(0, len(queries), chunk):
+            query, node = queries[start:start + chunk], nodes[start:start + chunk]
+            time = query - node*span + self.start
+            before = np.searchsorted(keys, query, 'right') - 1
+            # no position before the first or after the last position
+            valid = (before >= self.first[node]) & (time <= self.times[self.last[node]])
+            before = np.where(valid, before, self.first[node])
+            after = np.minimum(before + 1, self.last[node])
+            duration = self.times[after] - self.times[before]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                fraction = np.where(duration > 0, (time - self.times[before])/duration, 0)
+            # the longitude may cross the antimeridian
+            delta = (self.longitudes[after] - self.longitudes[before] + 180) % 360 - 180
+            longitude = (self.longitudes[before] + fraction*delta + 180) % 360 - 180
+            latitude = self.latitudes[before] + fraction*(
+                                        self.latitudes[after] - self.latitudes[before])
+            longitudes[start:start + chunk] = np.where(valid, longitude, np.nan)
+            latitudes[start:start + chunk] = np.where(valid, latitude, np.nan)
+            yield
+        shape = len(times), len(self)
+        return longitudes.reshape(shape), latitudes.reshape(shape)
+
+    def project(self, name, projection):
+        if name not in self.projected:
+            with np.errstate(invalid='ignore'):
+                px, py = projection(
+                                    self.frame_longitudes.ravel().astype(np.float64),
+                                    self.frame_latitudes.ravel().astype(np.float64)
+                                    )
+            px, py = np.asarray(px), np.asarray(py)
+            # points beyond the horizon cannot be projected
+            finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+            shape = self.frame_longitudes.shape
+            self.projected[name] = (
+                                    np.where(finite, px, np.nan).astype(np.float32).reshape(shape),
+                                    np.where(finite, py, np.nan).astype(np.float32).reshape(shape)
+                                    )
+        return self.projected[name]
+
+    def positions(self, name, projection, time):
+        # projected positions of the nodes at a time (NaN: no position),
+        # interpolated between the two frames around the time
+        px, py = self.project(name, projection)
+        position = np.clip((time - self.start)/self.step, 0, len(self.frame_times) - 1)
+        index = min(int(position), len(self.frame_times) - 2)
+        fraction = np.float32(position - index)
+        return (
+                px[index] + fraction*(px[index + 1] - px[index]),
+                py[index] + fraction*(py[index + 1] - py[index])
+                )
+
+    def nbytes(self):
+        arrays = [self.nodes, self.times, self.longitudes, self.latitudes,
+                                self.frame_longitudes, self.frame_latitudes]
+        arrays += [array for frames in self.projected.values() for array in frames]
+        return sum(array.nbytes for array in arrays)
+
+class Playback():
+
+    # playback clock: the time of the tracks advances with the real time,
+    # multiplied by the speed
+
+    def __init__(self, start, end, speed=60):
+        self.start, self.end = start, end
+        self.time, self.speed = start, speed
+        self.playing, self.clock = False, None
+
+    def play(self):
+        if self.time >= self.end:
+            self.time = self.start
+        self.playing, self.clock = True, time.perf_counter()
+
+    def pause(self):
+        self.playing = False
+
+    def seek(self, value):
+        self.time = min(max(value, self.start), self.end)
+
+    def advance(self):
+        # the playback stops at the end of the tracks
+        now = time.perf_counter()
+        if self.playing:
+            self.seek(self.time + (now - self.clock)*self.speed)
+            self.playing = self.time < self.end
+        self.clock = now
+        return self.time
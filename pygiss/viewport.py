@@ -0,0 +1,55 @@
+import numpy as np
+
+def geographic_bbox(projection, ratio, offset, x0, y0, x1, y1, samples=16):
+    # bounding box (min_lon, min_lat, max_lon, max_lat) of the canvas 
+    # rectangle (x0, y0, x1, y1): a grid of points of the rectangle is 
+    # converted to geographic coordinates, points outside the projection 
+    # domain (e.g. beyond the horizon of an orthographic projection) being
+    # discarded
+    xs, ys = np.meshgrid(np.linspace(x0, x1, samples), np.linspace(y0, y1, samples))
+    px, py = (xs.ravel() - offset[0])/ratio, (offset[1] - ys.ravel())/ratio
+    with np.errstate(invalid='ignore'):
+        lons, lats = projection(px, py, inverse=True)
+    lons, lats = np.asarray(lons), np.asarray(lats)
+    valid = np.isfinite(lons) & np.isfinite(lats) & (np.abs(lats) <= 90)
+    if not valid.any():
+        return None
+    min_lon, max_lon = float(lons[valid].min()), float(lons[valid].max())
+    min_lat, max_lat = float(lats[valid].min()), float(lats[valid].max())
+    # if a pole is visible, all longitudes are visible
+    for pole in (-90, 90):
+        with np.errstate(invalid='ignore'):
+            px, py = projection(0, pole)
+        cx, cy = px*ratio + offset[0], -py*ratio + offset[1]
+        if min(x0, x1) <= cx <= max(x0, x1) and min(y0, y1) <= cy <= max(y0, y1):
+            min_lon, max_lon = -180, 180
+            min_lat, max_lat = min(min_lat, pole), max(max_lat, pole)
+    # the grid sampling may miss the edge of a shape: we add a margin
+    margin = max(max_lon - min_lon, max_lat - min_lat)/samples
+    return (
+            max(min_lon - margin, -180), 
+            max(min_lat - margin, -90), 
+            min(max_lon + margin, 180), 
+            min(max_lat + margin, 90)
+            )
+
+def projected_bbox(projection, min_lon, min_lat, max_lon, max_lat, samples=8):
+    # bounding box (min_x, min_y, max_x, max_y) of a geographic bounding box
+    # in projected coordinates: a grid of points of the box is projected,
+    # points beyond the horizon being discarded
+    lons, lats = np.meshgrid(
+                             np.linspace(min_lon, max_lon, samples), 
+                             np.linspace(min_lat, max_lat, samples)
+                             )
+    with np.errstate(invalid='ignore'):
+        px, py = projection(lons.ravel(), lats.ravel())
+    px, py = np.asarray(px), np.asarray(py)
+    valid = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+    if not valid.any():
+        return None
+    return (
+            float(px[valid].min()), 
+            float(py[valid].min()), 
+            float(px[valid].max()), 
+            float(py[valid].max())
+            )
@@ -1,18 +1,20 @@
 import sys
 import tkinter as tk
 import warnings
+from collections import defaultdict
+from itertools import count
 from inspect import stack
 from os.path import abspath, dirname, pardir, join
-from PIL import ImageTk
-from tkinter import ttk, filedialog
+from PIL import Image, ImageDraw, ImageTk
+from tkinter import ttk, filedialog, messagebox, simpledialog
 try:
+    import numpy as np
     import pyproj
     import shapefile
-    import shapely.geometry
 except ImportError:
     from tkinter import messagebox
     tk.messagebox.showinfo('Some libraries are missing', 
-                    'Pyproj, Shapefile and Shapely are required (see README)')
+                    'Numpy, Pyproj and Shapefile are required (see README)')
     sys.exit(1)
 try:
     import xlrd
@@ -27,6 +29,37 @@ path_app = dirname(abspath(stack()[0][1]))
 if path_app not in sys.path:
     sys.path.append(path_app)
 
+# the pygiss package (shared by both versions) is in the parent folder
+path_parent = abspath(join(path_app, pardir))
+if path_parent not in sys.path:
+    sys.path.append(path_parent)
+
+from pygiss.backdrop import BackdropCache
+from pygiss.dbf import AttributeStore
+from pygiss.fastproj import project_rings
+from pygiss.feed import PositionFeed
+from pygiss.heatmap import HeatmapLayer
+from pygiss.labels import declutter, label_ratio
+from pygiss.layers import LayerStack, parse_zoom_range, zoom_level
+from pygiss.links import LinkLayer
+from pygiss.measure import (
+    distance_summary, 
+    format_distance, 
+    path_lengths, 
+    pairwise_distances, 
+    shape_measures
+)
+from pygiss.memory import MemoryBudget, array_bytes
+from pygiss.node_store import NodeStore
+from pygiss.projections import projections
+from pygiss.scheduler import FrameScheduler, complete, slices
+from pygiss.search import SearchIndex, default_fields, feature_entries
+from pygiss.session import read_session, write_session
+from pygiss.shx import ShapeIndex
+from pygiss.tiles import TileSource, border_part, land_part
+from pygiss.tracks import Playback, format_time, point_image, read_tracks_task
+from pygiss.viewport import geographic_bbox, projected_bbox
+
 class Controller(tk.Tk):
 
     def __init__(self, path_app):
@@ -57,6 +90,21 @@ class Controller(tk.Tk):
 
         menu = tk.Menu(self)
         menu.add_command(label="Import shapefile", command=self.map.import_map)
+        menu.add_command(label="Save session", command=self.map.save_session)
+        menu.add_command(label="Restore session", command=self.map.restore_session)
+        menu.add_command(label="Open node database", command=self.map.open_node_store)
+        menu.add_command(label="Start live feed", command=self.map.start_feed)
+        menu.add_command(label="Follow position file", command=self.map.follow_feed_file)
+        menu.add_command(label="Stop live feed", command=self.map.stop_feed)
+        menu.add_command(label="Memory usage", command=self.map.show_memory)
+        menu.add_command(label="Memory budget", command=self.map.set_memory_budget)
+        measure_menu = tk.Menu(menu, tearoff=0)
+        measure_menu.add_command(label="Measure shapes", command=self.map.measure_shapes)
+        measure_menu.add_command(label="Measure selected nodes", 
+                                        command=self.map.measure_selection)
+        measure_menu.add_command(label="Clear distance", command=self.map.clear_measure)
+        menu.add_cascade(label="Measure", menu=measure_menu)
+        menu.add_command(label="Import tracks", command=self.map.import_tracks)
         self.config(menu=menu)
 
         # if motion is called, the left-click button was released and we 
@@ -103,6 +151,22 @@ class Menu(tk.Frame):
         )
         import_nodes_button.grid(row=2, column=0, pady=5, in_=lf_creation)
 
+        link_nodes_button = ttk.Button(
+            self,
+            text='Link selected nodes',
+            command=controller.map.link_selected_nodes,
+            width=20
+        )
+        link_nodes_button.grid(row=3, column=0, pady=5, in_=lf_creation)
+
+        import_links_button = ttk.Button(
+            self,
+            text='Import links',
+            command=controller.map.import_links,
+            width=20
+        )
+        import_links_button.grid(row=4, column=0, pady=5, in_=lf_creation)
+
         lf_projection = ttk.Labelframe(
             self, 
             text = 'Projection management', 
@@ -146,6 +210,158 @@ class Menu(tk.Frame):
         )
         delete_selection.grid(row=1, column=0, pady=5, in_=lf_map_management)
 
+        show_hide_heatmap = ttk.Button(
+            self,
+            text='Show / hide heatmap',
+            command=controller.map.show_hide_heatmap,
+            width=20
+        )
+        show_hide_heatmap.grid(row=2, column=0, pady=5, in_=lf_map_management)
+
+        lf_attributes = ttk.Labelframe(
+            self, 
+            text = 'Attribute management', 
+            padding = (6, 6, 12, 12)
+        )
+        lf_attributes.grid(row=3, column=0, padx=5, pady=5)
+
+        self.field_list = ttk.Combobox(self, width=18)
+        self.field_list.grid(row=0, column=0, in_=lf_attributes)
+
+        color_by_field = ttk.Button(
+            self,
+            text='Color by field',
+            command=lambda: controller.map.style_map(self.field_list.get()),
+            width=20
+        )
+        color_by_field.grid(row=1, column=0, pady=5, in_=lf_attributes)
+
+        self.filter_entry = ttk.Entry(self, width=20)
+        self.filter_entry.grid(row=2, column=0, pady=5, in_=lf_attributes)
+
+        filter_button = ttk.Button(
+            self,
+            text='Filter',
+            command=lambda: controller.map.filter_map(
+                                                self.field_list.get(), 
+                                                self.filter_entry.get()
+                                                ),
+            width=20
+        )
+        filter_button.grid(row=3, column=0, pady=5, in_=lf_attributes)
+
+        reset_style = ttk.Button(
+            self,
+            text='Reset style',
+            command=controller.map.reset_style,
+            width=20
+        )
+        reset_style.grid(row=4, column=0, pady=5, in_=lf_attributes)
+
+        lf_search = ttk.Labelframe(
+            self, 
+            text = 'Search', 
+            padding = (6, 6, 12, 12)
+        )
+        lf_search.grid(row=5, column=0, padx=5, pady=5)
+
+        # indexed fields (e.g 'NAME, ISO_A3'): the index is built again 
+        # when the user presses enter
+        self.search_fields = ttk.Entry(self, width=20)
+        self.search_fields.bind('<Return>', lambda _: controller.map.index_features(
+            [field.strip() for field in self.search_fields.get().split(',')]
+        ))
+        self.search_fields.grid(row=0, column=0, pady=5, in_=lf_search)
+
+        # the results are updated at each keystroke, and the map zooms to
+        # the selected result (enter: the first result)
+        self.search_entry = ttk.Entry(self, width=20)
+        self.search_entry.bind('<KeyRelease>', 
+                        lambda _: controller.map.search(self.search_entry.get()))
+        self.search_entry.bind('<Return>', lambda _: controller.map.zoom_to_result(0))
+        self.search_entry.grid(row=1, column=0, pady=5, in_=lf_search)
+
+        self.search_results = tk.Listbox(self, width=22, height=5)
+        self.search_results.bind('<<ListboxSelect>>', controller.map.select_result)
+        self.search_results.grid(row=2, column=0, pady=5, in_=lf_search)
+
+        lf_layers = ttk.Labelframe(
+            self, 
+            text = 'Layer management', 
+            padding = (6, 6, 12, 12)
+        )
+        lf_layers.grid(row=4, column=0, padx=5, pady=5)
+
+        self.layer_list = ttk.Combobox(self, width=18)
+        self.layer_list.grid(row=0, column=0, in_=lf_layers)
+
+        # zoom range of the next layer (web map zoom levels, e.g '0-6')
+        self.zoom_entry = ttk.Entry(self, width=20)
+        self.zoom_entry.insert(0, '0-')
+        self.zoom_entry.grid(row=1, column=0, pady=5, in_=lf_layers)
+
+        add_layer = ttk.Button(
+            self,
+            text='Add layer',
+            command=controller.map.add_layer,
+            width=20
+        )
+        add_layer.grid(row=2, column=0, pady=5, in_=lf_layers)
+
+        show_hide_layer = ttk.Button(
+            self,
+            text='Show / hide layer',
+            command=lambda: controller.map.show_hide_layer(self.layer_list.get()),
+            width=20
+        )
+        show_hide_layer.grid(row=3, column=0, pady=5, in_=lf_layers)
+
+        remove_layer = ttk.Button(
+            self,
+            text='Remove layer',
+            command=lambda: controller.map.remove_layer(self.layer_list.get()),
+            width=20
+        )
+        remove_layer.grid(row=4, column=0, pady=5, in_=lf_layers)
+
+        lf_playback = ttk.Labelframe(
+            self, 
+            text = 'Track playback', 
+            padding = (6, 6, 12, 12)
+        )
+        lf_playback.grid(row=6, column=0, padx=5, pady=5)
+
+        play_tracks = ttk.Button(
+            self,
+            text='Play / pause',
+            command=controller.map.play_tracks,
+            width=20
+        )
+        play_tracks.grid(row=0, column=0, pady=5, in_=lf_playback)
+
+        # timeline of the tracks: the playback jumps to the chosen time
+        self.track_scale = ttk.Scale(
+            self, 
+            orient = 'horizontal', 
+            length = 150, 
+            command = controller.map.seek_tracks
+        )
+        self.track_scale.grid(row=1, column=0, pady=5, in_=lf_playback)
+
+        self.track_time = ttk.Label(self, text='')
+        self.track_time.grid(row=2, column=0, in_=lf_playback)
+
+        # seconds of the tracks per second of playback
+        self.track_speed = ttk.Combobox(
+            self, 
+            values = ('1', '10', '60', '600', '3600'), 
+            width = 18
+        )
+        self.track_speed.set('60')
+        self.track_speed.bind('<<ComboboxSelected>>', 
+                        lambda _: controller.map.set_track_speed(self.track_speed.get()))
+        self.track_speed.grid(row=3, column=0, pady=5, in_=lf_playback)
+
 
 class PSF_Object():
 
@@ -156,17 +372,29 @@ class PSF_Object():
         self.label_id = label_id
         self.x, self.y = x, y
         self.longitude, self.latitude = 0, 0
+        # ID of the node in the node database, if there is one
+        self.store_id = None
 
 
 class Map(tk.Canvas):
 
-    projections = {
-    'Mercator': pyproj.Proj(init="epsg:3395"),
-    'Azimuthal orthographic': pyproj.Proj('+proj=ortho +lon_0=28 +lat_0=47')
-    }
+    projections = projections('Mercator', 'Azimuthal orthographic')
 
     size = 10
 
+    # maximum number of nodes of the node database displayed at once
+    max_nodes = 5000
+
+    # delay between two frames of the live feed, in milliseconds
+    frame_delay = 33
+
+    # approximate memory of a node (python object, attributes, canvas item)
+    node_size = 600
+
+    # simplification of the map (in degrees) when the memory budget is 
+    # exceeded
+    simplification_levels = (0.05, 0.2, 0.5)
+
     def __init__(self, controller):
         super().__init__(controller, bg='white', width=1300, height=800)
         self.controller = controller
@@ -177,17 +405,97 @@ class Map(tk.Canvas):
         self.dict_start_position = {}
         self.selected_nodes = set()
         self.filepath = None
+        self.attributes = self.index = None
+        # shapes of the shapefile that have already been drawn
+        self.drawn_shapes = set()
+        # canvas items are pooled, since creating and deleting tk items 
+        # costs far more than moving them: the polygons of each shape are
+        # kept (hidden) when the map is redrawn, and updated in place. The 
+        # items of the deleted nodes and labels, and the polygons a shape 
+        # no longer needs, are hidden and reused by the next creations.
+        self.shape_items = {}
+        self.free_polygons, self.free_nodes, self.free_labels = [], [], []
+        self.water_id = None
+        # current fill color and visibility of each shape of the map
+        self.shape_fill, self.shape_hidden = {}, set()
+        # vector tiles (instead of a shapefile): the tiles of the zoom level
+        # that cover the visible area are drawn, and the tiles that leave
+        # it (or of another zoom level) are deleted
+        self.tiles, self.tile_zoom = None, None
+        # number of items and points of each drawn tile
+        self.drawn_tiles = {}
+        # optional node database: only the nodes of the visible area
+        # (plus a margin) are displayed
+        self.node_store = None
+        self.store_id_to_node = {}
+        # node density heatmap, displayed instead of the nodes: it is
+        # recomputed when the user stops zooming / panning
+        self.heatmap = self.heatmap_image = self.heatmap_job = None
+        # labels are only created for the visible nodes, once the 
+        # interaction is over
+        self.label_job = None
+        # great-circle links between nodes: a link is identified by the
+        # pair of nodes it connects, and drawn as one line per segment
+        # (arcs are split at the antimeridian and at the horizon)
+        self.links = LinkLayer()
+        self.link_items = {}
+        self.node_links = defaultdict(set)
+        # live position feed: the updates are applied once per frame
+        self.feed = self.feed_job = None
+        self.feed_nodes = {}
+        # node tracks played back over time: the positions of all nodes at
+        # the playback time are drawn at once in a raster image, updated in
+        # place at each frame
+        self.tracks = self.playback = self.track_job = None
+        self.track_image = None
+        # raster image of the land and water layers, displayed instead of
+        # the polygons while the user zooms and pans: during a zoom, the 
+        # image of the nearest zoom level is scaled, and a sharp image is 
+        # rendered once the interaction is over, from the projected rings
+        # of the drawn shapes and tiles (cached per shape and per tile)
+        self.backdrop = BackdropCache()
+        self.backdrop_shown, self.backdrop_job = False, None
+        self.backdrop_image = None
+        self.projected_parts = {}
+        # memory accounting per layer: when the process exceeds the memory
+        # budget, caches are evicted and the map is simplified
+        self.simplification = 0
+        self.land_items = self.land_points = 0
+        # additional shapefiles drawn above the map: a layer is loaded the
+        # first time it is visible, and hidden outside of its zoom range
+        self.layers = LayerStack()
+        # points of the measured path (shift + click), in geographical 
+        # coordinates
+        self.measure_points = []
+        # search indexes of the shapes (text fields of the shapefile) and 
+        # of the node labels, current results, and the projected bounding
+        # box of the shapes (per projection) used to zoom to a result
+        self.feature_search = self.node_search = None
+        self.search_query, self.search_results = '', []
+        self.feature_bboxes = {}
+        # heavy operations (redraw, import, deletion) are generators, run 
+        # by slices between two frames so that the user input is handled
+        self.scheduler = FrameScheduler()
+        self.scheduler_job = None
+        self.task_ids = count()
+        # True while a redraw of the map is pending
+        self.redrawing = False
+        self.memory = MemoryBudget()
+        self.account_memory()
+        self.after(2000, self.check_memory)
         self.proj = 'Mercator'
         self.ratio, self.offset = 1, (0, 0)
         self.bind('<MouseWheel>', self.zoomer)
         self.bind('<Button-4>', lambda e: self.zoomer(e, 1.3))
         self.bind('<Button-5>', lambda e: self.zoomer(e, 0.7))
-        self.bind('<ButtonPress-3>', lambda e: self.scan_mark(e.x, e.y))
+        self.bind('<ButtonPress-3>', self.start_pan)
         self.bind('<B3-Motion>', lambda e: self.scan_dragto(e.x, e.y, gain=1))
+        self.bind('<ButtonRelease-3>', self.end_pan)
         self.bind('<Enter>', self.drag_and_drop, add='+')
         self.bind('<ButtonPress-1>', self.start_point_select_objects, add='+')
         self.bind('<B1-Motion>', self.rectangle_drawing)
         self.bind('<ButtonRelease-1>', self.end_point_select_nodes, add='+')
+        self.bind('<Shift-Button-1>', self.add_measure_point)
         self.tag_bind('node', '<Button-1>', self.find_closest_node)
         self.tag_bind('node', '<B1-Motion>', self.node_motion)
 
@@ -206,68 +514,1341 @@ class Map(tk.Canvas):
         return self.projections[self.proj](px, py, inverse=True)
 
     def import_map(self):
-        filepath = tk.filedialog.askopenfilenames(title='Import shapefile')
+        filepath = tk.filedialog.askopenfilenames(title='Import shapefile', 
+            filetypes=(('shapefiles', '*.shp'), ('vector tiles', '*.tiles')))
         if not filepath: 
             return
         else: 
-            self.filepath ,= filepath
+            filepath ,= filepath
+        self.load_map(filepath)
         self.draw_map()
 
-    def draw_map(self):
+    def load_map(self, filepath):
+        self.filepath = filepath
+        if self.index:
+            self.index.close()
+        if self.tiles:
+            self.tiles.close()
+        self.index = self.tiles = None
+        if filepath.endswith('.tiles'):
+            # the attributes are read from the shapefile of the tiles
+            self.tiles = TileSource(filepath)
+            self.attributes = AttributeStore(self.tiles.source)
+        else:
+            self.index = ShapeIndex(self.filepath)
+            self.attributes = AttributeStore(self.filepath)
+        self.controller.menu.field_list['values'] = tuple(self.attributes.fields)
+        self.index_features()
+        self.shape_fill.clear()
+        self.shape_hidden.clear()
+        self.backdrop.clear()
+
+    def draw_map(self, ratio=1, offset=(0, 0)):
         if not self.filepath:
             return
-        self.delete('land', 'water')
-        self.ratio, self.offset = 1, (0, 0)
+        self.delete_land()
+        self.delete_layers()
+        self.ratio, self.offset = ratio, offset
         self.draw_water()
-        sf = shapefile.Reader(self.filepath)       
-        polygons = sf.shapes() 
-        for polygon in polygons:
-            polygon = shapely.geometry.shape(polygon)
-            if polygon.geom_type == 'Polygon':
-                polygon = [polygon]
-            for land in polygon:
-                self.create_polygon(
-                    sum((self.to_canvas_coordinates(*c) for c in land.exterior.coords), ()),    
-                    fill = 'green3', 
-                    outline = 'black', 
-                    tags = ('land',)
-                )
-        self.redraw_nodes()
+        # a new redraw supersedes the previous one
+        self.redrawing = True
+        self.schedule('map', self.draw_map_task(), priority=0)
+
+    def draw_map_task(self):
+        yield from self.draw_shapes_task()
+        self.draw_layers()
+        yield
+        yield from self.redraw_nodes_task()
+        self.draw_links()
+        self.draw_measure()
+        self.page_nodes()
+        self.schedule_heatmap()
+        self.draw_tracks()
+        self.schedule_backdrop()
+        self.redrawing = False
+
+    def schedule(self, key, task, priority=1):
+        self.scheduler.start(key, task, priority)
+        if not self.scheduler_job:
+            self.scheduler_job = self.after(1, self.run_tasks)
+
+    def run_tasks(self):
+        # one slice of the pending tasks per frame
+        self.scheduler_job = None
+        if self.scheduler.run():
+            self.scheduler_job = self.after(1, self.run_tasks)
+
+    def viewport_changed(self):
+        self.schedule_shapes()
+        self.schedule_heatmap()
+        self.schedule_labels()
+        self.draw_tracks()
+
+    def visible_bbox(self, margin=0):
+        # the margin is a fraction of the width and height of the canvas
+        width, height = self.winfo_width(), self.winfo_height()
+        x0 = self.canvasx(0) - margin*width
+        y0 = self.canvasy(0) - margin*height
+        x1 = self.canvasx(width) + margin*width
+        y1 = self.canvasy(height) + margin*height
+        projection = self.projections[self.proj]
+        return geographic_bbox(projection, self.ratio, self.offset, x0, y0, x1, y1)
+
+    def schedule_shapes(self):
+        # the shapes, layers and nodes of the visible area are drawn by 
+        # slices: a pending redraw is started again instead, as it covers 
+        # the new visible area
+        task = self.draw_map_task() if self.redrawing else self.update_map_task()
+        self.schedule('map', task, priority=0)
+
+    def update_map_task(self):
+        yield from self.draw_shapes_task()
+        self.draw_layers()
+        self.page_nodes()
+
+    def draw_shapes(self):
+        # the session restore draws the shapes at once
+        complete(self.draw_shapes_task())
+
+    def draw_shapes_task(self, size=20):
+        # only the shapes that intersect the visible area and that have 
+        # not been drawn yet are read from the shapefile
+        if self.tiles:
+            yield from self.draw_tiles_task()
+            return
+        if not self.index:
+            return
+        bbox = self.visible_bbox()
+        if not bbox:
+            return
+        for shapes in slices(self.index.query(*bbox), size):
+            # the shapes may have been drawn since the task started
+            self.draw_new_shapes([i for i in shapes if i not in self.drawn_shapes])
+            yield
+
+    def draw_new_shapes(self, new_shapes):
+        self.drawn_shapes.update(new_shapes)
+        # the rings of all new shapes are projected at once
+        rings = [
+            (i, ring) for i in new_shapes 
+            for ring in self.index.rings(i, self.simplification)
+        ]
+        projected = project_rings(self.projections[self.proj], [r for _, r in rings])
+        shape_rings = defaultdict(list)
+        for index in new_shapes:
+            self.projected_parts[index] = []
+        for (index, _), (px, py) in zip(rings, projected):
+            # points beyond the horizon cannot be projected
+            finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+            if finite.sum() < 3:
+                continue
+            points = np.column_stack((px[finite], py[finite]))
+            self.projected_parts[index].append((index, land_part, points))
+            shape_rings[index].append(np.column_stack((
+                points[:, 0]*self.ratio + self.offset[0], 
+                -points[:, 1]*self.ratio + self.offset[1]
+            )).ravel().tolist())
+        for index in new_shapes:
+            self.draw_shape(index, shape_rings[index])
+        # the lands are drawn above the water, and below the nodes
+        self.tag_lower('land')
+        self.tag_lower('water')
+
+    def draw_tiles_task(self, size=4):
+        bbox = self.visible_bbox()
+        if not bbox:
+            return
+        zoom = self.tiles.zoom_for(self.ratio)
+        if zoom != self.tile_zoom:
+            self.delete_tiles()
+            self.tile_zoom = zoom
+        # the tiles beyond half a screen of the visible area are deleted
+        kept = self.visible_bbox(margin=0.5)
+        kept = set(self.tiles.covering(zoom, *kept)) if kept else set()
+        for key in set(self.drawn_tiles) - kept:
+            self.delete('tile{}_{}_{}'.format(*key))
+            items, points = self.drawn_tiles.pop(key)
+            self.projected_parts.pop(key, None)
+            self.land_items -= items
+            self.land_points -= points
+        for keys in slices(self.tiles.covering(zoom, *bbox), size):
+            for key in keys:
+                # the tile may have been drawn since the task started
+                if key not in self.drawn_tiles:
+                    self.draw_tile(key)
+            self.tag_lower('land')
+            self.tag_lower('water')
+            yield
+
+    def draw_tile(self, key):
+        parts = self.tiles.get(key)
+        items = points = 0
+        projected = project_rings(self.projections[self.proj], [p for _, _, p in parts])
+        self.projected_parts[key] = []
+        for (index, kind, _), (px, py) in zip(parts, projected):
+            finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+            if finite.sum() < (3 if kind == land_part else 2):
+                continue
+            part = np.column_stack((px[finite], py[finite]))
+            self.projected_parts[key].append((index, kind, part))
+            coords = np.column_stack((
+                part[:, 0]*self.ratio + self.offset[0], 
+                -part[:, 1]*self.ratio + self.offset[1]
+            )).ravel().tolist()
+            hidden = index in self.shape_hidden or self.backdrop_shown
+            state = 'hidden' if hidden else 'normal'
+            tags = ['land', 'shape{}'.format(index), 'tile', 'tile{}_{}_{}'.format(*key)]
+            # the lands are clipped to the tile and are not outlined: the 
+            # borders are separate lines
+            if kind == land_part:
+                fill = self.shape_fill.get(index, 'green3')
+                self.create_polygon(coords, fill=fill, outline='', state=state, tags=tags)
+            else:
+                self.create_line(coords, fill='black', state=state, tags=tags + ['border'])
+            items, points = items + 1, points + len(coords)//2
+        self.drawn_tiles[key] = items, points
+        self.land_items += items
+        self.land_points += points
+
+    def delete_tiles(self):
+        self.delete('tile')
+        for key, (items, points) in self.drawn_tiles.items():
+            self.projected_parts.pop(key, None)
+            self.land_items -= items
+            self.land_points -= points
+        self.drawn_tiles.clear()
+        self.tile_zoom = None
+
+    def draw_shape(self, index, rings):
+        # the polygons of the shape are updated in place: the missing ones
+        # are taken from the pool (or created), the extra ones are returned
+        # to the pool
+        items = self.shape_items.setdefault(index, [])
+        while len(items) < len(rings):
+            if self.free_polygons:
+                items.append(self.free_polygons.pop())
+            else:
+                items.append(self.create_polygon(0, 0, 0, 0, 0, 0, outline='black'))
+        for item in items[len(rings):]:
+            self.itemconfig(item, state='hidden', tags=('pool',))
+        self.free_polygons.extend(items[len(rings):])
+        del items[len(rings):]
+        hidden = index in self.shape_hidden or self.backdrop_shown
+        for item, coords in zip(items, rings):
+            self.coords(item, coords)
+            # all polygons of a shape share the 'shape<index>' tag, 
+            # so that they can be styled together
+            self.itemconfig(
+                item, 
+                fill = self.shape_fill.get(index, 'green3'), 
+                state = 'hidden' if hidden else 'normal', 
+                tags = ('land', 'shape{}'.format(index))
+            )
+            self.land_items += 1
+            self.land_points += len(coords)//2
+
+    def add_layer(self):
+        filepath = tk.filedialog.askopenfilenames(title='Add layer', 
+            filetypes=(('shapefiles', '*.shp'),))
+        if not filepath: 
+            return
+        else: 
+            filepath ,= filepath
+        try:
+            zoom_range = parse_zoom_range(self.controller.menu.zoom_entry.get())
+        except ValueError:
+            warnings.warn('invalid zoom range (e.g 0-6)')
+            return
+        try:
+            self.layers.add(filepath, *zoom_range)
+        except (OSError, ValueError, IndexError) as error:
+            tk.messagebox.showerror('Add layer', 'The shapefile cannot be opened: {}'.format(error))
+            return
+        self.update_layer_list()
+        self.draw_layers()
+
+    def show_hide_layer(self, name):
+        layer = self.layers.find(name)
+        if layer:
+            layer.displayed = not layer.displayed
+            self.draw_layers()
+
+    def remove_layer(self, name):
+        layer = self.layers.find(name)
+        if layer:
+            self.delete('layer{}'.format(layer.id))
+            self.layers.remove(layer)
+            self.update_layer_list()
+
+    def update_layer_list(self):
+        names = tuple(layer.name for layer in self.layers)
+        self.controller.menu.layer_list['values'] = names
+        self.controller.menu.layer_list.set(names[-1] if names else '')
+
+    def draw_layers(self):
+        # the layers out of their zoom range are hidden, not deleted: their
+        # items are displayed again when the user zooms back
+        zoom, bbox = zoom_level(self.ratio), self.visible_bbox()
+        for layer in self.layers:
+            tag = 'layer{}'.format(layer.id)
+            if not layer.is_visible(zoom):
+                self.itemconfig(tag, state='hidden')
+                continue
+            self.itemconfig(tag, state='normal')
+            # the visibility of the other layers is still updated
+            if not bbox:
+                continue
+            # the shapefile is opened the first time the layer is visible:
+            # if it was deleted or corrupted since, the layer is hidden
+            try:
+                index = layer.load()
+            except (OSError, ValueError, IndexError) as error:
+                warnings.warn('layer {} hidden: {}'.format(layer.name, error))
+                layer.displayed = False
+                self.itemconfig(tag, state='hidden')
+                continue
+            new_shapes = [i for i in index.query(*bbox) if i not in layer.drawn]
+            layer.drawn.update(new_shapes)
+            rings = [
+                (index.types[i] in (5, 15, 25), ring) for i in new_shapes 
+                for ring in index.rings(i, self.simplification)
+            ]
+            projected = project_rings(self.projections[self.proj], [r for _, r in rings])
+            for (closed, _), (px, py) in zip(rings, projected):
+                finite = np.isfinite(px) & np.isfinite(py) & (np.abs(px) < 1e+10)
+                if finite.sum() < 2:
+                    continue
+                coords = np.column_stack((
+                    px[finite]*self.ratio + self.offset[0], 
+                    -py[finite]*self.ratio + self.offset[1]
+                )).ravel().tolist()
+                # polygons are drawn as outlines, so that the layers 
+                # below (and the map) remain visible
+                if closed and len(coords) > 4:
+                    self.create_polygon(coords, fill='', outline=layer.color, 
+                                                    tags=('layer', tag))
+                else:
+                    self.create_line(coords, fill=layer.color, tags=('layer', tag))
+                layer.items += 1
+                layer.points += len(coords)//2
+        # the layers are drawn above the map in z-order, below the nodes
+        for layer in reversed(self.layers.layers):
+            self.tag_lower('layer{}'.format(layer.id))
+        self.tag_lower('land')
+        self.tag_lower('water')
+        self.tag_lower('backdrop')
+
+    def delete_layers(self):
+        self.delete('layer')
+        for layer in self.layers:
+            layer.clear()
+
+    def start_pan(self, event):
+        self.scan_mark(event.x, event.y)
+        self.show_backdrop()
+
+    def end_pan(self, event):
+        self.viewport_changed()
+        self.schedule_vector()
+
+    def show_backdrop(self):
+        if not self.filepath:
+            return
+        width, height = self.winfo_width(), self.winfo_height()
+        x0, y0 = self.canvasx(0), self.canvasy(0)
+        # the bounds of the images are in projected coordinates (with the 
+        # y axis pointing down), which do not change when the user zooms
+        cached = self.backdrop.nearest(self.proj, self.ratio)
+        if not cached:
+            # the polygons are scaled until an image is rendered
+            return
+        (image, photo), (u0, v0, u1, v1), ratio = cached
+        self.delete('backdrop')
+        if ratio == self.ratio:
+            self.backdrop_image = photo
+            x, y = u0*self.ratio + self.offset[0], v0*self.ratio + self.offset[1]
+        else:
+            # the visible area of the image is cropped and scaled (the area
+            # beyond the image is transparent)
+            left = ((x0 - self.offset[0])/self.ratio - u0)*ratio
+            top = ((y0 - self.offset[1])/self.ratio - v0)*ratio
+            box = [int(left), int(top), int(left + width*ratio/self.ratio) + 1, 
+                                        int(top + height*ratio/self.ratio) + 1]
+            scaled = image.crop(box).resize((width, height), Image.BILINEAR)
+            self.backdrop_image = ImageTk.PhotoImage(scaled)
+            x, y = x0, y0
+        self.create_image(x, y, anchor='nw', image=self.backdrop_image, tags=('backdrop',))
+        self.tag_lower('backdrop')
+        if not self.backdrop_shown:
+            self.itemconfig('land', state='hidden')
+            self.itemconfig('water', state='hidden')
+            self.backdrop_shown = True
+
+    def schedule_backdrop(self):
+        # a sharp image of the zoom level is rendered by slices, once the 
+        # other tasks are done
+        if self.filepath:
+            self.schedule('backdrop', self.render_backdrop_task(), priority=3)
+
+    def render_backdrop_task(self, size=100):
+        # the image covers the visible area, plus half a screen on each 
+        # side, so that the user can pan without a new rendering
+        width, height = 2*self.winfo_width(), 2*self.winfo_height()
+        x0 = self.canvasx(0) - width//4
+        y0 = self.canvasy(0) - height//4
+        # the user may zoom while the image is rendered: it is rendered at
+        # the zoom level of the start
+        proj, ratio, (ox, oy) = self.proj, self.ratio, self.offset
+        image = Image.new('RGBA', (width, height), 'white')
+        draw = ImageDraw.Draw(image)
+        # tk colors (e.g 'green3') are converted to RGB for Pillow
+        rgb = lambda color: tuple(c >> 8 for c in self.winfo_rgb(color))
+        water = rgb('deep sky blue')
+        if proj == 'Mercator':
+            ax, ay = self.to_canvas_coordinates(-180, 84)
+            bx, by = self.to_canvas_coordinates(180, -84)
+            # the rectangle is clipped to the image
+            box = np.clip([ax - x0, ay - y0, bx - x0, by - y0], -1, 
+                                            [width, height, width, height])
+            draw.rectangle(box.tolist(), fill=water, outline='black')
+        else:
+            cx, cy = self.to_canvas_coordinates(28, 47)
+            cx, cy, R = cx - x0, cy - y0, 6378000*ratio
+            corners = np.array([[0, 0], [width, 0], [0, height], [width, height]])
+            if (np.hypot(corners[:, 0] - cx, corners[:, 1] - cy) < R).all():
+                draw.rectangle((0, 0, width, height), fill=water)
+            else:
+                draw.ellipse((cx - R, cy - R, cx + R, cy + R), 
+                                            fill=water, outline='black')
+        parts = [part for parts in self.projected_parts.values() for part in parts]
+        for chunk in slices(parts, size):
+            for index, kind, points in chunk:
+                if index in self.shape_hidden:
+                    continue
+                coords = np.column_stack((
+                    points[:, 0]*ratio + ox - x0, 
+                    -points[:, 1]*ratio + oy - y0
+                )).ravel().tolist()
+                if kind == border_part:
+                    draw.line(coords, fill='black')
+                    continue
+                fill = rgb(self.shape_fill.get(index, 'green3'))
+                # the lands of the tiles are outlined by the borders
+                draw.polygon(coords, fill=fill, outline=None if self.tiles else 'black')
+            yield
+        if proj != self.proj:
+            return
+        bounds = (
+            (x0 - ox)/ratio, 
+            (y0 - oy)/ratio,
+            (x0 + width - ox)/ratio, 
+            (y0 + height - oy)/ratio
+        )
+        self.backdrop.put((proj, ratio), (image, ImageTk.PhotoImage(image)), 
+                                                bounds, size=8*width*height)
+
+    def schedule_vector(self, delay=300):
+        # the polygons are displayed again once the interaction is over
+        if self.backdrop_job:
+            self.after_cancel(self.backdrop_job)
+        self.backdrop_job = self.after(delay, self.hide_backdrop)
+
+    def hide_backdrop(self):
+        self.backdrop_job = None
+        if self.backdrop_shown:
+            self.delete('backdrop')
+            self.itemconfig('land', state='normal')
+            self.itemconfig('water', state='normal')
+            for index in self.shape_hidden:
+                self.itemconfig('shape{}'.format(index), state='hidden')
+            self.backdrop_shown = False
+        self.schedule_backdrop()
+
+    def account_memory(self):
+        def shapefile():
+            if not self.index:
+                return 0, 0
+            arrays = self.index.offsets, self.index.bboxes, self.index.types
+            return array_bytes(arrays), len(self.index)
+        def attributes():
+            columns = self.attributes.columns if self.attributes else {}
+            return array_bytes(columns), len(columns)
+        def map_items():
+            # tk stores the coordinates of the polygons as doubles
+            return 16*self.land_points, self.land_items
+        def pooled_items():
+            # hidden polygons are assumed to be of the average size
+            pooled = len(self.find_withtag('pool'))
+            size = 16*self.land_points//max(self.land_items, 1)
+            return size*pooled, pooled
+        def backdrop():
+            return self.backdrop.nbytes(), len(self.backdrop.images)
+        def projected_rings():
+            parts = [part for parts in self.projected_parts.values() for part in parts]
+            return array_bytes([points for _, _, points in parts]), len(parts)
+        def tile_cache():
+            if not self.tiles:
+                return 0, 0
+            return self.tiles.nbytes(), len(self.tiles.cache)
+        def nodes():
+            return self.node_size*len(self.node_id_to_node), len(self.node_id_to_node)
+        def links():
+            arrays = self.links.lons, self.links.lats, self.links.projected
+            return array_bytes(arrays), len(self.links.keys)
+        def heatmap():
+            if not self.heatmap:
+                return 0, 0
+            arrays = self.heatmap.longitudes, self.heatmap.latitudes, self.heatmap.projected
+            return array_bytes(arrays), len(self.heatmap.longitudes)
+        def tracks():
+            if not self.tracks:
+                return 0, 0
+            return self.tracks.nbytes(), len(self.tracks)
+        def node_database():
+            if not self.node_store:
+                return 0, 0
+            return self.node_store.size(), self.node_store.count()
+        def layers():
+            loaded = [layer for layer in self.layers if layer.index]
+            size = sum(layer.nbytes() + 16*layer.points for layer in loaded)
+            return size, len(loaded)
+        self.memory.register('shapefile index', shapefile)
+        self.memory.register('attributes', attributes)
+        self.memory.register('map items', map_items)
+        self.memory.register('pooled items', pooled_items)
+        self.memory.register('layers', layers)
+        self.memory.register('backdrop images', backdrop)
+        self.memory.register('projected rings', projected_rings)
+        self.memory.register('tile cache', tile_cache)
+        self.memory.register('nodes', nodes)
+        self.memory.register('links', links)
+        self.memory.register('heatmap', heatmap)
+        self.memory.register('tracks', tracks)
+        self.memory.register('node database', node_database)
+        # eviction steps, from the cheapest to the most visible
+        self.memory.add_step('backdrop images', self.evict_backdrop)
+        self.memory.add_step('tile cache', self.evict_tiles)
+        self.memory.add_step('cached projections', self.evict_projections)
+        self.memory.add_step('attribute columns', self.evict_attributes)
+        self.memory.add_step('hidden layers', self.unload_layers)
+        self.memory.add_step('pooled items', self.purge_pool)
+        self.memory.add_step('simplified map', self.simplify_map, self.restore_map)
+        self.memory.add_step('fewer nodes', self.reduce_nodes, self.restore_nodes)
+
+    def check_memory(self):
+        step = self.memory.enforce()
+        if step:
+            warnings.warn('memory budget exceeded, evicted: ' + step)
+        else:
+            self.memory.restore()
+        self.after(2000, self.check_memory)
+
+    def show_memory(self):
+        tk.messagebox.showinfo('Memory usage', self.memory.summary())
+
+    def set_memory_budget(self):
+        budget = tk.simpledialog.askinteger(
+            'Memory budget', 
+            'Memory budget in MB (0 for none)', 
+            initialvalue = int(self.memory.limit/2**20), 
+            minvalue = 0
+        )
+        if budget is not None:
+            self.memory.limit = budget*2**20
+
+    def evict_backdrop(self):
+        if not self.backdrop.images:
+            return False
+        self.backdrop.clear()
+        return True
+
+    def evict_tiles(self):
+        # the drawn tiles are not affected, the others are read again
+        if not self.tiles or not self.tiles.cache:
+            return False
+        self.tiles.clear()
+        return True
+
+    def evict_projections(self):
+        # cached projections of the projections that are not displayed
+        caches = [self.links.projected]
+        if self.heatmap:
+            caches.append(self.heatmap.projected)
+        if self.tracks:
+            caches.append(self.tracks.projected)
+        evicted = [
+            (cache, name) for cache in caches 
+            for name in cache if name != self.proj
+        ]
+        for cache, name in evicted:
+            del cache[name]
+        return bool(evicted)
+
+    def evict_attributes(self):
+        if not self.attributes or not self.attributes.columns:
+            return False
+        self.attributes.columns.clear()
+        return True
+
+    def unload_layers(self):
+        # the layers that are not visible are deleted and closed: they are
+        # loaded again when they become visible
+        zoom = zoom_level(self.ratio)
+        hidden = [
+            layer for layer in self.layers 
+            if layer.index and not layer.is_visible(zoom)
+        ]
+        for layer in hidden:
+            self.delete('layer{}'.format(layer.id))
+            layer.unload()
+        return bool(hidden)
+
+    def simplify_map(self):
+        # the map is drawn again with a simplified geometry
+        levels = [l for l in self.simplification_levels if l > self.simplification]
+        if not levels or not self.filepath:
+            return False
+        self.set_simplification(levels[0])
+        return True
+
+    def restore_map(self):
+        # the previous (less simplified) geometry is drawn again
+        levels = [l for l in self.simplification_levels if l < self.simplification]
+        self.set_simplification(levels[-1] if levels else 0)
+
+    def set_simplification(self, simplification):
+        self.simplification = simplification
+        self.backdrop.clear()
+        self.delete_land()
+        self.delete_layers()
+        self.schedule_shapes()
+
+    def reduce_nodes(self):
+        # fewer nodes of the node database are displayed
+        if not self.node_store or self.max_nodes <= 500:
+            return False
+        self.node_store.shrink()
+        self.max_nodes //= 2
+        self.page_nodes()
+        return True
+
+    def restore_nodes(self):
+        self.max_nodes *= 2
+        self.page_nodes()
+
+    def measure_shapes(self):
+        # the geodesic area and perimeter of the shapes are added to the
+        # attributes, so that the map can be colored and filtered by area
+        if not self.index:
+            return
+        areas, perimeters = shape_measures(self.index)
+        if self.attributes:
+            self.attributes.add_column('AREA_KM2', areas/1e6)
+            self.attributes.add_column('PERIM_KM', perimeters/1e3)
+            self.controller.menu.field_list['values'] = tuple(self.attributes.fields)
+        message = '{} shapes\ntotal area: {:,.0f} km²\ntotal perimeter: {}'.format(
+            len(areas), 
+            areas.sum()/1e6, 
+            format_distance(perimeters.sum())
+        )
+        tk.messagebox.showinfo('Measure shapes', message)
+
+    def measure_selection(self):
+        nodes = list(self.selected_nodes)
+        if len(nodes) < 2:
+            tk.messagebox.showinfo('Measure selected nodes', 'Select two nodes or more')
+            return
+        # the pairs are measured by blocks, one block per frame
+        self.schedule('measure', self.measure_selection_task(nodes), priority=2)
+
+    def measure_selection_task(self, nodes):
+        distances = pairwise_distances(
+            [node.longitude for node in nodes], 
+            [node.latitude for node in nodes]
+        )
+        pairs, shortest, longest, mean = yield from distance_summary(distances)
+        message = '{} nodes, {} pairs\nshortest: {}\nlongest: {}\nmean: {}'.format(
+            len(nodes), 
+            pairs, 
+            format_distance(shortest), 
+            format_distance(longest), 
+            format_distance(mean)
+        )
+        tk.messagebox.showinfo('Measure selected nodes', message)
+
+    @update_coordinates
+    def add_measure_point(self, event):
+        # the point is snapped to the node below the cursor, if any
+        below = self.find_overlapping(event.x - 1, event.y - 1, event.x + 1, event.y + 1)
+        nodes = [self.node_id_to_node[id] for id in below if id in self.node_id_to_node]
+        if nodes:
+            longitude, latitude = nodes[-1].longitude, nodes[-1].latitude
+        else:
+            longitude, latitude = self.to_geographical_coordinates(event.x, event.y)
+        # points beyond the horizon cannot be unprojected
+        if not np.isfinite(longitude) or abs(longitude) > 180:
+            return
+        self.measure_points.append((longitude, latitude))
+        self.draw_measure()
+
+    def draw_measure(self):
+        self.delete('measure')
+        if not self.measure_points:
+            return
+        longitudes, latitudes = np.array(self.measure_points).T
+        xs, ys = self.to_canvas_coordinates(longitudes, latitudes)
+        coords = np.column_stack((xs, ys)).ravel().tolist()
+        if len(coords) > 2:
+            self.create_line(coords, fill='red', width=2, dash=(6, 4), tags=('measure',))
+        self.create_text(
+            coords[-2] + 8, 
+            coords[-1] - 8, 
+            text = format_distance(path_lengths(longitudes, latitudes).sum()), 
+            anchor = 'sw', 
+            fill = 'red', 
+            tags = ('measure',)
+        )
+        self.tag_raise('measure')
+
+    def clear_measure(self):
+        self.measure_points = []
+        self.delete('measure')
+
+    def index_features(self, fields=None):
+        # the index is built once per shapefile and set of fields
+        self.feature_bboxes.clear()
+        self.feature_search = None
+        if not self.attributes:
+            return
+        # unknown fields are ignored (no valid field: default fields)
+        fields = [f for f in fields or () if f in self.attributes.fields]
+        fields = fields or default_fields(self.attributes)
+        if fields:
+            self.feature_search = SearchIndex(feature_entries(self.attributes, fields))
+        self.controller.menu.search_fields.delete(0, 'end')
+        self.controller.menu.search_fields.insert(0, ', '.join(fields))
+
+    def index_nodes(self):
+        # the labels of the nodes (their coordinates) change when the nodes
+        # move: they are indexed when a new search starts
+        labels = (
+            ('({:.5f}, {:.5f})'.format(node.longitude, node.latitude), node)
+            for node in self.node_id_to_node.values()
+        )
+        self.node_search = SearchIndex((label, label, node) for label, node in labels)
+
+    def search(self, query):
+        if query.strip() and not self.search_query.strip():
+            self.index_nodes()
+        self.search_query = query
+        results = self.feature_search.search(query) if self.feature_search else []
+        if self.node_search and len(results) < 10:
+            results += self.node_search.search(query, 10 - len(results))
+        self.search_results = results
+        listbox = self.controller.menu.search_results
+        listbox.delete(0, 'end')
+        for label, key in results:
+            listbox.insert('end', 'node ' + label if isinstance(key, PSF_Object) else label)
+
+    def feature_bbox(self, index):
+        # projected bounding box of a shape, cached per projection
+        if (self.proj, index) not in self.feature_bboxes:
+            bboxes = self.tiles.bboxes if self.tiles else self.index.bboxes
+            self.feature_bboxes[(self.proj, index)] = projected_bbox(
+                                    self.projections[self.proj], *bboxes[index])
+        return self.feature_bboxes[(self.proj, index)]
+
+    def select_result(self, event):
+        selection = self.controller.menu.search_results.curselection()
+        if selection:
+            self.zoom_to_result(selection[0])
+
+    def zoom_to_result(self, position):
+        if position >= len(self.search_results):
+            return
+        _, key = self.search_results[position]
+        if not isinstance(key, PSF_Object):
+            bbox = self.feature_bbox(key) if self.index or self.tiles else None
+        # the node may have been deleted since the search
+        elif self.node_id_to_node.get(key.id) is key:
+            x, y = self.projections[self.proj](key.longitude, key.latitude)
+            bbox = (x, y, x, y) if np.isfinite([x, y]).all() else None
+        else:
+            bbox = None
+        if bbox:
+            self.zoom_to(*bbox)
+
+    def zoom_to(self, min_x, min_y, max_x, max_y, margin=0.1, extent=20000):
+        # the map is drawn again so that the projected bounding box fills 
+        # the canvas (the box is at least 'extent' meters wide and high)
+        width, height = self.winfo_width(), self.winfo_height()
+        ratio = (1 - 2*margin)*min(
+            width/max(max_x - min_x, extent), 
+            height/max(max_y - min_y, extent)
+        )
+        cx, cy = (min_x + max_x)/2, (min_y + max_y)/2
+        offset = self.canvasx(width/2) - cx*ratio, self.canvasy(height/2) + cy*ratio
+        if self.filepath:
+            self.draw_map(ratio, offset)
+        else:
+            self.ratio, self.offset = ratio, offset
+            self.redraw_nodes()
+        self.configure(scrollregion=self.bbox('all'))
+
+    def style_map(self, field):
+        if not self.attributes or field not in self.attributes.fields:
+            return
+        # only the shapes whose color changed are updated
+        for index, color in enumerate(self.attributes.colors(field)):
+            if self.shape_fill.get(index, 'green3') != color:
+                self.itemconfig('shape{}&&!border'.format(index), fill=color)
+                self.shape_fill[index] = color
+        self.backdrop.clear()
+        self.schedule_backdrop()
+
+    def filter_map(self, field, expression):
+        if not self.attributes or field not in self.attributes.fields:
+            return
+        try:
+            mask = self.attributes.select(field, expression)
+        except ValueError:
+            warnings.warn('invalid filter expression: ' + expression)
+            return
+        self.backdrop.clear()
+        for index, selected in enumerate(mask):
+            if selected and index in self.shape_hidden:
+                self.itemconfig('shape{}&&land'.format(index), state='normal')
+                self.shape_hidden.discard(index)
+            elif not selected and index not in self.shape_hidden:
+                self.itemconfig('shape{}'.format(index), state='hidden')
+                self.shape_hidden.add(index)
+        self.schedule_backdrop()
+
+    def reset_style(self):
+        for index in self.shape_fill:
+            self.itemconfig('shape{}&&!border'.format(index), fill='green3')
+        for index in self.shape_hidden:
+            self.itemconfig('shape{}&&land'.format(index), state='normal')
+        self.shape_fill.clear()
+        self.shape_hidden.clear()
+        self.backdrop.clear()
+        self.schedule_backdrop()
+
+    def delete_land(self):
+        # the polygons are hidden, and kept in the pool with their shape
+        # (the items of the tiles are deleted)
+        self.delete_tiles()
+        self.itemconfig('land', state='hidden')
+        self.addtag_withtag('pool', 'land')
+        self.dtag('land', 'land')
+        self.drawn_shapes.clear()
+        self.projected_parts.clear()
+        self.land_items = self.land_points = 0
+
+    def purge_pool(self):
+        # the pooled items are deleted (memory budget, or deleted map)
+        if not self.find_withtag('pool'):
+            return False
+        self.delete('pool')
+        self.free_polygons.clear()
+        self.free_nodes.clear()
+        self.free_labels.clear()
+        for index in set(self.shape_items) - self.drawn_shapes:
+            del self.shape_items[index]
+        return True
 
     def delete_map(self):
-        self.delete('land', 'water')
-        self.filepath = None
+        self.scheduler.cancel('map')
+        self.redrawing = False
+        self.delete('water')
+        self.delete_land()
+        self.purge_pool()
+        if self.index:
+            self.index.close()
+        if self.tiles:
+            self.tiles.close()
+        self.filepath = self.attributes = self.index = self.tiles = None
+        self.index_features()
+        self.shape_fill.clear()
+        self.shape_hidden.clear()
+        self.backdrop.clear()
+        self.delete('backdrop')
 
     def delete_selected_nodes(self):
-        for node in self.selected_nodes:
-            self.node_id_to_node.pop(node.id)
-            self.delete(node.id, node.label_id)
+        nodes = list(self.selected_nodes)
+        if self.node_store:
+            self.node_store.delete([node.store_id for node in nodes 
+                                                  if node.store_id is not None])
+        self.selected_nodes.clear()
+        # the nodes are deleted over several frames
+        self.schedule(('delete', next(self.task_ids)), 
+                                        self.delete_nodes_task(nodes), priority=2)
+
+    def delete_nodes_task(self, nodes, size=500):
+        for nodes in slices(nodes, size):
+            for node in nodes:
+                # the node may have been deleted since the task started, and
+                # its item reused by a new node
+                if self.node_id_to_node.get(node.id) is node:
+                    self.delete_node(node)
+            yield
+
+    def delete_node(self, node):
+        self.delete_links(self.node_links.pop(node, ()))
+        self.node_id_to_node.pop(node.id)
+        self.store_id_to_node.pop(node.store_id, None)
+        # the items of the node and of its label are returned to the pool
+        self.itemconfig(node.id, state='hidden', tags=('pool',))
+        self.free_nodes.append(node.id)
+        self.delete_labels([node])
+
+    def delete_all_nodes(self):
+        self.scheduler.cancel_all('nodes', 'import', 'delete')
+        self.delete_links(list(self.link_items))
+        # the items of all nodes and labels are returned to the pool, with
+        # one call per tag
+        self.free_nodes.extend(self.find_withtag('node'))
+        self.free_labels.extend(self.find_withtag('label'))
+        self.itemconfig('node', state='hidden', tags=('pool',))
+        self.itemconfig('label', state='hidden', tags=('pool',))
+        self.node_id_to_node.clear()
+        self.store_id_to_node.clear()
         self.selected_nodes.clear()
 
+    def open_node_store(self):
+        filepath = filedialog.asksaveasfilename(
+            title = 'Open or create a node database',
+            defaultextension = '.sqlite', 
+            filetypes = (('node databases', '*.sqlite'),),
+            confirmoverwrite = False
+        )
+        if not filepath:
+            return
+        if self.node_store:
+            self.node_store.close()
+        self.delete_all_nodes()
+        self.node_store = NodeStore(filepath)
+        self.page_nodes()
+
+    def page_nodes(self):
+        # the nodes of the visible area are created, and those that left it 
+        # are deleted (the database is the reference, not the canvas): the
+        # links of the deleted nodes remain in the database, and the links 
+        # of the created nodes are read from it
+        if not self.node_store or self.heatmap:
+            return
+        bbox = self.visible_bbox(margin=0.5)
+        if bbox:
+            ids, longitudes, latitudes = self.node_store.query(*bbox, self.max_nodes)
+        else:
+            ids, longitudes, latitudes = np.empty(0, dtype=int), np.empty(0), np.empty(0)
+        for store_id in set(self.store_id_to_node) - set(ids.tolist()):
+            node = self.store_id_to_node[store_id]
+            self.selected_nodes.discard(node)
+            self.delete_node(node)
+        new = ~np.isin(ids, list(self.store_id_to_node))
+        nodes = self.create_nodes(longitudes[new], latitudes[new])
+        for node, store_id in zip(nodes, ids[new].tolist()):
+            node.store_id = store_id
+            self.store_id_to_node[store_id] = node
+        new_ids = set(ids[new].tolist())
+        self.create_links([
+            (self.store_id_to_node[source], self.store_id_to_node[destination])
+            for source, destination in self.node_store.links(ids)
+            if source in new_ids or destination in new_ids
+        ])
+
+    def show_hide_heatmap(self):
+        if self.heatmap:
+            self.heatmap = self.heatmap_image = None
+            self.delete('heatmap')
+            self.itemconfig('node', state='normal')
+            self.page_nodes()
+            self.schedule_labels()
+        else:
+            self.itemconfig('node', state='hidden')
+            self.delete_labels(self.node_id_to_node.values())
+            self.heatmap = HeatmapLayer()
+            self.update_heatmap_points()
+
+    def update_heatmap_points(self):
+        if not self.heatmap:
+            return
+        # all nodes of the database, and the nodes that are not in it
+        nodes = [n for n in self.node_id_to_node.values() if n.store_id is None]
+        longitudes = [node.longitude for node in nodes]
+        latitudes = [node.latitude for node in nodes]
+        if self.node_store:
+            store_longitudes, store_latitudes = self.node_store.coordinates()
+            longitudes = np.concatenate((longitudes, store_longitudes))
+            latitudes = np.concatenate((latitudes, store_latitudes))
+        self.heatmap.set_points(longitudes, latitudes)
+        self.draw_heatmap()
+
+    def schedule_heatmap(self, delay=150):
+        # the heatmap is only recomputed once the interaction is over
+        if not self.heatmap:
+            return
+        if self.heatmap_job:
+            self.after_cancel(self.heatmap_job)
+        self.heatmap_job = self.after(delay, self.draw_heatmap)
+
+    def draw_heatmap(self):
+        self.heatmap_job = None
+        if not self.heatmap:
+            return
+        width, height = self.winfo_width(), self.winfo_height()
+        x0, y0 = self.canvasx(0), self.canvasy(0)
+        image = self.heatmap.render(
+            self.proj,
+            self.projections[self.proj],
+            self.ratio,
+            self.offset,
+            x0, y0, x0 + width, y0 + height,
+            width, height
+        )
+        self.heatmap_image = ImageTk.PhotoImage(ImageTk.Image.fromarray(image, 'RGBA'))
+        self.delete('heatmap')
+        self.create_image(x0, y0, anchor='nw', image=self.heatmap_image, tags=('heatmap',))
+
+    def link_selected_nodes(self):
+        # all selected nodes are linked to each other
+        nodes = list(self.selected_nodes)
+        self.create_links([(source, destination) 
+                           for i, source in enumerate(nodes) 
+                           for destination in nodes[i + 1:]])
+
+    def create_links(self, pairs):
+        pairs = [pair for pair in pairs if pair not in self.links 
+                                       and pair[::-1] not in self.links]
+        if not pairs:
+            return
+        self.links.add(
+            pairs,
+            [source.longitude for source, _ in pairs],
+            [source.latitude for source, _ in pairs],
+            [destination.longitude for _, destination in pairs],
+            [destination.latitude for _, destination in pairs]
+        )
+        for pair in pairs:
+            for node in pair:
+                self.node_links[node].add(pair)
+        if self.node_store:
+            stored = [(source, destination) for source, destination in pairs 
+                        if source.store_id is not None and destination.store_id is not None]
+            self.node_store.add_links(
+                [source.store_id for source, _ in stored],
+                [destination.store_id for _, destination in stored]
+            )
+        self.draw_links(pairs)
+
+    def draw_links(self, keys=None):
+        paths = self.links.paths(
+            self.proj, 
+            self.projections[self.proj], 
+            self.ratio, 
+            self.offset, 
+            keys
+        )
+        # existing lines are moved rather than recreated
+        for key, segments in paths.items():
+            items = self.link_items.setdefault(key, [])
+            for item, segment in zip(items, segments):
+                self.coords(item, segment.tolist())
+            for segment in segments[len(items):]:
+                items.append(self.create_line(
+                    segment.tolist(), 
+                    fill = 'dark slate gray', 
+                    width = 2, 
+                    tags = ('link',)
+                ))
+            for item in items[len(segments):]:
+                self.delete(item)
+            del items[len(segments):]
+        self.tag_raise('node')
+        self.tag_raise('label')
+
+    def move_links(self, nodes):
+        # only the links of the nodes that moved are updated
+        keys = set().union(*(self.node_links.get(node, ()) for node in nodes))
+        if not keys:
+            return
+        keys = list(keys)
+        self.links.move(
+            keys,
+            [source.longitude for source, _ in keys],
+            [source.latitude for source, _ in keys],
+            [destination.longitude for _, destination in keys],
+            [destination.latitude for _, destination in keys]
+        )
+        self.draw_links(keys)
+
+    def delete_links(self, keys):
+        keys = list(keys)
+        self.links.remove(keys)
+        for key in keys:
+            self.delete(*self.link_items.pop(key, ()))
+            for node in key:
+                self.node_links.get(node, set()).discard(key)
+
+    def start_feed(self):
+        port = simpledialog.askinteger('Live feed', 'UDP port', initialvalue=5555)
+        if port:
+            self.open_feed(port=port)
+
+    def follow_feed_file(self):
+        # the lines appended to the file are read as position updates
+        filepath = filedialog.askopenfilename(title='Follow position file')
+        if filepath:
+            self.open_feed(filepath=filepath)
+
+    def open_feed(self, port=None, filepath=None):
+        self.stop_feed()
+        try:
+            self.feed = PositionFeed(port=port, filepath=filepath)
+        except OSError as error:
+            tk.messagebox.showerror('Live feed', 'The feed cannot be opened: {}'.format(error))
+            return
+        self.feed_job = self.after(self.frame_delay, self.apply_feed)
+
+    def stop_feed(self):
+        if self.feed_job:
+            self.after_cancel(self.feed_job)
+            self.feed_job = None
+        if self.feed:
+            self.feed.close()
+            self.feed = None
+
+    def apply_feed(self):
+        ids, longitudes, latitudes = self.feed.drain()
+        # nodes that are not known yet (or were deleted) are created in bulk
+        known = np.array([
+            id in self.feed_nodes 
+            and self.node_id_to_node.get(self.feed_nodes[id].id) is self.feed_nodes[id] 
+            for id in ids
+        ], dtype=bool)
+        if len(ids) and not known.all():
+            new_ids = [id for id, k in zip(ids, known) if not k]
+            nodes = self.create_nodes(longitudes[~known], latitudes[~known])
+            self.feed_nodes.update(zip(new_ids, nodes))
+        # the positions of the other nodes are projected at once
+        nodes = [self.feed_nodes[id] for id, k in zip(ids, known) if k]
+        if nodes:
+            xs, ys = self.to_canvas_coordinates(longitudes[known], latitudes[known])
+            for node, x, y, lon, lat in zip(nodes, xs.tolist(), ys.tolist(), 
+                                longitudes[known].tolist(), latitudes[known].tolist()):
+                node.x, node.y, node.longitude, node.latitude = x, y, lon, lat
+                self.coords(node.id, x, y)
+                if node.label_id:
+                    self.coords(node.label_id, x - 5, y + 30)
+                    self.itemconfig(node.label_id, text='({:.5f}, {:.5f})'.format(lon, lat))
+            self.move_links(nodes)
+        self.feed_job = self.after(self.frame_delay, self.apply_feed)
+
+    def import_tracks(self):
+        filepath = filedialog.askopenfilename(
+            title = 'Import tracks', 
+            filetypes = (('tracks (id, time, longitude, latitude)', '*.csv'),)
+        )
+        if not filepath:
+            return
+        self.stop_tracks()
+        # the file is read by chunks, one chunk per frame
+        self.schedule('tracks', self.import_tracks_task(filepath), priority=2)
+
+    def import_tracks_task(self, filepath):
+        try:
+            tracks = yield from read_tracks_task(filepath)
+        except (OSError, ValueError) as error:
+            tk.messagebox.showerror('Import tracks', 'The tracks cannot be read: {}'.format(error))
+            return
+        self.tracks = tracks
+        self.playback = Playback(self.tracks.start, self.tracks.end)
+        self.set_track_speed(self.controller.menu.track_speed.get())
+        self.controller.menu.track_scale.configure(
+                                        from_=self.tracks.start, to=self.tracks.end)
+        self.draw_tracks()
+
+    def stop_tracks(self):
+        if self.track_job:
+            self.after_cancel(self.track_job)
+            self.track_job = None
+        if self.playback:
+            self.playback.pause()
+
+    def set_track_speed(self, speed):
+        if self.playback:
+            try:
+                self.playback.speed = float(speed)
+            except ValueError:
+                warnings.warn('invalid playback speed: ' + speed)
+
+    def play_tracks(self):
+        if not self.tracks:
+            return
+        if self.playback.playing:
+            self.stop_tracks()
+        else:
+            self.playback.play()
+            self.track_job = self.after(self.frame_delay, self.play_frame)
+
+    def play_frame(self):
+        self.playback.advance()
+        self.draw_tracks()
+        self.track_job = None
+        if self.playback.playing:
+            self.track_job = self.after(self.frame_delay, self.play_frame)
+
+    def seek_tracks(self, value):
+        # the scale also calls it when the playback moves it
+        if not self.tracks or abs(float(value) - self.playback.time) < 1:
+            return
+        self.playback.seek(float(value))
+        self.draw_tracks()
+
+    def draw_tracks(self):
+        # one frame: the projected positions of the frame are interpolated 
+        # (projected once per projection), then zoomed and panned with an
+        # affine transformation and drawn in the image of the visible area
+        if not self.tracks:
+            return
+        px, py = self.tracks.positions(
+                                       self.proj, 
+                                       self.projections[self.proj], 
+                                       self.playback.time
+                                       )
+        width, height = self.winfo_width(), self.winfo_height()
+        x0, y0 = self.canvasx(0), self.canvasy(0)
+        image = Image.fromarray(point_image(
+            px*self.ratio + self.offset[0],
+            -py*self.ratio + self.offset[1],
+            x0, y0, width, height
+        ), 'RGBA')
+        # the image is only created again when the canvas is resized
+        size = (self.track_image.width(), self.track_image.height()) if self.track_image else None
+        if size == (width, height):
+            self.track_image.paste(image)
+            self.coords('tracks', x0, y0)
+        else:
+            self.track_image = ImageTk.PhotoImage(image)
+            self.delete('tracks')
+            self.create_image(x0, y0, anchor='nw', image=self.track_image, tags=('tracks',))
+        self.tag_raise('tracks')
+        self.controller.menu.track_scale.set(self.playback.time)
+        self.controller.menu.track_time.configure(
+                                text=format_time(self.playback.time, self.tracks.dates))
+
+    def save_node_positions(self, nodes):
+        nodes = [node for node in nodes if node.store_id is not None]
+        if self.node_store and nodes:
+            self.node_store.move(
+                [node.store_id for node in nodes],
+                [node.longitude for node in nodes],
+                [node.latitude for node in nodes]
+            )
+
+    def save_session(self):
+        filepath = filedialog.asksaveasfilename(
+            defaultextension = '.npz', 
+            filetypes = (('session files', '*.npz'),)
+        )
+        if not filepath:
+            return
+        nodes = list(self.node_id_to_node.values())
+        write_session(
+            filepath,
+            [node.longitude for node in nodes],
+            [node.latitude for node in nodes],
+            [node in self.selected_nodes for node in nodes],
+            self.proj,
+            self.ratio,
+            self.offset,
+            self.filepath,
+            'tkinter',
+            # position of the visible area in the canvas
+            (self.canvasx(0), self.canvasy(0))
+        )
+
+    def restore_session(self):
+        filepath = filedialog.askopenfilename(filetypes=(('session files', '*.npz'),))
+        if not filepath:
+            return
+        try:
+            session = read_session(filepath)
+        except (OSError, ValueError) as error:
+            tk.messagebox.showerror('Restore session', 'The session cannot be read: {}'.format(error))
+            return
+        self.delete_all_nodes()
+        # a session saved by the pyQt version may use a projection that this
+        # version does not have: the current projection is kept
+        if session['projection'] in self.projections:
+            self.proj = session['projection']
+        else:
+            warnings.warn('unknown projection: ' + session['projection'])
+        self.controller.menu.projection_list.set(self.proj)
+        try:
+            if session['shapefile']:
+                self.load_map(session['shapefile'])
+            else:
+                self.delete_map()
+        except (OSError, ValueError, IndexError) as error:
+            # the nodes are restored without the map
+            tk.messagebox.showerror('Restore session', 'The map cannot be loaded: {}'.format(error))
+            self.delete_map()
+        self.ratio, self.offset = session['ratio'], session['offset']
+        self.draw_map(self.ratio, self.offset)
+        nodes = self.create_nodes(session['longitudes'], session['latitudes'])
+        self.select_objects(*(n for n, s in zip(nodes, session['selected']) if s))
+        # scroll back to the saved visible area (the pyQt version saves its
+        # zoom and center instead), and draw the shapes it reveals
+        if session['frontend'] == 'tkinter':
+            self.configure(scrollregion=self.bbox('all'))
+            x, y = session['view']
+            self.scan_mark(0, 0)
+            self.scan_dragto(int(self.canvasx(0) - x), int(self.canvasy(0) - y), gain=1)
+        self.draw_shapes()
+
     def draw_water(self):
         if self.proj == 'Mercator':
             x0, y0 = self.to_canvas_coordinates(-180, 84)
             x1, y1 = self.to_canvas_coordinates(180, -84)
-            self.water_id = self.create_rectangle(x1, y1, x0, y0,
-                        outline='black', fill='deep sky blue', tags=('water',))
+            kind, coords = 'rectangle', (x1, y1, x0, y0)
         else:
             cx, cy = self.to_canvas_coordinates(28, 47)
             R = 6378000*self.ratio
-            self.water_id = self.create_oval(cx - R, cy - R, cx + R, cy + R,
-                        outline='black', fill='deep sky blue', tags=('water',))
+            kind, coords = 'oval', (cx - R, cy - R, cx + R, cy + R)
+        # the water item is moved if it has the right type
+        if self.water_id and self.type(self.water_id) == kind:
+            self.coords(self.water_id, *coords)
+            return
+        self.delete('water')
+        create = self.create_rectangle if kind == 'rectangle' else self.create_oval
+        self.water_id = create(*coords, outline='black', fill='deep sky blue', 
+                        state='hidden' if self.backdrop_shown else 'normal', 
+                        tags=('water',))
 
     def change_projection(self):
         self.proj = self.controller.menu.projection_list.get()
         self.draw_map()
 
     def redraw_nodes(self):
-        for node_id, node in self.node_id_to_node.items():
-            cx, cy = self.to_canvas_coordinates(node.longitude, node.latitude)
-            node.x, node.y = cx, cy
-            self.coords(node_id, cx, cy)
-            self.update_node_label(node)
-            self.tag_raise(node_id)
-            self.tag_raise(node.label_id)
+        self.schedule('nodes', self.redraw_nodes_task(), priority=1)
+
+    def redraw_nodes_task(self, size=1000):
+        # the nodes of a slice are projected at once, with the zoom level
+        # of the frame: the user may zoom between two slices
+        for nodes in slices(list(self.node_id_to_node.values()), size):
+            nodes = [node for node in nodes if self.node_id_to_node.get(node.id) is node]
+            xs, ys = self.to_canvas_coordinates(
+                np.array([node.longitude for node in nodes], dtype=np.float64), 
+                np.array([node.latitude for node in nodes], dtype=np.float64)
+            )
+            for node, cx, cy in zip(nodes, np.ravel(xs).tolist(), np.ravel(ys).tolist()):
+                node.x, node.y = cx, cy
+                self.coords(node.id, cx, cy)
+            yield
+        self.tag_raise('node')
+        self.schedule_labels()
 
     @update_coordinates
     def zoomer(self, event, factor=None):
@@ -278,17 +1859,72 @@ class Map(tk.Canvas):
         self.ratio *= float(factor)
         self.offset = (self.offset[0]*factor + event.x*(1 - factor), 
                        self.offset[1]*factor + event.y*(1 - factor))
-        # we update all node's coordinates
+        # we update all node's coordinates: the geographical coordinates
+        # do not change, and the labels are updated once the zoom is over
         for node_id, node in self.node_id_to_node.items():
             node.x, node.y = self.coords(node_id)
-            self.update_node_label(node)
+        # the map is displayed as an image until the zoom is over
+        self.show_backdrop()
+        self.schedule_vector()
+        # zooming out may reveal shapes and nodes that are not drawn yet
+        self.viewport_changed()
 
     def update_node_label(self, node):
         node.longitude, node.latitude = self.to_geographical_coordinates(
                                                                 node.x, node.y)
-        label = '({:.5f}, {:.5f})'.format(node.longitude, node.latitude)
-        self.coords(node.label_id, node.x - 5, node.y + 30)
-        self.itemconfig(node.label_id, text=label)
+        # the label may not exist (virtualization)
+        if node.label_id:
+            label = '({:.5f}, {:.5f})'.format(node.longitude, node.latitude)
+            self.coords(node.label_id, node.x - 5, node.y + 30)
+            self.itemconfig(node.label_id, text=label)
+
+    def schedule_labels(self, delay=200):
+        if self.label_job:
+            self.after_cancel(self.label_job)
+        self.label_job = self.after(delay, self.update_labels)
+
+    def update_labels(self):
+        # labels are only displayed for the visible nodes, above a zoom 
+        # threshold, and when they do not overlap another label
+        self.label_job = None
+        nodes = []
+        if not self.heatmap and self.ratio >= label_ratio:
+            x0, y0 = self.canvasx(0), self.canvasy(0)
+            x1, y1 = x0 + self.winfo_width(), y0 + self.winfo_height()
+            nodes = [
+                self.node_id_to_node[id] 
+                for id in self.find_overlapping(x0, y0, x1, y1)
+                if id in self.node_id_to_node
+            ]
+            # the labels of the selected nodes have the highest priority
+            nodes.sort(key=lambda node: node not in self.selected_nodes)
+            xs = np.array([node.x for node in nodes])
+            ys = np.array([node.y for node in nodes])
+            displayed = declutter(xs - 70, ys + 24, xs + 60, ys + 36)
+            nodes = [node for node, d in zip(nodes, displayed) if d]
+        labeled = set(nodes)
+        self.delete_labels([n for n in self.node_id_to_node.values() 
+                              if n.label_id and n not in labeled])
+        for node in nodes:
+            label = '({:.5f}, {:.5f})'.format(node.longitude, node.latitude)
+            if not node.label_id and self.free_labels:
+                node.label_id = self.free_labels.pop()
+                self.itemconfig(node.label_id, state='normal', tags=('label',))
+            if node.label_id:
+                self.coords(node.label_id, node.x - 5, node.y + 30)
+                self.itemconfig(node.label_id, text=label)
+            else:
+                node.label_id = self.create_text(
+                    node.x - 5, node.y + 30, text=label, tags=('label',)
+                )
+
+    def delete_labels(self, nodes):
+        # the label items are returned to the pool
+        for node in nodes:
+            if node.label_id:
+                self.itemconfig(node.label_id, state='hidden', tags=('pool',))
+                self.free_labels.append(node.label_id)
+                node.label_id = None
 
     @update_coordinates            
     def drag_and_drop(self, event):
@@ -296,17 +1932,47 @@ class Map(tk.Canvas):
             self.create_object(event.x, event.y)
             controller.drag_and_drop = False
 
+    def create_node_item(self, x, y):
+        # a node item from the pool, or a new one
+        if not self.free_nodes:
+            return self.create_image(x, y, image=self.controller.node_image, tags=('node',))
+        id = self.free_nodes.pop()
+        self.coords(id, x, y)
+        self.itemconfig(id, image=self.controller.node_image, state='normal', tags=('node',))
+        return id
+
     def create_object(self, x, y):
         # create the node's image
-        id = self.create_image(x, y,image = controller.node_image, tags = ('node',))
-        # create the node's label
-        label_id = self.create_text(x - 5, y + 30)
-        # create the node object
-        node = PSF_Object(id, label_id, x, y)
-        # update the value of its label
+        id = self.create_node_item(x, y)
+        # create the node object (its label is created by update_labels)
+        node = PSF_Object(id, None, x, y)
+        # compute its geographical coordinates
         self.update_node_label(node)
+        self.schedule_labels()
         # store the node in the (node ID -> node) dictionnary
         self.node_id_to_node[id] = node
+        # and in the node database
+        if self.node_store:
+            store_id ,= self.node_store.insert([node.longitude], [node.latitude])
+            node.store_id = int(store_id)
+            self.store_id_to_node[node.store_id] = node
+
+    def create_nodes(self, longitudes, latitudes):
+        # bulk creation: all nodes are projected at once, and their labels
+        # are created by update_labels
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        xs, ys = self.to_canvas_coordinates(longitudes, latitudes)
+        nodes = []
+        for x, y, lon, lat in zip(xs.tolist(), ys.tolist(), 
+                                  longitudes.tolist(), latitudes.tolist()):
+            id = self.create_node_item(x, y)
+            node = PSF_Object(id, None, x, y)
+            node.longitude, node.latitude = lon, lat
+            self.node_id_to_node[id] = node
+            nodes.append(node)
+        self.schedule_labels()
+        return nodes
 
     @update_coordinates
     def find_closest_node(self, event):
@@ -369,6 +2035,10 @@ class Map(tk.Canvas):
 
     @update_coordinates
     def end_point_select_nodes(self, event):
+        # the nodes may have been moved: we save their new position
+        # and update the labels
+        self.save_node_positions(self.selected_nodes)
+        self.schedule_labels()
         if self.start_position != [None]*2:
             # delete the temporary lines
             self.delete(self.temp_rectangle)
@@ -395,6 +2065,8 @@ class Map(tk.Canvas):
             self.coords(selected_node.id, selected_node.x, selected_node.y)
             # update the label
             self.update_node_label(selected_node)
+        # update the links of the selected nodes
+        self.move_links(self.selected_nodes)
 
     def import_nodes(self):
         filepath = filedialog.askopenfilenames(filetypes = (('xls files','*.xls'),))
@@ -408,9 +2080,63 @@ class Map(tk.Canvas):
         # if the sheet cannot be found, there's nothing to import
         except xlrd.biffh.XLRDError:
             warnings.warn('the excel file is empty: import failed')
-        for row_index in range(1, sheet.nrows):
-            x, y = self.to_canvas_coordinates(*sheet.row_values(row_index))
-            self.create_object(x, y)
+            return
+        # the first row contains the column names
+        longitudes, latitudes = sheet.col_values(0, 1), sheet.col_values(1, 1)
+        # with a node database, the nodes are only displayed if visible
+        if self.node_store:
+            self.node_store.insert(longitudes, latitudes)
+            self.page_nodes()
+            self.update_heatmap_points()
+        else:
+            # the nodes are created over several frames
+            self.schedule(('import', next(self.task_ids)), 
+                        self.import_nodes_task(longitudes, latitudes), priority=2)
+
+    def import_nodes_task(self, longitudes, latitudes, size=200):
+        for start in range(0, len(longitudes), size):
+            nodes = self.create_nodes(
+                longitudes[start:start + size], 
+                latitudes[start:start + size]
+            )
+            if self.heatmap:
+                for node in nodes:
+                    self.itemconfig(node.id, state='hidden')
+            yield
+        self.update_heatmap_points()
+
+    def import_links(self):
+        filepath = filedialog.askopenfilenames(filetypes = (('xls files','*.xls'),))
+        if not filepath:
+            return
+        else:
+            filepath ,= filepath
+        book = xlrd.open_workbook(filepath)
+        try:
+            sheet = book.sheet_by_index(0)
+        except xlrd.biffh.XLRDError:
+            warnings.warn('the excel file is empty: import failed')
+            return
+        # each row contains the longitude and latitude of the source and 
+        # the destination of a link: a node is created for each endpoint
+        rows = [tuple(sheet.row_values(index)[:4]) for index in range(1, sheet.nrows)]
+        endpoints = list(dict.fromkeys(point for row in rows 
+                                             for point in (row[:2], row[2:])))
+        if not endpoints:
+            return
+        # with a node database, the nodes and links are only displayed if 
+        # visible
+        if self.node_store:
+            ids = dict(zip(endpoints, self.node_store.insert(*zip(*endpoints)).tolist()))
+            self.node_store.add_links(
+                [ids[row[:2]] for row in rows], 
+                [ids[row[2:]] for row in rows]
+            )
+            self.page_nodes()
+            self.update_heatmap_points()
+            return
+        nodes = dict(zip(endpoints, self.create_nodes(*zip(*endpoints))))
+        self.create_links([(nodes[row[:2]], nodes[row[2:]]) for row in rows])
 
 if str.__eq__(__name__, '__main__'):
     controller = Controller(path_app)